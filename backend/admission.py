@@ -0,0 +1,199 @@
+'''
+Concurrency control in front of POST /chat/, /chat/stream and /chat/batch.
+
+Without it a double-submit or a retrying client runs two graph executions on the same thread_id
+checkpoint at once (twice the LLM spend, interleaved `messages` updates), and a traffic burst
+queues without limit in the event loop until every request is slow.
+
+ChatGate.run puts every request through three steps :
+
+1. coalesce  : an identical request already in flight (same session, normalized query, web search
+               toggle and retrieval filter, see chat_key) is joined : the caller gets the same
+               response, without a second graph run or an admission slot
+2. admission : at most `max_inflight` requests are admitted at once (running, or waiting for their
+               session). Past that, up to `max_queued` wait at most `queue_timeout` seconds for a
+               slot, in arrival order. Any more, or a wait that times out, raises ChatOverloaded
+               (429 with Retry-After) right away : under overload the latency of the admitted
+               requests stays bounded instead of growing with the backlog
+3. session   : the requests of one session run one at a time, in arrival order, so every turn
+               sees the checkpoint the previous one wrote. At most `max_session_queue` may wait
+               behind the running one.
+
+/chat/stream and /chat/batch go through ChatGate.admit instead (steps 2 and 3, no coalescing : a
+stream can't be shared). A stream holds its slot and its session until the response ends, a batch
+holds one slot per graph run it keeps in flight (max_concurrency), so CHAT_MAX_INFLIGHT bounds the
+graph runs of all three endpoints together.
+
+The limits are per worker process. All state lives in the event loop thread (no locks), the waits
+are plain futures of the running loop.
+'''
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from config import CHAT_MAX_INFLIGHT, CHAT_MAX_QUEUED, CHAT_QUEUE_TIMEOUT_SECONDS, CHAT_MAX_SESSION_QUEUE
+from embedding_cache import normalize_text
+from vectorstore import filter_scope
+from telemetry import metrics
+
+ChatKey = Tuple[str, str, bool, str]
+
+
+def chat_key(session_id: str, query: str, web_search_enabled: bool, retrieval_filter: Optional[dict]) -> ChatKey:
+    return session_id, normalize_text(query).lower(), web_search_enabled, filter_scope(retrieval_filter)
+
+
+class ChatOverloaded(Exception):
+    '''The request was not admitted, main.py answers 429.'''
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Slots:
+    '''
+    FIFO counting semaphore whose wait queue is bounded : acquire reports "full" instead of queueing.
+    A request may take several slots at once (`n`), granted together, in arrival order.
+    '''
+
+    def __init__(self, capacity: int, max_waiting: int):
+        self.capacity = capacity
+        self.max_waiting = max_waiting
+        self.active = 0
+        self._waiters: Deque[Tuple[asyncio.Future, int]] = deque()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def idle(self) -> bool:
+        return not self.active and not self._waiters
+
+    async def acquire(self, timeout: Optional[float], n: int = 1) -> Optional[str]:
+        """None once `n` slots are held, else why not : "full" (wait queue full) or "timeout"."""
+        if self.active + n <= self.capacity and not self._waiters:
+            self.active += n
+            return None
+        if len(self._waiters) >= self.max_waiting:
+            return "full"
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append((waiter, n))
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except asyncio.TimeoutError:
+            if not waiter.done():
+                self._leave(waiter, n)
+                return "timeout"
+        except BaseException: # cancelled while waiting : give back slots handed over meanwhile
+            if waiter.done():
+                self.release(n)
+            else:
+                self._leave(waiter, n)
+            raise
+        return None
+
+    def _leave(self, waiter: asyncio.Future, n: int):
+        self._waiters.remove((waiter, n))
+        self._wake() # a large request leaving the head may unblock smaller ones behind it
+
+    def _wake(self):
+        while self._waiters and self.active + self._waiters[0][1] <= self.capacity:
+            waiter, n = self._waiters.popleft()
+            self.active += n # the slots go straight to the next waiter
+            waiter.set_result(None)
+
+    def release(self, n: int = 1):
+        self.active -= n
+        self._wake()
+
+
+class ChatGate:
+
+    def __init__(self, max_inflight: int = CHAT_MAX_INFLIGHT, max_queued: int = CHAT_MAX_QUEUED,
+                 queue_timeout: float = CHAT_QUEUE_TIMEOUT_SECONDS, max_session_queue: int = CHAT_MAX_SESSION_QUEUE):
+        self.queue_timeout = queue_timeout
+        self.max_session_queue = max_session_queue
+        self._slots = _Slots(max_inflight, max_queued)
+        self._sessions: Dict[str, _Slots] = {}
+        self._inflight: Dict[ChatKey, asyncio.Task] = {}
+        self._stats = {"admitted": 0, "coalesced": 0, "rejected": 0, "timed_out": 0, "session_rejected": 0}
+
+    def _count(self, outcome: str):
+        self._stats[outcome] += 1
+        metrics.observe_admission(outcome)
+
+    async def admit(self, session_id: Optional[str], slots: int = 1) -> Callable[[], None]:
+        '''
+        Steps 2 and 3 of the module docstring : takes `slots` admission slots (at most max_inflight)
+        and, with a `session_id`, that session's turn. Returns the function releasing both, which may
+        be called more than once. Raises ChatOverloaded when not admitted.
+        '''
+        slots = min(slots, self._slots.capacity)
+        refused = await self._slots.acquire(self.queue_timeout, slots)
+        if refused:
+            self._count("rejected" if refused == "full" else "timed_out")
+            raise ChatOverloaded("Too many chat requests in flight, retry shortly.")
+        session = None if session_id is None else self._sessions.setdefault(session_id, _Slots(1, self.max_session_queue))
+        try:
+            if session is not None and await session.acquire(None):
+                self._count("session_rejected")
+                raise ChatOverloaded(f"Session '{session_id}' already has {self.max_session_queue} requests waiting.")
+        except BaseException:
+            self._leave_session(session_id, session)
+            self._slots.release(slots)
+            raise
+        self._count("admitted")
+        released = False
+
+        def release():
+            nonlocal released
+            if released:
+                return
+            released = True
+            if session is not None:
+                session.release()
+                self._leave_session(session_id, session)
+            self._slots.release(slots)
+        return release
+
+    def _leave_session(self, session_id: Optional[str], session: Optional[_Slots]):
+        if session is not None and session.idle and self._sessions.get(session_id) is session:
+            del self._sessions[session_id]
+
+    async def _admit_and_run(self, session_id: str, work: Callable[[], Awaitable[Any]]) -> Any:
+        release = await self.admit(session_id)
+        try:
+            return await work()
+        finally:
+            release()
+
+    def _forget(self, key: ChatKey, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception() # retrieved here, the callers may all have gone
+
+    async def run(self, key: ChatKey, work: Callable[[], Awaitable[Any]]) -> Tuple[Any, str]:
+        '''
+        Runs `work()` for the request `key` (chat_key) under the gate, see the module docstring.
+        Returns (result, "admitted" or "coalesced"), raises ChatOverloaded when not admitted.
+        The run is a task of its own : a caller that disconnects doesn't cancel it for the others.
+        '''
+        task = self._inflight.get(key)
+        if task is not None:
+            self._count("coalesced")
+            return await asyncio.shield(task), "coalesced"
+        task = asyncio.ensure_future(self._admit_and_run(key[0], work))
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task), "admitted"
+
+    def stats(self) -> Dict[str, int]:
+        return {**self._stats, "inflight": self._slots.active, "queued": self._slots.waiting,
+                "sessions": len(self._sessions), "coalescing": len(self._inflight)}
+
+
+# process-wide gate used by POST /chat/, /chat/stream and /chat/batch
+chat_gate = ChatGate()
@@ -2,53 +2,139 @@
 # import dependencies
 # Refer assets directory for more details on how to use LangGraph
 import os
+import time
+import asyncio
 from config import GROQ_API_KEY, PINECONE_API_KEY, TAVILY_API_KEY
-from langchain_groq import ChatGroq # pip install langchain-groq
-from typing import TypedDict, List, Optional,Literal
-from langchain_core.messages import BaseMessage,HumanMessage,AIMessage # Base Message can be Human Message, System Message, AI Message etc.
+import re
+from typing import TypedDict, List, Optional,Literal, Annotated, Tuple
+from langchain_core.messages import BaseMessage,HumanMessage,AIMessage,RemoveMessage # Base Message can be Human Message, System Message, AI Message etc.
+from langchain_core.messages.utils import trim_messages, count_tokens_approximately
+from langgraph.graph.message import add_messages
 from pydantic import BaseModel,Field
 from langgraph.graph import StateGraph, END  # pip install langgraph
-from langgraph.checkpoint.memory import MemorySaver
-from langchain_tavily import TavilySearch   # pip install langchain-tavily
-from langchain_core.tools import tool
-from langchain_core.runnables import RunnableConfig 
-from vectorstore import get_retriever, add_document # Importing the retriever function from vectorstore.py
-
-os.environ["TAVILY_API_KEY"] = TAVILY_API_KEY
-tavily = TavilySearch(max_results=3, topic="general")
+from checkpointer import checkpointer
+from langchain_core.tools import StructuredTool
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from vectorstore import get_vector_store, hybrid_search, ahybrid_search, add_document, filter_scope # retrieval helpers from vectorstore.py
+from sufficiency import sufficiency_gate, GateDecision
+from context_packing import pack_context
+from semantic_cache import semantic_cache
+from web_cache import web_cache, web_cache_key
+from config import (SEMANTIC_CACHE_ENABLED, SPECULATIVE_RETRIEVAL, SPECULATIVE_WEB_SEARCH, HISTORY_MAX_TOKENS,
+                    QUERY_REWRITE_ENABLED, WEB_CACHE_TTL_SECONDS)
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from fast_router import fast_router, FastDecision
+from telemetry import log, record, traced, atraced, token_usage
+from clients import lazy_client, require_key
+
+def _build_tavily():
+    from langchain_tavily import TavilySearch   # pip install langchain-tavily
+    os.environ["TAVILY_API_KEY"] = require_key("TAVILY_API_KEY", TAVILY_API_KEY)
+    return TavilySearch(max_results=3, topic="general")
+
+# clients are built on first use (or by the startup warm-up), see clients.py
+tavily = lazy_client("tavily", _build_tavily)
 
 '''
 Defining the tools : web_search_tool and rag_search_tool (read about tools in tools.txt)
 '''
 
-@tool
-def web_search_tool(query: str) -> str:
-    """Up-to-date web info via Tavily"""
+def _format_web_results(result) -> str:
+    """Formats the raw Tavily response into a readable string."""
+    if isinstance(result, dict) and 'results' in result:
+        formatted_results = []
+        for item in result['results']:
+            title = item.get('title', 'No title')
+            content = item.get('content', 'No content')
+            url = item.get('url', '')
+            formatted_results.append(f"Title: {title}\nContent: {content}\nURL: {url}")
+        return "\n\n".join(formatted_results) if formatted_results else "No results found"
+    else:
+        return str(result)
+
+def _tavily_search(query: str) -> str:
     try:
         result = tavily.invoke({"query": query})
-        if isinstance(result, dict) and 'results' in result:
-            formatted_results = []
-            for item in result['results']:
-                title = item.get('title', 'No title')
-                content = item.get('content', 'No content')
-                url = item.get('url', '')
-                formatted_results.append(f"Title: {title}\nContent: {content}\nURL: {url}")
-            return "\n\n".join(formatted_results) if formatted_results else "No results found"
-        else:
-            return str(result)
+        return _format_web_results(result)
     except Exception as e:
         return f"WEB_ERROR::{e}"
 
-@tool
-def rag_search_tool(query: str) -> str:
-    """Top-K chunks from KB (empty string if none)"""
+async def _atavily_search(query: str) -> str:
+    try:
+        result = await tavily.ainvoke({"query": query})
+        return _format_web_results(result)
+    except Exception as e:
+        return f"WEB_ERROR::{e}"
+
+def _web_search(query: str) -> str:
+    """Up-to-date web info via Tavily"""
+    # cached for a few minutes, identical searches in flight are coalesced (web_cache.py)
+    key = web_cache_key(query, tavily.max_results, tavily.topic)
+    snippets, outcome = web_cache.get(key, lambda: _tavily_search(query))
+    log(f"Web search cache: {outcome}")
+    record(web_cache=outcome)
+    return snippets
+
+async def _aweb_search(query: str) -> str:
+    """Async variant of _web_search, does not block the event loop."""
+    key = web_cache_key(query, tavily.max_results, tavily.topic)
+    snippets, outcome = await web_cache.aget(key, lambda: _atavily_search(query))
+    log(f"Web search cache: {outcome}")
+    record(web_cache=outcome)
+    return snippets
+
+def _join_chunks(chunks: List[dict]) -> str:
+    return "\n\n".join(c["content"] for c in chunks)
+
+def _rag_search(query: str, filter: Optional[dict] = None) -> List[dict] | str:
+    """Top-K scored chunks from KB (empty list if none), restricted to the chunks matching the metadata `filter`"""
+    try:
+        start = time.perf_counter()
+        # dense + BM25 fused (vectorstore.hybrid_search), k increased from 3 to 5
+        chunks = hybrid_search(query, k=5, filter=filter)
+        log(f"RAG retrieval took {(time.perf_counter() - start) * 1000:.1f} ms ({len(chunks)} chunks)")
+        record(retrieved_chunks=len(chunks), retrieval_ms=round((time.perf_counter() - start) * 1000, 2))
+        return chunks
+    except Exception as e:
+        return f"RAG_ERROR::{e}"
+
+async def _arag_search(query: str, filter: Optional[dict] = None) -> List[dict] | str:
+    """Async variant of _rag_search, does not block the event loop."""
     try:
-        retriever_instance = get_retriever() # import get_retriever from vectorstore.py
-        docs = retriever_instance.invoke(query, k=5) # Increased from 3 to 5
-        return "\n\n".join(d.page_content for d in docs) if docs else ""
+        start = time.perf_counter()
+        # the first call builds the vector store (checks the Pinecone index), keep it off the event loop
+        await asyncio.to_thread(get_vector_store)
+        chunks = await ahybrid_search(query, k=5, filter=filter)
+        log(f"RAG retrieval took {(time.perf_counter() - start) * 1000:.1f} ms ({len(chunks)} chunks)")
+        record(retrieved_chunks=len(chunks), retrieval_ms=round((time.perf_counter() - start) * 1000, 2))
+        return chunks
     except Exception as e:
         return f"RAG_ERROR::{e}"
 
+# Each tool carries a sync and an async implementation, so both .invoke and .ainvoke work
+web_search_tool = StructuredTool.from_function(
+    func=_web_search,
+    coroutine=_aweb_search,
+    name="web_search_tool",
+    description="Up-to-date web info via Tavily",
+)
+
+rag_search_tool = StructuredTool.from_function(
+    func=_rag_search,
+    coroutine=_arag_search,
+    name="rag_search_tool",
+    description="Top-K scored chunks from KB (empty list if none)",
+)
+
+def _retrieval_filter(config: RunnableConfig) -> Optional[dict]:
+    """The request's metadata filter / namespace (vectorstore.retrieval_filter), None = whole index."""
+    return config.get("configurable", {}).get("retrieval_filter")
+
+def _tool_input(target: str, query: str, config: RunnableConfig):
+    """Input of rag_search_tool (query + metadata filter) or web_search_tool (query)."""
+    return {"query": query, "filter": _retrieval_filter(config)} if target == "rag" else query
+
 
 
 # Pydantic schemas for structured output
@@ -59,16 +145,26 @@ class RouteDecision(BaseModel):
 class RagJudge(BaseModel):
     sufficient:bool = Field(... , description = "True if retrieved information is sufficient to answer the user's query\
         False otherwise.")
+
+class StandaloneQuery(BaseModel):
+    query : str = Field(..., description = "The latest user question rewritten to be understandable without the conversation")
     
 
 # Define LLM instances with structured schemas
 
-os.environ['GROQ_API_KEY'] = GROQ_API_KEY
+def _groq(model: str, temperature: float, schema=None):
+    from langchain_groq import ChatGroq # pip install langchain-groq
+    os.environ['GROQ_API_KEY'] = require_key("GROQ_API_KEY", GROQ_API_KEY)
+    llm = ChatGroq(model=model, temperature=temperature, callbacks=[token_usage])
+    return llm.with_structured_output(schema) if schema else llm
 
 # align this with pydantic schema
-router_llm = ChatGroq(model="llama3-70b-8192", temperature = 0).with_structured_output(RouteDecision)
-judge_llm = ChatGroq(model="llama3-70b-8192", temperature=0).with_structured_output(RagJudge)
-answer_llm = ChatGroq(model="llama3-70b-8192", temperature=0.7)
+router_llm = lazy_client("router_llm", lambda: _groq("llama3-70b-8192", 0, RouteDecision))
+judge_llm = lazy_client("judge_llm", lambda: _groq("llama3-70b-8192", 0, RagJudge))
+answer_llm = lazy_client("answer_llm", lambda: _groq("llama3-70b-8192", 0.7))
+# query rewriting / history summaries are short, simple tasks : a smaller, faster model is enough
+rewrite_llm = lazy_client("rewrite_llm", lambda: _groq("llama3-8b-8192", 0, StandaloneQuery))
+summary_llm = lazy_client("summary_llm", lambda: _groq("llama3-8b-8192", 0))
 
     
 
@@ -76,13 +172,218 @@ answer_llm = ChatGroq(model="llama3-70b-8192", temperature=0.7)
    
 class AgentState(TypedDict,total=False):
     
-    messages : List[BaseMessage] # Current conversation history (to get the latest user query)
-    route : Literal["rag","web","answer","end"]
+    messages : Annotated[List[BaseMessage], add_messages] # Conversation history : a token-bounded window, older turns live in `summary`
+    query : str # latest user question rewritten as a standalone query by contextualize_node, used by every node
+    summary : str # rolling summary of the turns that fell out of the message window
+    query_rewrite : dict # contextualize_node trace : original / rewritten query, messages summarized, window tokens
+    route : Literal["rag","web","answer","end","router"]
     rag:str # output from rag node
+    rag_chunks : List[dict] # the scored chunks behind `rag` (content, metadata with start_index), packed by answer_node
     web:str # information from web search
     web_search_enabled : bool # User's preference for web search (True/False)
+    cache_info : dict # semantic cache lookup result (hit, similarity, kb_version, retrieval scope, metrics)
+    prefetched_rag : Optional[List[dict] | str] # speculative mode : retrieval started alongside the router, consumed by rag_node
+    prefetched_web : Optional[str] # speculative mode : web search started alongside the router, consumed by web_node
+    web_cache : dict # web search cache counters (hits, stale hits, coalesced searches, searches avoided)
+    speculation : dict # speculative mode : what was prefetched, used or discarded, and the time saved
+    rag_gate : dict # how rag sufficiency was decided (score / cross_encoder / judge), top score, judge calls skipped
+    telemetry : dict # span of the node that produced this update : wall time, LLM tokens / cost, retrieval size, cache hits
+    context_packing : dict # answer_node trace : prompt context tokens before / after packing, chunks merged, duplicates dropped
     
 
+def _latest_human(messages: List[BaseMessage]) -> str:
+    return next((m.content for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+
+def _current_query(state: AgentState) -> str:
+    """The standalone query set by contextualize_node, falls back to the latest HumanMessage."""
+    return state.get("query") or _latest_human(state["messages"])
+
+
+# Node -1 : contextualize, the graph entry
+
+'''
+CONTEXTUALIZE NODE
+--------------------------------------------------------------------------------
+PURPOSE:
+Keeps the conversation bounded and turns follow-ups ("and its side effects?") into standalone queries
+before anything is retrieved or cached.
+
+CORE LOGIC / ACTIONS:
+1. Keeps the most recent messages that fit in HISTORY_MAX_TOKENS (starting on a user message).
+   Older messages are folded into the rolling `summary` by `summary_llm` and removed from state.
+2. If there is earlier conversation and the question looks like a follow-up (references such as
+   "it", "they", "that", or very short), `rewrite_llm` rewrites it into a standalone query.
+   First turns, self-contained questions and small talk skip the LLM call.
+3. Stores the result in `query`, so the other nodes stop rescanning `messages`.
+4. Clears the per-turn `rag` / `web` context left over from the previous turn.
+
+OUTPUTS / UPDATES to AgentState:
+- `messages` (older ones removed), `summary`, `query`, `query_rewrite`, `rag`, `web`.
+
+NEXT POSSIBLE NODES:
+- semantic_cache (always)
+--------------------------------------------------------------------------------
+'''
+
+# words that only make sense with the previous turns
+_FOLLOW_UP_PATTERN = re.compile(
+    r"\b(it|its|it's|they|them|their|this|that|these|those|he|she|him|his|her|there|former|latter|"
+    r"above|same|also|else|more|another|other|again|what about|how about|and)\b", re.I)
+
+def _needs_rewrite(query: str, has_history: bool) -> bool:
+    if not QUERY_REWRITE_ENABLED or not has_history or fast_router.match_rules(query):
+        return False
+    return len(query.split()) < 4 or bool(_FOLLOW_UP_PATTERN.search(query))
+
+def _split_history(messages: List[BaseMessage]):
+    """(older messages to summarize, recent window to keep)"""
+    window = trim_messages(messages, max_tokens=HISTORY_MAX_TOKENS, token_counter=count_tokens_approximately,
+                           strategy="last", start_on="human", allow_partial=False)
+    if not window: # the latest message alone is over the budget, keep it anyway
+        window = messages[-1:]
+    kept = {m.id for m in window}
+    return [m for m in messages if m.id not in kept], window
+
+def _build_summary_messages(summary: str, older: List[BaseMessage]) -> list:
+    transcript = "\n".join(f"{'User' if isinstance(m, HumanMessage) else 'Assistant'}: {m.content}" for m in older)
+    return [
+        ("system", "You maintain a running summary of a conversation between a user and an assistant. "
+                   "Merge the new messages into the existing summary. Keep names, topics and facts the user may "
+                   "refer to later. Reply with the updated summary only, at most 150 words."),
+        ("user", f"Existing summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}")
+    ]
+
+def _build_rewrite_messages(query: str, summary: str, window: List[BaseMessage]) -> list:
+    transcript = "\n".join(f"{'User' if isinstance(m, HumanMessage) else 'Assistant'}: {m.content}" for m in window[:-1])
+    return [
+        ("system", "Rewrite the user's latest question into a standalone question that can be understood "
+                   "without the conversation, e.g. replace pronouns with what they refer to. "
+                   "Do not answer it. If it is already standalone, return it unchanged."
+                   "\n\nExample: Conversation: 'User: What is metformin?' Latest: 'and its side effects?' "
+                   "-> 'What are the side effects of metformin?'"),
+        ("user", f"Conversation summary: {summary or '(none)'}\n\nRecent conversation:\n{transcript}\n\n"
+                 f"Latest question: {query}")
+    ]
+
+def _apply_contextualize(state: AgentState, older: List[BaseMessage], window: List[BaseMessage],
+                         summary: str, query: str, rewritten: str) -> AgentState:
+    if rewritten != query:
+        log(f"Rewrote follow-up '{query}' -> '{rewritten}'")
+    log("--- Exiting contextualize_node ---")
+    return {
+        "messages": [RemoveMessage(id=m.id) for m in older],
+        "summary": summary,
+        "query": rewritten,
+        "rag": "", # per-turn context, don't let the previous turn's retrieval leak into this answer
+        "rag_chunks": [],
+        "web": "",
+        "query_rewrite": {"original": query, "rewritten": rewritten, "summarized_messages": len(older),
+                          "window_tokens": count_tokens_approximately(window)},
+    }
+
+def contextualize_node(state: AgentState) -> AgentState:
+    log("\n--- Entering contextualize_node ---")
+    older, window = _split_history(state["messages"])
+    summary = state.get("summary", "")
+    if older:
+        try:
+            summary = summary_llm.invoke(_build_summary_messages(summary, older)).content
+        except Exception as e: # keep the old summary, the window is still bounded
+            log(f"History summary failed: {e}")
+    query = _latest_human(window)
+    rewritten = query
+    if _needs_rewrite(query, len(window) > 1 or bool(summary)):
+        try:
+            rewritten = rewrite_llm.invoke(_build_rewrite_messages(query, summary, window)).query or query
+        except Exception as e:
+            log(f"Query rewrite failed, using the original query: {e}")
+    return _apply_contextualize(state, older, window, summary, query, rewritten)
+
+async def acontextualize_node(state: AgentState) -> AgentState:
+    """Async variant of contextualize_node."""
+    log("\n--- Entering acontextualize_node ---")
+    older, window = _split_history(state["messages"])
+    summary = state.get("summary", "")
+    if older:
+        try:
+            summary = (await summary_llm.ainvoke(_build_summary_messages(summary, older))).content
+        except Exception as e:
+            log(f"History summary failed: {e}")
+    query = _latest_human(window)
+    rewritten = query
+    if _needs_rewrite(query, len(window) > 1 or bool(summary)):
+        try:
+            rewritten = (await rewrite_llm.ainvoke(_build_rewrite_messages(query, summary, window))).query or query
+        except Exception as e:
+            log(f"Query rewrite failed, using the original query: {e}")
+    return _apply_contextualize(state, older, window, summary, query, rewritten)
+
+
+# Node 0 : semantic cache, runs before the router
+
+'''
+SEMANTIC CACHE NODE
+--------------------------------------------------------------------------------
+PURPOSE:
+Answers repeated (or near-identical) questions from the semantic cache, skipping the router,
+RAG lookup, judge and answer LLM calls. See semantic_cache.py.
+
+OUTPUTS / UPDATES to AgentState:
+- `route`: 'end' on a cache hit (the cached answer is appended to `messages`), 'router' otherwise.
+- `cache_info`: hit / similarity / kb_version plus the cache's running hit-rate metrics.
+
+NEXT POSSIBLE NODES:
+- END (cache hit)
+- router (cache miss)
+--------------------------------------------------------------------------------
+'''
+
+def _apply_cache_lookup(state: AgentState, answer: str | None, similarity: float,
+                        web_search_enabled: bool, kb_version: str, scope: str) -> AgentState:
+    """Builds the cache node output from the lookup result."""
+    cache_info = {"hit": answer is not None, "similarity": round(similarity, 4),
+                  "kb_version": kb_version, "scope": scope, **semantic_cache.stats()}
+    record(semantic_cache="hit" if answer is not None else "miss")
+    if answer is not None:
+        log(f"Semantic cache hit (similarity {similarity:.3f}), skipping the agent.")
+        return {**state, "route": "end", "cache_info": cache_info,
+                "web_search_enabled": web_search_enabled,
+                "messages": state["messages"] + [AIMessage(content=answer)]}
+    log(f"Semantic cache miss (best similarity {similarity:.3f}).")
+    return {**state, "route": "router", "cache_info": cache_info, "web_search_enabled": web_search_enabled}
+
+def cache_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    log("\n--- Entering cache_node ---")
+    query = _current_query(state)
+    web_search_enabled = config.get("configurable", {}).get("web_search_enabled", True)
+    kb_version = semantic_cache.kb_version()
+    scope = filter_scope(_retrieval_filter(config)) # answers are only shared between requests searching the same chunks
+    if not SEMANTIC_CACHE_ENABLED:
+        return {**state, "route": "router", "cache_info": {"hit": False, "kb_version": kb_version}}
+    try:
+        answer, similarity = semantic_cache.lookup(query, web_search_enabled, kb_version, scope)
+    except Exception as e: # the cache must never take the agent down
+        log(f"Semantic cache lookup failed: {e}")
+        answer, similarity = None, 0.0
+    return _apply_cache_lookup(state, answer, similarity, web_search_enabled, kb_version, scope)
+
+async def acache_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    """Async variant of cache_node."""
+    log("\n--- Entering acache_node ---")
+    query = _current_query(state)
+    web_search_enabled = config.get("configurable", {}).get("web_search_enabled", True)
+    kb_version = await asyncio.to_thread(semantic_cache.kb_version)
+    scope = filter_scope(_retrieval_filter(config))
+    if not SEMANTIC_CACHE_ENABLED:
+        return {**state, "route": "router", "cache_info": {"hit": False, "kb_version": kb_version}}
+    try:
+        answer, similarity = await semantic_cache.alookup(query, web_search_enabled, kb_version, scope)
+    except Exception as e:
+        log(f"Semantic cache lookup failed: {e}")
+        answer, similarity = None, 0.0
+    return _apply_cache_lookup(state, answer, similarity, web_search_enabled, kb_version, scope)
+
+
 # Build the first Node (Refer ai agent workflow diagram in assets)
 
 
@@ -115,25 +416,9 @@ Next possible Nodes :
 
 # Define Node 1 : router (decision node) , every node returs updated AgentState
 
-def router_node(state: AgentState , config:RunnableConfig) -> AgentState:
-    print("Entering router_node ........")
-    '''
-    extract query ,when user gives the query, it is stored in the messages list : messages : List[BaseMessage] 
-    in this AgentState, Now we need to extract the message from AgentState messages list.
-    Now, the messags are stored as Base Messages, which can be HumanMessage, AIMessage, SystemMessage etc.
-    But we want the Human Message .
-    
-    '''
-    # the latest message will be stored in the last index of the messages list, reversed to get the latest message
-    # next line extracts the latest human message from the messages list
-    # if no human message is found, it will return None / Blank String
-    query = next((m.content for m in reversed(state["messages"]) if isinstance(m, HumanMessage)), "")
-    
-    # if the user has enabled web search , we will call the web search node
-    
-    web_search_enabled = config.get("configurable", {}).get("web_search_enabled", True) # <-- CHANGED LINE
-    print(f"Router received web search info : {web_search_enabled}")
-    
+@lru_cache(maxsize=2)
+def _router_system_prompt(web_search_enabled: bool) -> str:
+    """The router system prompt, built once per web_search_enabled value."""
     # Now we need the system prompt
     system_prompt = (
         "You are an intelligent routing agent designed to direct user queries to the most appropriate tool."
@@ -173,18 +458,30 @@ def router_node(state: AgentState , config:RunnableConfig) -> AgentState:
         "\n- User: 'Tell me about quantum computing.' -> Route: 'rag' (Foundational knowledge can be in KB. If KB is sparse, judge will route to web if enabled)."
         "\n- User: 'Hello there!' -> Route: 'end', reply='Hello! How can I assist you today?'"
     )
+    return system_prompt
 
+def _build_router_messages(query: str, web_search_enabled: bool) -> list:
+    """Builds the system + user messages for router_llm."""
     messages = [
-        ("system", system_prompt),
+        ("system", _router_system_prompt(web_search_enabled)),
         ("user", query)
     ] 
-    
-    
-    # we have system prompt and query , now we invoke the router_llm
-    # we are storing in pydantic schema
-    
-    result: RouteDecision = router_llm.invoke(messages)
-    
+    return messages
+
+def _fast_route_decision(fast: FastDecision) -> RouteDecision:
+    log(f"Fast router decided '{fast.route}' (tier={fast.tier}, confidence={fast.confidence:.3f}), skipping router_llm.")
+    return RouteDecision(route=fast.route, reply=fast.reply)
+
+def _record_router_tier(out: AgentState, fast: FastDecision | None) -> AgentState:
+    """Adds which router tier decided (rules / centroid / llm) to the node output, for tracing."""
+    out["router_tier"] = fast.tier if fast else "llm"
+    if fast:
+        out["router_confidence"] = round(fast.confidence, 4)
+    out["router_stats"] = fast_router.stats()
+    return out
+
+def _apply_router_decision(state: AgentState, result: RouteDecision, web_search_enabled: bool) -> AgentState:
+    """Applies the web-search override to the router's decision and builds the node output."""
     # What is the initial router decision ? 
     
     initial_router_decision = result.route # Store LLMs raw decision
@@ -199,10 +496,10 @@ def router_node(state: AgentState , config:RunnableConfig) -> AgentState:
         result.route = "rag" 
         # why the router has overriden ? 
         router_override_reason = "Web search disabled by user; redirected to RAG."
-        print(f"Router decision overridden: changed from 'web' to 'rag' because web search is disabled.")
+        log(f"Router decision overridden: changed from 'web' to 'rag' because web search is disabled.")
     
     # print router's final decision and reply
-    print(f"Router final decision: {result.route}, Reply (if 'end'): {result.reply}")
+    log(f"Router final decision: {result.route}, Reply (if 'end'): {result.reply}")
     
     # now , we need to return all the information , initialize 'out' dictionary and store info
     out = {
@@ -218,8 +515,156 @@ def router_node(state: AgentState , config:RunnableConfig) -> AgentState:
     if result.route == "end":
         out["messages"] = state["messages"] + [AIMessage(content=result.reply or "Hello!")]
     
-    print("--- Exiting router_node ---")
+    log("--- Exiting router_node ---")
     return out
+
+def router_node(state: AgentState , config:RunnableConfig) -> AgentState:
+    log("Entering router_node ........")
+    '''
+    extract query ,when user gives the query, it is stored in the messages list : messages : List[BaseMessage] 
+    in this AgentState, Now we need to extract the message from AgentState messages list.
+    Now, the messags are stored as Base Messages, which can be HumanMessage, AIMessage, SystemMessage etc.
+    But we want the Human Message .
+    
+    '''
+    # the latest message will be stored in the last index of the messages list, reversed to get the latest message
+    # next line extracts the latest human message from the messages list
+    # if no human message is found, it will return None / Blank String
+    query = _current_query(state)
+    
+    # if the user has enabled web search , we will call the web search node
+    
+    web_search_enabled = config.get("configurable", {}).get("web_search_enabled", True) # <-- CHANGED LINE
+    log(f"Router received web search info : {web_search_enabled}")
+    
+    # obvious queries (greetings, clear rag / web questions) are decided locally, see fast_router.py
+    fast = fast_router.classify(query)
+    if fast:
+        result = _fast_route_decision(fast)
+    else:
+        messages = _build_router_messages(query, web_search_enabled)
+        
+        # we have system prompt and query , now we invoke the router_llm
+        # we are storing in pydantic schema
+        
+        result: RouteDecision = router_llm.invoke(messages)
+    return _record_router_tier(_apply_router_decision(state, result, web_search_enabled), fast)
+
+async def arouter_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    """Async variant of router_node, awaits router_llm instead of blocking the event loop."""
+    log("Entering arouter_node ........")
+    query = _current_query(state)
+    web_search_enabled = config.get("configurable", {}).get("web_search_enabled", True)
+    log(f"Router received web search info : {web_search_enabled}")
+    fast = await fast_router.aclassify(query)
+    if fast:
+        result = _fast_route_decision(fast)
+    else:
+        messages = _build_router_messages(query, web_search_enabled)
+        result: RouteDecision = await router_llm.ainvoke(messages)
+    return _record_router_tier(_apply_router_decision(state, result, web_search_enabled), fast)
+
+
+# Speculative router (build_agent(speculative=True))
+
+'''
+Most traffic routes to 'rag', so in speculative mode the retrieval (and, with SPECULATIVE_WEB_SEARCH,
+the Tavily search) starts at the same time as the router LLM call instead of after it.
+- the prefetch the router picks is handed to rag_node / web_node through `prefetched_rag` / `prefetched_web`
+- the ones it doesn't pick are cancelled (async) or their result is dropped (sync)
+- `speculation` records what happened, and the time saved versus the serial path :
+  serial = router + fetch, speculative = max(router, fetch), so saved = min(router, fetch)
+'''
+
+# threads for the sync (rag_agent.invoke / stream) speculative path
+_speculation_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="speculate")
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+async def _atimed(coro):
+    start = time.perf_counter()
+    result = await coro
+    return result, time.perf_counter() - start
+
+def _speculation_targets(web_search_enabled: bool) -> List[str]:
+    targets = ["rag"]
+    if SPECULATIVE_WEB_SEARCH and web_search_enabled:
+        targets.append("web")
+    return targets
+
+def _speculative_output(out: AgentState, router_seconds: float, fetched: dict, discarded: List[str]) -> AgentState:
+    """Adds the picked prefetch and the speculation summary to the router output."""
+    speculation = {"router_seconds": round(router_seconds, 4), "discarded": discarded, "used": None, "time_saved_seconds": 0.0}
+    out["prefetched_rag"] = None
+    out["prefetched_web"] = None
+    for target, (result, fetch_seconds) in fetched.items():
+        out[f"prefetched_{target}"] = result
+        speculation["used"] = target
+        speculation["fetch_seconds"] = round(fetch_seconds, 4)
+        speculation["time_saved_seconds"] = round(min(router_seconds, fetch_seconds), 4)
+    log(f"Speculation: used={speculation['used']} discarded={discarded} saved={speculation['time_saved_seconds']}s")
+    out["speculation"] = speculation
+    return out
+
+def speculative_router_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    """router_node with retrieval / web search prefetched on worker threads."""
+    log("Entering speculative_router_node ........")
+    query = _current_query(state)
+    web_search_enabled = config.get("configurable", {}).get("web_search_enabled", True)
+    fast = fast_router.classify(query)
+    if fast: # decided locally in microseconds, nothing to overlap with
+        return _record_router_tier(_apply_router_decision(state, _fast_route_decision(fast), web_search_enabled), fast)
+    tools = {"rag": rag_search_tool, "web": web_search_tool}
+    futures = {t: _speculation_pool.submit(_timed, tools[t].invoke, _tool_input(t, query, config))
+               for t in _speculation_targets(web_search_enabled)}
+
+    start = time.perf_counter()
+    result: RouteDecision = router_llm.invoke(_build_router_messages(query, web_search_enabled))
+    router_seconds = time.perf_counter() - start
+    out = _apply_router_decision(state, result, web_search_enabled)
+
+    fetched, discarded = {}, []
+    for target, future in futures.items():
+        if target == out["route"]:
+            fetched[target] = future.result()
+        else:
+            future.cancel() # no-op if already running, the result is simply never read
+            discarded.append(target)
+    return _record_router_tier(_speculative_output(out, router_seconds, fetched, discarded), None)
+
+async def aspeculative_router_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    """Async variant of speculative_router_node, prefetches run as tasks and unpicked ones are cancelled."""
+    log("Entering aspeculative_router_node ........")
+    query = _current_query(state)
+    web_search_enabled = config.get("configurable", {}).get("web_search_enabled", True)
+    fast = await fast_router.aclassify(query)
+    if fast:
+        return _record_router_tier(_apply_router_decision(state, _fast_route_decision(fast), web_search_enabled), fast)
+    tools = {"rag": rag_search_tool, "web": web_search_tool}
+    tasks = {t: asyncio.create_task(_atimed(tools[t].ainvoke(_tool_input(t, query, config))))
+             for t in _speculation_targets(web_search_enabled)}
+
+    try:
+        start = time.perf_counter()
+        result: RouteDecision = await router_llm.ainvoke(_build_router_messages(query, web_search_enabled))
+        router_seconds = time.perf_counter() - start
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+    out = _apply_router_decision(state, result, web_search_enabled)
+
+    fetched, discarded = {}, []
+    for target, task in tasks.items():
+        if target == out["route"]:
+            fetched[target] = await task
+        else:
+            task.cancel()
+            discarded.append(target)
+    return _record_router_tier(_speculative_output(out, router_seconds, fetched, discarded), None)
     
     
 # Define Node 2 : RAG LOOKUP
@@ -238,12 +683,14 @@ INPUTS (from AgentState):
 --------------------------------------------------------------------------------
 CORE LOGIC / ACTIONS:
 1. Extracts the latest user `query`.
-2. Calls `rag_search_tool` (custom tool) to query Pinecone, retrieving top-K (e.g., 5) chunks.
-3. **Sufficiency Judgment:** Calls `judge_llm` (Groq LLM with structured output `RagJudge`) to evaluate if the retrieved RAG `chunks` are sufficient to answer the `query`.
+2. Calls `rag_search_tool` (custom tool) to query Pinecone, retrieving top-K (e.g., 5) chunks with their similarity scores.
+3. **Sufficiency Gate:** `sufficiency_gate` (sufficiency.py) decides from the top score when it is clearly high or low.
+4. **Sufficiency Judgment:** Only in the uncertain band, calls `judge_llm` (Groq LLM with structured output `RagJudge`) to evaluate if the retrieved RAG `chunks` are sufficient to answer the `query`.
 
 --------------------------------------------------------------------------------
 OUTPUTS / UPDATES to AgentState:
 - `rag`: The retrieved content chunks from the knowledge base.
+- `rag_gate`: Who decided sufficiency (gate or judge), the top score, and the running skip counters.
 - `route`: Updated based on sufficiency verdict and `web_search_enabled`:
   - `answer` (if sufficient)
   - `web` (if not sufficient AND web search is enabled)
@@ -258,28 +705,9 @@ NEXT POSSIBLE NODES:
 
 '''
 
-def rag_node(state: AgentState,config:RunnableConfig) -> AgentState:
-    print("\n--- Entering rag_node ---")
-    query = next((m.content for m in reversed(state["messages"]) if isinstance(m, HumanMessage)), "")
-    # MODIFIED: Get web_search_enabled directly from the config
-    web_search_enabled = config.get("configurable", {}).get("web_search_enabled", True) # <-- CHANGED LINE
-    print(f"Router received web search info : {web_search_enabled}")
-    print(f"RAG query: {query}")
-    chunks = rag_search_tool.invoke(query)
-    
-    # logic to handle the chunks
-    if chunks.startswith("RAG_ERROR::"):
-        print(f"RAG Error: {chunks}. Checking web search enabled status.")
-        # If RAG fails, and web search is enabled, try web. Otherwise, go to answer.
-        next_route = "web" if web_search_enabled else "answer"
-        return {**state, "rag": "", "route": next_route}
-
-    if chunks:
-        print(f"Retrieved RAG chunks (first 500 chars): {chunks[:500]}...")
-    else:
-        print("No RAG chunks retrieved.")
-
-    judge_messages = [
+def _build_judge_messages(query: str, chunks: str) -> list:
+    """Builds the system + user messages for judge_llm."""
+    return [
         ("system", (
             "You are a judge evaluating if the **retrieved information** is **sufficient and relevant** "
             "to fully and accurately answer the user's question. "
@@ -294,23 +722,102 @@ def rag_node(state: AgentState,config:RunnableConfig) -> AgentState:
         )),
         ("user", f"Question: {query}\n\nRetrieved info: {chunks}\n\nIs this sufficient to answer the question?")
     ]
-    verdict: RagJudge = judge_llm.invoke(judge_messages)
-    print(f"RAG Judge verdict: {verdict.sufficient}")
-    print("--- Exiting rag_node ---")
+
+def _rag_error_output(state: AgentState, chunks: str, web_search_enabled: bool) -> AgentState:
+    """Node output when rag_search_tool failed."""
+    log(f"RAG Error: {chunks}. Checking web search enabled status.")
+    # If RAG fails, and web search is enabled, try web. Otherwise, go to answer.
+    next_route = "web" if web_search_enabled else "answer"
+    return {**state, "rag": "", "rag_chunks": [], "route": next_route, "prefetched_rag": None}
+
+def _apply_rag_verdict(state: AgentState, chunks: List[dict], verdict: RagJudge, web_search_enabled: bool,
+                       gate: GateDecision) -> AgentState:
+    """Decides the next route from the gate's / judge's verdict and builds the node output."""
+    decided_by = "judge" if gate.sufficient is None else gate.scorer
+    log(f"RAG sufficiency verdict: {verdict.sufficient} (decided by {decided_by}, top score {gate.top_score})")
+    log("--- Exiting rag_node ---")
     
     # NEW LOGIC: Decide next route based on sufficiency AND web_search_enabled
     if verdict.sufficient:
         next_route = "answer"
     else:
         next_route = "web" if web_search_enabled else "answer" # If not sufficient, only go to web if enabled
-        print(f"RAG not sufficient. Web search enabled: {web_search_enabled}. Next route: {next_route}")
+        log(f"RAG not sufficient. Web search enabled: {web_search_enabled}. Next route: {next_route}")
 
     return {
         **state,
-        "rag": chunks,
+        "rag": _join_chunks(chunks),
+        "rag_chunks": chunks,
         "route": next_route,
+        "prefetched_rag": None, # consumed, don't carry it into the next turn
+        "rag_gate": {
+            "decided_by": decided_by,
+            "top_score": None if gate.top_score is None else round(gate.top_score, 4),
+            "judge_skipped": gate.sufficient is not None,
+            "stats": sufficiency_gate.stats(),
+        },
         "web_search_enabled": web_search_enabled # Pass the flag along
     }
+
+def rag_node(state: AgentState,config:RunnableConfig) -> AgentState:
+    log("\n--- Entering rag_node ---")
+    query = _current_query(state)
+    # MODIFIED: Get web_search_enabled directly from the config
+    web_search_enabled = config.get("configurable", {}).get("web_search_enabled", True) # <-- CHANGED LINE
+    log(f"Router received web search info : {web_search_enabled}")
+    log(f"RAG query: {query} (filter: {_retrieval_filter(config)})")
+    chunks = state.get("prefetched_rag")
+    if chunks is None:
+        chunks = rag_search_tool.invoke(_tool_input("rag", query, config))
+    else:
+        log("Using retrieval prefetched by the speculative router.")
+    
+    # logic to handle the chunks
+    if isinstance(chunks, str): # "RAG_ERROR::..."
+        return _rag_error_output(state, chunks, web_search_enabled)
+
+    text = _join_chunks(chunks)
+    if text:
+        log(f"Retrieved RAG chunks (first 500 chars): {text[:500]}...")
+    else:
+        log("No RAG chunks retrieved.")
+
+    # clear cases are decided from the retrieval scores, judge_llm only runs in the uncertain band
+    gate = sufficiency_gate.decide(query, chunks)
+    if gate.sufficient is None:
+        verdict: RagJudge = judge_llm.invoke(_build_judge_messages(query, text))
+    else:
+        verdict = RagJudge(sufficient=gate.sufficient)
+    return _apply_rag_verdict(state, chunks, verdict, web_search_enabled, gate)
+
+async def arag_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    """Async variant of rag_node, awaits the retriever and judge_llm."""
+    log("\n--- Entering arag_node ---")
+    query = _current_query(state)
+    web_search_enabled = config.get("configurable", {}).get("web_search_enabled", True)
+    log(f"RAG query: {query} (filter: {_retrieval_filter(config)})")
+    chunks = state.get("prefetched_rag")
+    if chunks is None:
+        chunks = await rag_search_tool.ainvoke(_tool_input("rag", query, config))
+    else:
+        log("Using retrieval prefetched by the speculative router.")
+
+    if isinstance(chunks, str):
+        return _rag_error_output(state, chunks, web_search_enabled)
+
+    text = _join_chunks(chunks)
+    if text:
+        log(f"Retrieved RAG chunks (first 500 chars): {text[:500]}...")
+    else:
+        log("No RAG chunks retrieved.")
+
+    # a cross-encoder scores on the CPU, keep it off the event loop
+    gate = await asyncio.to_thread(sufficiency_gate.decide, query, chunks)
+    if gate.sufficient is None:
+        verdict: RagJudge = await judge_llm.ainvoke(_build_judge_messages(query, text))
+    else:
+        verdict = RagJudge(sufficient=gate.sufficient)
+    return _apply_rag_verdict(state, chunks, verdict, web_search_enabled, gate)
     
 
 
@@ -343,28 +850,48 @@ NEXT POSSIBLE NODES:
 
 '''
 
+def _apply_web_snippets(state: AgentState, snippets: str) -> AgentState:
+    """Builds the web node output from the tool result."""
+    if snippets.startswith("WEB_ERROR::"):
+        log(f"Web Error: {snippets}. Proceeding to answer with limited info.")
+        return {**state, "web": "", "route": "answer", "prefetched_web": None}
+
+    log(f"Web snippets retrieved: {snippets[:200]}...")
+    log("--- Exiting web_node ---")
+    return {**state, "web": snippets, "route": "answer", "prefetched_web": None, "web_cache": web_cache.stats()}
+
 def web_node(state: AgentState,config:RunnableConfig) -> AgentState:
-    print("\n--- Entering web_node ---")
-    query = next((m.content for m in reversed(state["messages"]) if isinstance(m, HumanMessage)), "")
+    log("\n--- Entering web_node ---")
+    query = _current_query(state)
     
     # Check if web search is actually enabled before performing it
     # MODIFIED: Get web_search_enabled directly from the config
     web_search_enabled = config.get("configurable", {}).get("web_search_enabled", True) # <-- CHANGED LINE
-    print(f"Router received web search info : {web_search_enabled}")
+    log(f"Router received web search info : {web_search_enabled}")
     if not web_search_enabled:
-        print("Web search node entered but web search is disabled. Skipping actual search.")
+        log("Web search node entered but web search is disabled. Skipping actual search.")
         return {**state, "web": "Web search was disabled by the user.", "route": "answer"}
 
-    print(f"Web search query: {query}")
-    snippets = web_search_tool.invoke(query)
-    
-    if snippets.startswith("WEB_ERROR::"):
-        print(f"Web Error: {snippets}. Proceeding to answer with limited info.")
-        return {**state, "web": "", "route": "answer"}
+    log(f"Web search query: {query}")
+    snippets = state.get("prefetched_web")
+    if snippets is None:
+        snippets = web_search_tool.invoke(query)
+    return _apply_web_snippets(state, snippets)
+
+async def aweb_node(state: AgentState, config: RunnableConfig) -> AgentState:
+    """Async variant of web_node, awaits Tavily."""
+    log("\n--- Entering aweb_node ---")
+    query = _current_query(state)
+    web_search_enabled = config.get("configurable", {}).get("web_search_enabled", True)
+    if not web_search_enabled:
+        log("Web search node entered but web search is disabled. Skipping actual search.")
+        return {**state, "web": "Web search was disabled by the user.", "route": "answer"}
 
-    print(f"Web snippets retrieved: {snippets[:200]}...")
-    print("--- Exiting web_node ---")
-    return {**state, "web": snippets, "route": "answer"}
+    log(f"Web search query: {query}")
+    snippets = state.get("prefetched_web")
+    if snippets is None:
+        snippets = await web_search_tool.ainvoke(query)
+    return _apply_web_snippets(state, snippets)
 
 
 
@@ -383,13 +910,15 @@ INPUTS (from AgentState):
 
 CORE LOGIC / ACTIONS:
 1. Extracts the latest user `query`.
-2. Combines `rag` and `web` content into a unified `context`.
+2. Packs `rag_chunks` (or `rag`) and `web` content into a unified `context` (context_packing.py) :
+   overlapping neighbour chunks merged, near-duplicates dropped, cut to CONTEXT_TOKEN_BUDGET by relevance.
    (Filters out "web search disabled" messages from `web` content).
 3. Crafts a detailed prompt for `answer_llm` using the `query` and `context`.
 4. Calls `answer_llm` (Groq LLM) to generate the final response.
 
 OUTPUTS / UPDATES to AgentState:
 - `messages`: Appends the generated AI's answer to the conversation history.
+- `context_packing`: Token counts before / after packing, chunks merged, duplicates dropped.
 
 NEXT POSSIBLE NODES:
 - `END` (always)
@@ -397,21 +926,16 @@ NEXT POSSIBLE NODES:
 
 '''
 
-def answer_node(state: AgentState) -> AgentState:
-    print("\n--- Entering answer_node ---")
+def _build_answer_prompt(state: AgentState) -> Tuple[str, dict]:
+    """Packs rag and web context into the prompt for answer_llm. Returns (prompt, packing stats)."""
     # user_q = user_query
-    user_q = next((m.content for m in reversed(state["messages"]) if isinstance(m, HumanMessage)), "")
-    
-    ctx_parts = [] # context parts
-    if state.get("rag"):  # if we come to asnwer node from RAG , then we need to add context from that state.
-        ctx_parts.append("Knowledge Base Information:\n" + state["rag"])
-    if state.get("web"): # if we come here from web search node, first check if web search was enabled
-        # If web search was disabled, the 'web' field might contain a message like "Web search was disabled..."
-        # We should only include actual search results here.
-        if state["web"] and not state["web"].startswith("Web search was disabled"):
-            ctx_parts.append("Web Search Results:\n" + state["web"])
-    
-    context = "\n\n".join(ctx_parts)
+    user_q = _current_query(state)
+    
+    # "Knowledge Base Information:" / "Web Search Results:" sections, within the token budget
+    # ("Web search was disabled..." messages in `web` are not search results and are left out)
+    context, packing = pack_context(state.get("rag_chunks"), state.get("rag", ""), state.get("web", ""))
+    if packing["tokens_before"]:
+        log(f"Context packed: {packing}")
     if not context.strip():
         context = "No external context was available for this query. Try to answer based on general knowledge if possible."
 
@@ -424,19 +948,63 @@ Context:
 {context}
 
 Provide a helpful, accurate, and concise response based on the available information."""
+    return prompt, packing
 
-    print(f"Prompt sent to answer_llm: {prompt[:500]}...")
-    ans = answer_llm.invoke([HumanMessage(content=prompt)]).content
-    print(f"Final answer generated: {ans[:200]}...")
-    print("--- Exiting answer_node ---")
+def _apply_answer(state: AgentState, ans: str, packing: dict) -> AgentState:
+    """Appends the generated answer to the conversation history."""
+    log(f"Final answer generated: {ans[:200]}...")
+    log("--- Exiting answer_node ---")
     return {
         **state,
-        "messages": state["messages"] + [AIMessage(content=ans)]
+        "messages": state["messages"] + [AIMessage(content=ans)],
+        "context_packing": packing,
     }
+
+def _cache_store_args(state: AgentState, ans: str):
+    """Arguments for semantic_cache.store, None when the answer should not be cached."""
+    cache_info = state.get("cache_info") or {}
+    if not SEMANTIC_CACHE_ENABLED or "kb_version" not in cache_info:
+        return None
+    user_q = _current_query(state)
+    web = state.get("web") or ""
+    # an answer built from web results is only as fresh as they are : cached no longer than the web cache keeps them
+    ttl_seconds = WEB_CACHE_TTL_SECONDS if web and not web.startswith("Web search was disabled") else None
+    return (user_q, ans, state.get("web_search_enabled", True), cache_info["kb_version"], cache_info.get("scope", ""),
+            ttl_seconds)
+
+def answer_node(state: AgentState) -> AgentState:
+    log("\n--- Entering answer_node ---")
+    prompt, packing = _build_answer_prompt(state)
+    log(f"Prompt sent to answer_llm: {prompt[:500]}...")
+    ans = answer_llm.invoke([HumanMessage(content=prompt)]).content
+    store_args = _cache_store_args(state, ans)
+    if store_args:
+        try:
+            semantic_cache.store(*store_args)
+        except Exception as e:
+            log(f"Semantic cache store failed: {e}")
+    return _apply_answer(state, ans, packing)
+
+async def aanswer_node(state: AgentState) -> AgentState:
+    """Async variant of answer_node, awaits answer_llm."""
+    log("\n--- Entering aanswer_node ---")
+    prompt, packing = _build_answer_prompt(state)
+    log(f"Prompt sent to answer_llm: {prompt[:500]}...")
+    ans = (await answer_llm.ainvoke([HumanMessage(content=prompt)])).content
+    store_args = _cache_store_args(state, ans)
+    if store_args:
+        try:
+            await semantic_cache.astore(*store_args)
+        except Exception as e:
+            log(f"Semantic cache store failed: {e}")
+    return _apply_answer(state, ans, packing)
     
     
     
 # --- Routing helpers ---
+def from_cache(st: AgentState) -> Literal["router", "end"]:
+    return "end" if st["route"] == "end" else "router"
+
 def from_router(st: AgentState) -> Literal["rag", "web", "answer", "end"]:
     return st["route"]
 
@@ -447,15 +1015,36 @@ def after_web(_) -> Literal["answer"]:
     return "answer"
 
 # --- Build graph ---
-def build_agent():
-    """Builds and compiles the LangGraph agent."""
+def build_agent(speculative: bool = SPECULATIVE_RETRIEVAL):
+    """
+    Builds and compiles the LangGraph agent.
+    With speculative=True the router prefetches retrieval (and optionally web search) while the router LLM runs.
+    """
     g = StateGraph(AgentState)
-    g.add_node("router", router_node)
-    g.add_node("rag_lookup", rag_node)
-    g.add_node("web_search", web_node)
-    g.add_node("answer", answer_node)
+    # Every node has a sync and an async implementation:
+    # rag_agent.stream / invoke use the sync ones, rag_agent.astream / ainvoke the async ones
+    # every node runs inside a telemetry span (wall time, LLM tokens / cost, retrieval size, cache hits), see telemetry.py
+    g.add_node("contextualize", RunnableLambda(traced("contextualize", contextualize_node), afunc=atraced("contextualize", acontextualize_node), name="contextualize"))
+    g.add_node("semantic_cache", RunnableLambda(traced("semantic_cache", cache_node), afunc=atraced("semantic_cache", acache_node), name="semantic_cache"))
+    if speculative:
+        g.add_node("router", RunnableLambda(traced("router", speculative_router_node), afunc=atraced("router", aspeculative_router_node), name="router"))
+    else:
+        g.add_node("router", RunnableLambda(traced("router", router_node), afunc=atraced("router", arouter_node), name="router"))
+    g.add_node("rag_lookup", RunnableLambda(traced("rag_lookup", rag_node), afunc=atraced("rag_lookup", arag_node), name="rag_lookup"))
+    g.add_node("web_search", RunnableLambda(traced("web_search", web_node), afunc=atraced("web_search", aweb_node), name="web_search"))
+    g.add_node("answer", RunnableLambda(traced("answer", answer_node), afunc=atraced("answer", aanswer_node), name="answer"))
 
-    g.set_entry_point("router")
+    g.set_entry_point("contextualize")
+    g.add_edge("contextualize", "semantic_cache")
+    
+    g.add_conditional_edges(
+        "semantic_cache",
+        from_cache,
+        {
+            "router": "router",
+            "end": END
+        }
+    )
     
     g.add_conditional_edges(
         "router",
@@ -480,7 +1069,7 @@ def build_agent():
     g.add_edge("web_search", "answer")
     g.add_edge("answer", END)
 
-    agent = g.compile(checkpointer=MemorySaver())
+    agent = g.compile(checkpointer=checkpointer) # SQLite, bounded, see checkpointer.py
     return agent
 
 rag_agent = build_agent()
\ No newline at end of file
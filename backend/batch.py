@@ -0,0 +1,111 @@
+'''
+Batch driver for many independent questions (offline evaluation, bulk FAQ jobs) : POST /chat/batch.
+
+Sending thousands of questions one at a time through /chat/ runs every stage serially.
+Here the whole batch moves through the stages together :
+
+1. embed : every query is embedded in ONE embed_documents call through the retrieval embedder
+           (CachedEmbeddings), so the semantic cache lookups and vector searches that follow
+           are embedding cache hits instead of one embedding round trip each
+2. graph : rag_agent.abatch_as_completed runs one graph per query with at most `max_concurrency`
+           in flight. The router / judge / answer LLM calls and the vector store queries of the
+           batch are therefore in flight together (bounded fan-out) instead of back to back.
+
+Every query runs in its own throwaway thread (no conversation history), deleted from the
+checkpointer once answered. Results are yielded as they finish, tagged with their index
+(abatch_chat), or returned in order (batch_chat / BatchResult list).
+'''
+import time
+import uuid
+import asyncio
+from dataclasses import dataclass, asdict
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from langchain_core.messages import HumanMessage, AIMessage
+
+import agent
+from config import BATCH_MAX_CONCURRENCY
+from checkpointer import checkpointer
+from telemetry import log
+
+
+@dataclass
+class BatchResult:
+    index: int
+    query: str
+    response: Optional[str]
+    route: Optional[str] # path the query took : cache / end / answer / rag / web / rag+web
+    error: Optional[str]
+    latency_ms: float # from the start of the batch until this answer was ready
+
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _route_taken(state: Dict[str, Any]) -> str:
+    if (state.get("cache_info") or {}).get("hit"):
+        return "cache"
+    if state.get("route") == "end":
+        return "end"
+    rag = bool(state.get("rag_gate"))
+    web = bool(state.get("web"))
+    return "rag+web" if rag and web else "rag" if rag else "web" if web else "answer"
+
+
+def _final_answer(state: Dict[str, Any]) -> str:
+    return next((m.content for m in reversed(state.get("messages", [])) if isinstance(m, AIMessage)), "")
+
+
+def _result(index: int, query: str, output: Any, start: float) -> BatchResult:
+    latency_ms = round((time.perf_counter() - start) * 1000, 1)
+    if isinstance(output, Exception):
+        return BatchResult(index, query, None, None, f"{type(output).__name__}: {output}", latency_ms)
+    return BatchResult(index, query, _final_answer(output), _route_taken(output), None, latency_ms)
+
+
+def _graph_inputs(queries: List[str], web_search_enabled: bool, max_concurrency: int,
+                  retrieval_filter: Optional[dict]):
+    batch_id = uuid.uuid4().hex[:12]
+    inputs = [{"messages": [HumanMessage(content=q)]} for q in queries]
+    configs = [{"configurable": {"thread_id": f"batch-{batch_id}-{i}", "web_search_enabled": web_search_enabled,
+                                 "retrieval_filter": retrieval_filter},
+                "max_concurrency": max_concurrency} for i in range(len(queries))]
+    return inputs, configs
+
+
+def _embedder():
+    return agent.get_vector_store().embeddings
+
+
+async def abatch_chat(queries: List[str], web_search_enabled: bool = True,
+                      max_concurrency: int = BATCH_MAX_CONCURRENCY,
+                      retrieval_filter: Optional[dict] = None) -> AsyncIterator[BatchResult]:
+    """Answers `queries`, yielding each BatchResult as soon as it is ready (not in order).
+    Retrieval only searches the chunks matching `retrieval_filter` (vectorstore.retrieval_filter)."""
+    start = time.perf_counter()
+    try:
+        # one embedding call for the whole batch, everything after hits the embedding cache
+        embedder = await asyncio.to_thread(_embedder)
+        await embedder.aembed_documents(list(dict.fromkeys(queries)))
+    except Exception as e:
+        log(f"Batch embedding prefill failed, queries will be embedded one by one: {e}")
+    inputs, configs = _graph_inputs(queries, web_search_enabled, max_concurrency, retrieval_filter)
+    async for index, output in agent.rag_agent.abatch_as_completed(inputs, configs, return_exceptions=True):
+        await checkpointer.adelete_thread(configs[index]["configurable"]["thread_id"])
+        yield _result(index, queries[index], output, start)
+    log(f"Batch of {len(queries)} queries answered in {time.perf_counter() - start:.2f}s")
+
+
+def batch_chat(queries: List[str], web_search_enabled: bool = True,
+               max_concurrency: int = BATCH_MAX_CONCURRENCY, retrieval_filter: Optional[dict] = None) -> List[BatchResult]:
+    """Blocking variant of abatch_chat on rag_agent.batch, returns the results in query order."""
+    start = time.perf_counter()
+    try:
+        _embedder().embed_documents(list(dict.fromkeys(queries)))
+    except Exception as e:
+        log(f"Batch embedding prefill failed, queries will be embedded one by one: {e}")
+    inputs, configs = _graph_inputs(queries, web_search_enabled, max_concurrency, retrieval_filter)
+    outputs = agent.rag_agent.batch(inputs, configs, return_exceptions=True)
+    for config in configs:
+        checkpointer.delete_thread(config["configurable"]["thread_id"])
+    return [_result(i, q, output, start) for i, (q, output) in enumerate(zip(queries, outputs))]
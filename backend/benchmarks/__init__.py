@@ -0,0 +1,2 @@
+# Benchmarks for the backend. Run them from the backend/ directory, e.g.
+#   python -m benchmarks.bench_chat_concurrency
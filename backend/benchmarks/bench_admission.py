@@ -0,0 +1,88 @@
+'''
+/chat/ under overload, with and without admission control (admission.ChatGate), on the offline
+backends of benchmarks.fakes through the in-process ASGI app.
+
+Sends --requests requests with --concurrency in flight, far more than --max-inflight. Without the
+gate (limits raised out of reach) every request is admitted and the latency grows with the backlog.
+With it, the requests past the limit get a fast 429 and the admitted ones keep their latency.
+Then sends every query twice at once on the same session (double-submit) and counts the graph runs.
+
+Reports per mode : 200s and 429s, p50 / p99 latency of each, and the graph runs.
+
+Usage (from backend/):
+    python -m benchmarks.bench_admission --requests 400 --concurrency 200 --max-inflight 16
+'''
+import time
+import asyncio
+import argparse
+from typing import Dict, List
+
+import numpy as np
+
+from benchmarks.fakes import install_offline_backends
+from benchmarks.bench_e2e import make_workload, _api_client
+
+
+def _percentiles(latencies: List[float]) -> str:
+    if not latencies:
+        return f"{'-':>8} {'-':>8}"
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    return f"{p50:>8.1f} {p99:>8.1f}"
+
+
+async def run(queries: List[str], concurrency: int, duplicate: bool = False) -> Dict:
+    limit = asyncio.Semaphore(concurrency)
+    latencies: Dict[int, List[float]] = {}
+    client = _api_client()
+
+    async def one(i: int, query: str):
+        async with limit:
+            start = time.perf_counter()
+            response = await client.post("/chat/", json={"session_id": f"admission-{i}", "query": query})
+            latencies.setdefault(response.status_code, []).append(time.perf_counter() - start)
+
+    copies = 2 if duplicate else 1 # the same request twice at once, as a double-submit or an impatient retry sends it
+    requests = [one(i, query) for i, query in enumerate(queries) for _ in range(copies)]
+    try:
+        await asyncio.gather(*requests)
+    finally:
+        await client.aclose()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--max-inflight", type=int, default=16)
+    parser.add_argument("--max-queued", type=int, default=16)
+    parser.add_argument("--queue-timeout", type=float, default=0.5)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from telemetry import configure_logging
+    configure_logging("off")
+    install_offline_backends(llm_latency=args.llm_latency, retrieval_latency=0.02, web_latency=0.1)
+    import main as api
+    from admission import ChatGate
+
+    queries = [query for _, query in make_workload(args.requests, args.seed)]
+    unlimited = dict(max_inflight=10 ** 9, max_queued=0, queue_timeout=0, max_session_queue=10 ** 9)
+    limited = dict(max_inflight=args.max_inflight, max_queued=args.max_queued, queue_timeout=args.queue_timeout)
+    modes = [("no limit", unlimited, False), ("gate", limited, False),
+             ("no limit, dup", unlimited, True), ("gate, dup", limited, True)]
+
+    print(f"{args.requests} requests, {args.concurrency} in flight, gate : {args.max_inflight} admitted + "
+          f"{args.max_queued} queued <= {args.queue_timeout}s\n")
+    print(f"{'mode':14} {'200':>5} {'429':>5} {'p50 ms':>8} {'p99 ms':>8} {'429 p50':>8} {'429 p99':>8} {'graph runs':>11}")
+    for name, limits, duplicate in modes:
+        api.chat_gate = ChatGate(**limits)
+        latencies = asyncio.run(run(queries, args.concurrency, duplicate))
+        stats = api.chat_gate.stats()
+        print(f"{name:14} {len(latencies.get(200, [])):>5} {len(latencies.get(429, [])):>5} "
+              f"{_percentiles(latencies.get(200, []))} {_percentiles(latencies.get(429, []))} {stats['admitted']:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+'''
+Batch chat throughput : the same questions answered by a sequential loop (one graph run at a time,
+what a bulk job calling /chat/ in a loop gets) vs batch.abatch_chat (one embedding call for the
+batch, bounded concurrent graph runs), with the offline backends of benchmarks.fakes.
+
+Reports questions/s, the speedup, and the embedding model calls each mode made. Both modes start
+from empty embedding caches (the backends are reinstalled before each run).
+
+Usage (from backend/):
+    python -m benchmarks.bench_batch_chat --queries 200 --concurrency 8 16 32
+'''
+import time
+import asyncio
+import argparse
+from typing import Dict, List
+
+from benchmarks.fakes import install_offline_backends
+from benchmarks.bench_e2e import make_workload
+
+
+def _backends(args):
+    agent = install_offline_backends(llm_latency=args.llm_latency, retrieval_latency=args.retrieval_latency,
+                                     web_latency=args.web_latency, embed_latency=args.embed_latency)
+    return agent, agent.get_vector_store().embeddings
+
+
+async def sequential(queries: List[str]) -> Dict:
+    from langchain_core.messages import HumanMessage
+    import agent
+    errors = 0
+    start = time.perf_counter()
+    for i, query in enumerate(queries):
+        config = {"configurable": {"thread_id": f"bench-seq-{i}", "web_search_enabled": True}}
+        try:
+            await agent.rag_agent.ainvoke({"messages": [HumanMessage(content=query)]}, config=config)
+        except Exception:
+            errors += 1
+    return {"seconds": time.perf_counter() - start, "errors": errors}
+
+
+async def batched(queries: List[str], concurrency: int) -> Dict:
+    from batch import abatch_chat
+    errors = 0
+    start = time.perf_counter()
+    async for result in abatch_chat(queries, web_search_enabled=True, max_concurrency=concurrency):
+        errors += result.error is not None
+    return {"seconds": time.perf_counter() - start, "errors": errors}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--retrieval-latency", type=float, default=0.02)
+    parser.add_argument("--web-latency", type=float, default=0.1)
+    parser.add_argument("--embed-latency", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from telemetry import configure_logging
+    configure_logging("off") # the node logs would drown the report
+    queries = [query for _, query in make_workload(args.queries, args.seed)]
+
+    _, embedder = _backends(args)
+    base = asyncio.run(sequential(queries))
+    base_qps = len(queries) / base["seconds"]
+    print(f"{len(queries)} queries, llm={args.llm_latency}s retrieval={args.retrieval_latency}s "
+          f"web={args.web_latency}s embed={args.embed_latency}s\n")
+    print(f"{'mode':16} {'seconds':>8} {'q/s':>8} {'speedup':>8} {'embed calls':>12} {'errors':>7}")
+    print(f"{'sequential':16} {base['seconds']:>8.2f} {base_qps:>8.2f} {'1.00x':>8} "
+          f"{embedder.stats()['embed_calls']:>12} {base['errors']:>7}")
+    for concurrency in args.concurrency:
+        _, embedder = _backends(args)
+        run = asyncio.run(batched(queries, concurrency))
+        qps = len(queries) / run["seconds"]
+        print(f"{f'batch c={concurrency}':16} {run['seconds']:>8.2f} {qps:>8.2f} {f'{qps / base_qps:.2f}x':>8} "
+              f"{embedder.stats()['embed_calls']:>12} {run['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
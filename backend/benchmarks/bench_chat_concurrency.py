@@ -0,0 +1,65 @@
+'''
+Load benchmark for /chat/ with stubbed backends.
+
+Fires N concurrent chat sessions at one event loop (= one uvicorn worker) and reports
+how many sessions were effectively served in parallel :
+
+    effective concurrency = sum of per-request latencies / wall clock time
+
+"sync" drives the graph with the blocking rag_agent.invoke (the old behaviour),
+"async" goes through chat_with_agent, which uses rag_agent.astream.
+
+Usage (from backend/):
+    python -m benchmarks.bench_chat_concurrency --sessions 50 --llm-latency 0.2
+'''
+import time
+import asyncio
+import argparse
+
+from benchmarks.fakes import install_stubs
+
+
+async def _timed(coro_factory):
+    start = time.perf_counter()
+    await coro_factory()
+    return time.perf_counter() - start
+
+
+async def run(mode: str, sessions: int):
+    from langchain_core.messages import HumanMessage
+    import agent
+    import main
+
+    async def blocking_chat(i):
+        # what chat_with_agent used to do : a sync graph run inside the event loop
+        config = {"configurable": {"thread_id": f"{mode}-{i}", "web_search_enabled": True}}
+        agent.rag_agent.invoke({"messages": [HumanMessage(content="What is X?")]}, config=config)
+
+    async def async_chat(i):
+        await main.chat_with_agent(main.QueryRequest(session_id=f"{mode}-{i}", query="What is X?"))
+
+    chat = blocking_chat if mode == "sync" else async_chat
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*[_timed(lambda i=i: chat(i)) for i in range(sessions)])
+    wall = time.perf_counter() - start
+
+    print(f"[{mode:5}] sessions={sessions} wall={wall:.2f}s "
+          f"mean_latency={sum(latencies) / len(latencies):.2f}s "
+          f"effective_concurrency={sum(latencies) / wall:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--retrieval-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    install_stubs(llm_latency=args.llm_latency, retrieval_latency=args.retrieval_latency)
+    for mode in ("sync", "async"):
+        asyncio.run(run(mode, args.sessions))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+'''
+Chunking cost and throughput : the former RecursiveCharacterTextSplitter(1000, 200) vs
+chunking.TokenChunker (approx and tiktoken token counts) on the same text.
+
+Reports per splitter : chunks, tokens sent to the embedding model (the overlap is embedded twice),
+the overlap share of those tokens, the embedding cost at $0.13 / M tokens (text-embedding-3-large),
+the p5 / p50 / p95 chunk size in tokens (how evenly sized the k=5 retrieval context is) and MB/s.
+Tokens are counted with tiktoken (cl100k_base) when its encoding is available, else with the
+approx estimate. Without --file a synthetic structured corpus (headings, paragraphs, page breaks)
+of --mb MB is generated.
+
+Usage (from backend/):
+    python -m benchmarks.bench_chunking --mb 20
+    python -m benchmarks.bench_chunking --file manual.pdf --overlap sentence tokens none
+'''
+import time
+import random
+import textwrap
+import argparse
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from chunking import TokenChunker, build_splitter
+
+EMBED_PRICE_PER_M_TOKENS = 0.13
+WORDS = ("policy leave benefit employee request approval manager salary contract notice period "
+         "holiday insurance pension training travel expense claim office security access the of "
+         "and to a is for within days after 2024 15% reimbursement").split()
+
+
+def synthetic_corpus(mb: float, seed: int = 0) -> str:
+    '''
+    Text shaped like extracted PDF pages : numbered sections of 1-5 paragraphs, lines wrapped at
+    about 90 characters (what pypdf returns), a form feed every few sections.
+    '''
+    rng = random.Random(seed)
+    parts: List[str] = []
+    size, section = 0, 0
+    while size < mb * 1_000_000:
+        section += 1
+        parts.append(f"{section}. {rng.choice(WORDS).capitalize()} {rng.choice(WORDS)} rules\n")
+        for _ in range(rng.randint(1, 5)):
+            sentences = " ".join(" ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 30))).capitalize() + "."
+                                 for _ in range(rng.randint(1, 8)))
+            parts.append("\n".join(textwrap.wrap(sentences, 90)) + "\n\n")
+        if section % 7 == 0:
+            parts.append("\f")
+        size = sum(map(len, parts)) if section % 100 == 0 else size
+    return "".join(parts)
+
+
+def load_text(path: str) -> str:
+    if path.lower().endswith(".pdf"):
+        from pdf_extract import iter_pages
+        return "\n\n".join(text for _, text in iter_pages(path))
+    with open(path, encoding="utf-8", errors="replace") as f:
+        return f.read()
+
+
+def tiktoken_chunker(**kwargs):
+    try:
+        return TokenChunker(tokenizer="tiktoken", **kwargs)
+    except Exception: # no tiktoken, or its encoding can't be downloaded
+        return None
+
+
+def measure(splitter, text: str, count_tokens: Callable[[str], int], text_tokens: int) -> Dict:
+    start = time.perf_counter()
+    chunks = splitter.split_text(text)
+    seconds = time.perf_counter() - start
+    sizes = np.array([count_tokens(chunk) for chunk in chunks])
+    embedded = int(sizes.sum())
+    p5, p50, p95 = np.percentile(sizes, [5, 50, 95]) if len(sizes) else (0, 0, 0)
+    return {"chunks": len(chunks), "embedded": embedded, "overlap": max(embedded - text_tokens, 0) / max(embedded, 1),
+            "cost": embedded / 1e6 * EMBED_PRICE_PER_M_TOKENS, "p5": p5, "p50": p50, "p95": p95,
+            "mb_s": len(text) / 1e6 / seconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", help="PDF or text file to split (default : a synthetic corpus)")
+    parser.add_argument("--mb", type=float, default=5.0)
+    parser.add_argument("--overlap", nargs="+", default=["sentence"], help="TokenChunker overlap strategies")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    text = load_text(args.file) if args.file else synthetic_corpus(args.mb, args.seed)
+    exact = tiktoken_chunker()
+    counter = "tiktoken" if exact else "approx"
+    count_tokens = (exact or TokenChunker(tokenizer="approx")).count_tokens
+    text_tokens = count_tokens(text)
+    splitters = [("recursive 1000/200", build_splitter("recursive"))]
+    for overlap in args.overlap:
+        splitters.append((f"token approx {overlap}", TokenChunker(overlap=overlap, tokenizer="approx")))
+        if exact:
+            splitters.append((f"token tiktoken {overlap}", tiktoken_chunker(overlap=overlap)))
+
+    print(f"{len(text) / 1e6:.1f} MB, {text_tokens} tokens ({counter} count)\n")
+    print(f"{'splitter':26} {'chunks':>8} {'embedded':>10} {'overlap':>8} {'cost $':>8} "
+          f"{'p5':>5} {'p50':>5} {'p95':>5} {'MB/s':>7}")
+    for name, splitter in splitters:
+        r = measure(splitter, text, count_tokens, text_tokens)
+        print(f"{name:26} {r['chunks']:>8} {r['embedded']:>10} {r['overlap']:>7.1%} {r['cost']:>8.4f} "
+              f"{r['p5']:>5.0f} {r['p50']:>5.0f} {r['p95']:>5.0f} {r['mb_s']:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+'''
+End-to-end load benchmark with deterministic offline backends (benchmarks.fakes.install_offline_backends) :
+no API key or network needed, every run with the same arguments sends the same queries down the same routes.
+
+Targets :
+- graph : rag_agent.astream, what chat_with_agent runs
+- api   : POST /chat/ on the FastAPI app through an in-process ASGI transport (request parsing,
+          trace building and response serialization included)
+
+The workload mixes the four routes (rag / web / answer / end) and sends it with `--concurrency`
+requests in flight. Reports p50 / p95 / p99 latency and throughput per route, as seen by the router
+(with --caches, semantic cache hits are reported as route "cache").
+
+Regression gate : --save-baseline writes the results to a JSON file, --baseline compares a run
+with it and exits with status 1 when a route's p95 grows, or the throughput drops, by more than
+--tolerance (default 20%).
+
+Usage (from backend/):
+    python -m benchmarks.bench_e2e --target api --requests 400 --concurrency 32 --save-baseline .cache/e2e_baseline.json
+    python -m benchmarks.bench_e2e --target api --requests 400 --concurrency 32 --baseline .cache/e2e_baseline.json
+'''
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from benchmarks.fakes import install_offline_backends, CORPUS_TOPICS
+
+ROUTES = ("rag", "web", "answer", "end", "cache") # "cache" = answered by the semantic cache, the router never ran
+# share of each route in the workload
+DEFAULT_MIX = {"rag": 0.6, "web": 0.2, "answer": 0.1, "end": 0.1}
+QUERY_TEMPLATES = {
+    "rag": ["How does the {topic} work?", "Who is eligible for {topic}?", "What are the steps for {topic}?"],
+    "web": ["What is the latest news about {topic}?", "Current {topic} price today"],
+    "answer": ["Write a short poem about {topic}", "Translate '{topic}' into French"],
+    "end": ["Hello there!", "Thanks a lot", "Hi"],
+}
+
+
+def make_workload(requests: int, seed: int) -> List[Tuple[str, str]]:
+    '''(expected route, query) pairs, deterministic for a seed.'''
+    rng = random.Random(seed)
+    routes = rng.choices(list(DEFAULT_MIX), weights=list(DEFAULT_MIX.values()), k=requests)
+    return [(route, rng.choice(QUERY_TEMPLATES[route]).format(topic=rng.choice(CORPUS_TOPICS))) for route in routes]
+
+
+async def _graph_request(i: int, query: str) -> str:
+    """Runs the graph once, returns the route the router took."""
+    from langchain_core.messages import HumanMessage
+    import agent
+    route = None
+    config = {"configurable": {"thread_id": f"e2e-graph-{i}", "web_search_enabled": True}}
+    async for update in agent.rag_agent.astream({"messages": [HumanMessage(content=query)]}, config=config):
+        node, output = next(iter(update.items()))
+        if node == "router":
+            route = output["route"]
+    return route or "cache"
+
+
+def _api_client():
+    import httpx
+    import main
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=None)
+
+
+async def _api_request(client, i: int, query: str) -> str:
+    response = await client.post("/chat/", json={"session_id": f"e2e-api-{i}", "query": query, "enable_web_search": True})
+    response.raise_for_status()
+    for event in response.json()["trace_events"]:
+        if event["node_name"] == "router":
+            return event["details"].get("final_decision") or event["details"]["decision"]
+    return "cache"
+
+
+async def run(target: str, workload: List[Tuple[str, str]], concurrency: int) -> Dict:
+    limit = asyncio.Semaphore(concurrency)
+    samples: List[Tuple[str, float]] = []
+    errors = mismatched = 0
+    client = _api_client() if target == "api" else None
+
+    async def one(i: int, expected: str, query: str):
+        nonlocal errors, mismatched
+        async with limit:
+            start = time.perf_counter()
+            try:
+                route = await (_api_request(client, i, query) if client else _graph_request(i, query))
+            except Exception as e:
+                errors += 1
+                print(f"request {i} failed: {e!r}", file=sys.stderr)
+                return
+            samples.append((route, time.perf_counter() - start))
+            mismatched += route not in (expected, "cache")
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*[one(i, expected, query) for i, (expected, query) in enumerate(workload)])
+    finally:
+        if client:
+            await client.aclose()
+    wall = time.perf_counter() - start
+    return summarize(samples, wall, errors, mismatched)
+
+
+def summarize(samples: List[Tuple[str, float]], wall: float, errors: int, mismatched: int) -> Dict:
+    def percentiles(latencies: List[float]) -> Dict:
+        ms = np.asarray(latencies) * 1000
+        return {"count": len(ms), "p50_ms": round(float(np.percentile(ms, 50)), 2),
+                "p95_ms": round(float(np.percentile(ms, 95)), 2), "p99_ms": round(float(np.percentile(ms, 99)), 2),
+                "throughput_rps": round(len(ms) / wall, 2)}
+    routes = {route: percentiles([s for r, s in samples if r == route]) for route in ROUTES if any(r == route for r, _ in samples)}
+    return {"wall_s": round(wall, 3), "errors": errors, "route_mismatches": mismatched,
+            "overall": percentiles([s for _, s in samples]) if samples else {}, "routes": routes}
+
+
+def report(results: Dict):
+    print(f"\nwall={results['wall_s']}s errors={results['errors']} route_mismatches={results['route_mismatches']}")
+    print(f"{'route':8} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8}")
+    for name, row in [*results["routes"].items(), ("overall", results["overall"])]:
+        if not row:
+            continue
+        print(f"{name:8} {row['count']:>6} {row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9} {row['throughput_rps']:>8}")
+
+
+def regressions(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    '''Human readable regressions of `results` against `baseline`, empty when the gate passes.'''
+    if not results["overall"]:
+        return ["no request succeeded"]
+    found = []
+    for name, row in [*results["routes"].items(), ("overall", results["overall"])]:
+        base = baseline["overall"] if name == "overall" else baseline["routes"].get(name)
+        if not base:
+            continue
+        if row["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            found.append(f"{name}: p95 {row['p95_ms']} ms > baseline {base['p95_ms']} ms (+{tolerance:.0%})")
+    throughput, base_throughput = results["overall"]["throughput_rps"], baseline["overall"]["throughput_rps"]
+    if throughput < base_throughput * (1 - tolerance):
+        found.append(f"throughput {throughput} req/s < baseline {base_throughput} req/s (-{tolerance:.0%})")
+    if results["errors"] > baseline.get("errors", 0):
+        found.append(f"{results['errors']} failed requests (baseline {baseline.get('errors', 0)})")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", choices=("graph", "api"), default="api")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--retrieval-latency", type=float, default=0.05)
+    parser.add_argument("--web-latency", type=float, default=0.3)
+    parser.add_argument("--embed-latency", type=float, default=0.0)
+    parser.add_argument("--caches", action="store_true", help="keep the semantic / web caches and the fast router on")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", help="JSON results to compare with, exit 1 on regression")
+    parser.add_argument("--save-baseline", help="write the results to this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    install_offline_backends(llm_latency=args.llm_latency, retrieval_latency=args.retrieval_latency,
+                             web_latency=args.web_latency, embed_latency=args.embed_latency, caches=args.caches)
+    from telemetry import configure_logging
+    configure_logging("off") # the node logs would drown the report
+
+    results = asyncio.run(run(args.target, make_workload(args.requests, args.seed), args.concurrency))
+    results["config"] = {k: v for k, v in vars(args).items() if k not in ("baseline", "save_baseline")}
+    report(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline written to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        if found:
+            print("\nREGRESSION :\n  " + "\n  ".join(found))
+            sys.exit(1)
+        print("\nNo regression against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+'''
+Recall@k and query latency of dense, BM25 (sparse_index.py) and hybrid (RRF) retrieval on a synthetic corpus.
+
+The corpus mimics the two failure modes hybrid search is for :
+- words belong to topic clusters, the dense "embedding" of a chunk is the sum of its words' cluster
+  vectors, so paraphrases (other words of the same clusters) are found by dense search only
+- 30% of the chunks carry an error code ("ERR-004217") that the embedding ignores, like a real
+  embedding model blurring exact identifiers, so code lookups are found by BM25 only
+
+Dense search is an exact NumPy dot product (no API calls), BM25 is the real SparseIndex on a temp directory,
+fusion is vectorstore._fuse.
+
+Usage (from backend/):
+    python -m benchmarks.bench_hybrid_retrieval --sizes 10000,1000000 --queries 200
+'''
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+
+import numpy as np
+
+import benchmarks.fakes  # noqa: F401  (sets placeholder API keys)
+from langchain_core.documents import Document
+from sparse_index import SparseIndex
+from vectorstore import _fuse
+from config import HYBRID_CANDIDATES
+
+VOCAB = 20000
+CLUSTERS = 500
+DIM = 64
+WORDS_PER_CHUNK = 40
+CODE_RATE = 0.3
+
+
+def build_corpus(n: int, rng: np.random.Generator):
+    '''Returns (texts, word ids per chunk, code per chunk or None).'''
+    topics = rng.integers(CLUSTERS, size=(n, 3))
+    picks = rng.integers(3, size=(n, WORDS_PER_CHUNK))
+    members = rng.integers(VOCAB // CLUSTERS, size=(n, WORDS_PER_CHUNK))
+    word_ids = np.take_along_axis(topics, picks, axis=1) + CLUSTERS * members
+    has_code = rng.random(n) < CODE_RATE
+    texts, codes = [], []
+    for i in range(n):
+        words = [f"w{w}" for w in word_ids[i]]
+        code = f"ERR-{i:06d}" if has_code[i] else None
+        if code:
+            words.insert(int(rng.integers(len(words))), code)
+        texts.append(" ".join(words))
+        codes.append(code)
+    return texts, word_ids, codes
+
+
+def embed(word_ids: np.ndarray, cluster_vectors: np.ndarray, block: int = 20000) -> np.ndarray:
+    out = np.empty((len(word_ids), DIM), dtype=np.float32)
+    for start in range(0, len(word_ids), block):
+        v = cluster_vectors[word_ids[start:start + block] % CLUSTERS].sum(axis=1)
+        out[start:start + block] = v / np.linalg.norm(v, axis=1, keepdims=True)
+    return out
+
+
+def make_queries(word_ids, codes, cluster_vectors, count: int, rng: np.random.Generator):
+    '''Half code lookups ("ERR-000123 error"), half paraphrases (same clusters, other words).'''
+    queries = []
+    code_rows = [i for i, c in enumerate(codes) if c]
+    for row in rng.choice(code_rows, size=count // 2, replace=False):
+        # the embedding ignores the code, so the query vector points nowhere in particular
+        vector = rng.normal(size=DIM).astype(np.float32)
+        queries.append(("code", int(row), f"{codes[row]} error", vector / np.linalg.norm(vector)))
+    for row in rng.choice(len(word_ids), size=count - count // 2, replace=False):
+        words = word_ids[row][rng.choice(WORDS_PER_CHUNK, size=8, replace=False)]
+        synonyms = words % CLUSTERS + CLUSTERS * rng.integers(VOCAB // CLUSTERS, size=len(words))
+        text = " ".join(f"w{w}" for w in synonyms)
+        queries.append(("paraphrase", int(row), text, embed(synonyms[None, :], cluster_vectors)[0]))
+    return queries
+
+
+def run(n: int, queries: int, k: int, seed: int):
+    rng = np.random.default_rng(seed)
+    cluster_vectors = rng.normal(size=(CLUSTERS, DIM)).astype(np.float32)
+    start = time.perf_counter()
+    texts, word_ids, codes = build_corpus(n, rng)
+    vectors = embed(word_ids, cluster_vectors)
+    print(f"\n== {n} chunks (corpus generated in {time.perf_counter() - start:.1f}s)")
+
+    directory = tempfile.mkdtemp(prefix="bench-sparse-")
+    try:
+        index = SparseIndex(directory, flush_docs=50000)
+        start = time.perf_counter()
+        batch = 5000
+        for s in range(0, n, batch):
+            index.add([str(i) for i in range(s, min(s + batch, n))], texts[s:s + batch])
+        index.flush()
+        build_seconds = time.perf_counter() - start
+        size_mb = sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(directory) for f in files) / 1e6
+        print(f"BM25 build : {build_seconds:.1f}s ({n / build_seconds:,.0f} chunks/s), "
+              f"{len(index.segments)} segments, {size_mb:,.0f} MB on disk")
+
+        hits = {"dense": [], "bm25": [], "hybrid": []}
+        kinds = []
+        latency = {"dense": [], "bm25": [], "hybrid": []}
+        for kind, target, text, query_vector in make_queries(word_ids, codes, cluster_vectors, queries, rng):
+            t0 = time.perf_counter()
+            scores = vectors @ query_vector
+            top = np.argpartition(-scores, HYBRID_CANDIDATES)[:HYBRID_CANDIDATES]
+            top = top[np.argsort(-scores[top])]
+            dense = [(Document(id=str(i), page_content=texts[i]), float(scores[i])) for i in top]
+            t1 = time.perf_counter()
+            sparse = index.search(text, k=HYBRID_CANDIDATES)
+            t2 = time.perf_counter()
+            fused = _fuse(dense, sparse, k)
+            t3 = time.perf_counter()
+            target_id = str(target)
+            hits["dense"].append(any(d.id == target_id for d, _ in dense[:k]))
+            hits["bm25"].append(any(r["id"] == target_id for r, _ in sparse[:k]))
+            hits["hybrid"].append(any(c["id"] == target_id for c in fused))
+            kinds.append(kind)
+            latency["dense"].append((t1 - t0) * 1000)
+            latency["bm25"].append((t2 - t1) * 1000)
+            latency["hybrid"].append((t3 - t0) * 1000)
+
+        for name in ("dense", "bm25", "hybrid"):
+            by_kind = {kind: np.mean([h for h, k_ in zip(hits[name], kinds) if k_ == kind]) for kind in ("code", "paraphrase")}
+            lat = sorted(latency[name])
+            print(f"{name:6} recall@{k}={np.mean(hits[name]):.3f} (code {by_kind['code']:.3f}, paraphrase "
+                  f"{by_kind['paraphrase']:.3f})  p50={statistics.median(lat):6.2f} ms  p95={lat[int(0.95 * (len(lat) - 1))]:6.2f} ms")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,1000000")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for n in (int(s) for s in args.sizes.split(",")):
+        run(n, args.queries, args.k, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+'''
+Cold import time of the app : what every uvicorn worker / autoscaled pod pays before serving.
+
+Runs `python -X importtime -c "import <module>"` in fresh processes (no API key needed : clients
+are built on first use, see clients.py) and reports the median cumulative import time, plus the
+slowest top-level packages of the last run. With --budget-ms it exits with status 1 when the
+median exceeds the budget, so it can gate CI.
+
+Usage (from backend/):
+    python -m benchmarks.bench_import_time --runs 5 --budget-ms 1500
+'''
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+from typing import Dict, List, Tuple
+
+
+def import_profile(module: str) -> Tuple[float, Dict[str, int]]:
+    '''One fresh-process import. Returns (total ms, {package imported by the module: cumulative us}).'''
+    env = {k: v for k, v in os.environ.items() if not k.endswith("_API_KEY")} # a missing key must not matter
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, env=env, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed :\n{result.stderr[-2000:]}")
+    total_us = 0
+    packages: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        level = (len(name) - len(name.lstrip()) - 1) // 2 # 0 = imported by the interpreter / -c, 1 = by those
+        name = name.strip()
+        if name == module:
+            total_us = int(cumulative)
+        elif level == 1:
+            package = name.split(".")[0]
+            packages[package] = packages.get(package, 0) + int(cumulative)
+    return total_us / 1000, packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    totals: List[float] = []
+    packages: Dict[str, int] = {}
+    for _ in range(args.runs):
+        total_ms, packages = import_profile(args.module)
+        totals.append(total_ms)
+    median = statistics.median(totals)
+    print(f"import {args.module} : median {median:.0f} ms, min {min(totals):.0f} ms, max {max(totals):.0f} ms ({args.runs} runs)")
+    print(f"\nslowest top-level imports (last run, cumulative) :")
+    for name, us in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {name:32} {us / 1000:8.1f} ms")
+
+    if args.budget_ms is not None:
+        if median > args.budget_ms:
+            print(f"\nOVER BUDGET : {median:.0f} ms > {args.budget_ms:.0f} ms")
+            sys.exit(1)
+        print(f"\nWithin budget ({args.budget_ms:.0f} ms).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+'''
+PDF text extraction throughput vs worker processes (pdf_extract.iter_pages).
+
+Extracts the same PDF with 1, 2, 4, ... worker processes and reports pages/s and the speedup over
+the first --workers entry (1 = serial parse in the calling process). The pool is started before
+timing, as in the API where it lives as long as the worker. Without --pdf a synthetic text-only PDF of --pages pages is written.
+
+Usage (from backend/):
+    python -m benchmarks.bench_pdf_extract --pages 500 --workers 1 2 4 8
+    python -m benchmarks.bench_pdf_extract --pdf manual.pdf --workers 1 4
+'''
+import os
+import time
+import random
+import argparse
+import tempfile
+from typing import List, Tuple
+
+import pdf_extract
+
+WORDS = ("policy leave benefit employee request approval manager salary contract notice period "
+         "holiday insurance pension training travel expense claim office security access").split()
+
+
+def write_synthetic_pdf(path: str, pages: int, lines_per_page: int = 45, seed: int = 0):
+    '''A text-only PDF (Helvetica, `lines_per_page` lines of random words per page), written by hand.'''
+    rng = random.Random(seed)
+    objects: List[bytes] = [b"<< /Type /Catalog /Pages 2 0 R >>", b"",
+                            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for _ in range(pages):
+        lines = [" ".join(rng.choice(WORDS) for _ in range(12)) for _ in range(lines_per_page)]
+        text = "".join(f"({line}) Tj T* " for line in lines)
+        stream = f"BT /F1 10 Tf 12 TL 50 780 Td {text}ET".encode()
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % k for k in kids), pages)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def extract(path: str, workers: int, pages_per_shard: int) -> Tuple[int, float]:
+    start = time.perf_counter()
+    pages = sum(1 for _ in pdf_extract.iter_pages(path, workers=workers, pages_per_shard=pages_per_shard))
+    return pages, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", help="PDF to extract (default : a synthetic one)")
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--pages-per-shard", type=int, default=pdf_extract.PDF_PAGES_PER_SHARD)
+    args = parser.parse_args()
+
+    path = args.pdf
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), "synthetic.pdf")
+        write_synthetic_pdf(path, args.pages)
+    pdf_extract.PDF_PARALLEL_MIN_PAGES = 0 # measure the pool even on small PDFs
+
+    print(f"{path} : {pdf_extract.page_count(path)} pages, {os.cpu_count()} cores, "
+          f"{args.pages_per_shard} pages per shard\n")
+    print(f"{'workers':>8} {'seconds':>8} {'pages/s':>9} {'speedup':>8}")
+    serial = None
+    for workers in args.workers:
+        if workers > 1: # start the pool processes outside the timing
+            list(pdf_extract._pool(workers).map(pdf_extract.page_count, [path] * workers))
+        pages, seconds = extract(path, workers, args.pages_per_shard)
+        serial = serial or seconds
+        print(f"{workers:>8} {seconds:>8.2f} {pages / seconds:>9.1f} {serial / seconds:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+'''
+Per-query retrieval timings : rebuilt-per-query retriever vs the shared vector store.
+
+The old get_retriever ran pc.list_indexes() (a control-plane round trip) and built a new
+PineconeVectorStore on every query. This benchmark stubs the Pinecone client with fixed
+control-plane / data-plane latencies and times both paths.
+
+Usage (from backend/):
+    python -m benchmarks.bench_retriever_setup --queries 50 --control-plane-latency 0.15
+'''
+import time
+import argparse
+import statistics
+
+import benchmarks.fakes  # noqa: F401  (sets placeholder API keys)
+import vectorstore
+
+
+class _StubIndexList:
+    def __init__(self, names):
+        self._names = names
+
+    def names(self):
+        return self._names
+
+
+class StubPinecone:
+    '''Stands in for the Pinecone client, list_indexes costs one control-plane round trip.'''
+    def __init__(self, control_plane_latency: float):
+        self.control_plane_latency = control_plane_latency
+
+    def list_indexes(self):
+        time.sleep(self.control_plane_latency)
+        return _StubIndexList([vectorstore.INDEX_NAME])
+
+    def Index(self, name, **kwargs):
+        return object()
+
+
+class StubVectorStore:
+    '''Stands in for PineconeVectorStore, a query costs one data-plane round trip.'''
+    data_plane_latency = 0.0
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def as_retriever(self, search_kwargs=None):
+        return self
+
+    def invoke(self, query, **kwargs):
+        time.sleep(self.data_plane_latency)
+        return []
+
+
+def legacy_query(query: str):
+    # what get_retriever used to do on every query
+    if vectorstore.INDEX_NAME not in vectorstore.pc.list_indexes().names():
+        raise RuntimeError("index missing")
+    store = vectorstore.PineconeVectorStore(index_name=vectorstore.INDEX_NAME, embedding=vectorstore.embeddings)
+    return store.as_retriever().invoke(query)
+
+
+def shared_query(query: str):
+    return vectorstore.get_retriever(k=5).invoke(query)
+
+
+def _time(fn, queries: int):
+    timings = []
+    for i in range(queries):
+        start = time.perf_counter()
+        fn(f"query {i}")
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--control-plane-latency", type=float, default=0.15)
+    parser.add_argument("--data-plane-latency", type=float, default=0.03)
+    args = parser.parse_args()
+
+    vectorstore.pc = StubPinecone(args.control_plane_latency)
+    StubVectorStore.data_plane_latency = args.data_plane_latency
+    vectorstore.PineconeVectorStore = StubVectorStore
+
+    for name, fn in (("per-query setup", legacy_query), ("shared store", shared_query)):
+        timings = _time(fn, args.queries)
+        print(f"{name:16} first={timings[0]:7.1f} ms  median={statistics.median(timings):7.1f} ms  "
+              f"mean={statistics.mean(timings):7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+'''
+Calibrates the fast router's centroid tier threshold (FAST_ROUTER_CONFIDENCE) against router_llm.
+
+Runs every query of a file (one per line, ideally sampled from real traffic) through the centroid tier
+and router_llm, records the centroid's route, its margin and router_llm's route, then picks the lowest
+margin above which the centroid tier agrees with router_llm at --precision on its 'rag' / 'web' decisions.
+Needs the real API keys, unlike the other benchmarks.
+
+Usage (from backend/):
+    python -m benchmarks.calibrate_fast_router queries.txt --precision 0.98
+'''
+import math
+import argparse
+
+import agent
+from fast_router import fast_router, CENTROID_ROUTES
+from sufficiency import calibrate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("queries_file")
+    parser.add_argument("--precision", type=float, default=0.98)
+    args = parser.parse_args()
+
+    with open(args.queries_file, encoding="utf-8") as f:
+        queries = [line.strip() for line in f if line.strip()]
+
+    centroids = fast_router._get_centroids()
+    if centroids is None:
+        raise SystemExit("Could not embed the route examples, see the log.")
+    samples = []
+    for query in queries:
+        if fast_router.match_rules(query):
+            continue # decided by the rules tier
+        route, margin = fast_router.nearest(fast_router.embedder.embed_query(query), centroids)
+        llm_route = agent.router_llm.invoke(agent._build_router_messages(query, True)).route
+        print(f"{margin:.4f} centroid={route:6} llm={llm_route:6} {query}")
+        if route in CENTROID_ROUTES: # the only decisions the tier can take
+            samples.append((margin, route == llm_route))
+
+    threshold, _ = calibrate(samples, precision=args.precision)
+    if math.isinf(threshold):
+        print(f"\nNo margin reaches {args.precision:.0%} agreement : keep FAST_ROUTER_CENTROID_ENABLED=false")
+        return
+    decided = sum(1 for margin, _ in samples if margin >= threshold)
+    print("\nFAST_ROUTER_CENTROID_ENABLED=true")
+    print(f"FAST_ROUTER_CONFIDENCE={threshold:.4f}")
+    print(f"router_llm calls skipped on this set : {decided}/{len(queries)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+'''
+Calibrates the sufficiency gate thresholds (RAG_GATE_SUFFICIENT / RAG_GATE_INSUFFICIENT) against judge_llm.
+
+Runs every query of a file (one per line) through the real retrieval, records the gate's top score
+(vector similarity, or cross-encoder score when RAG_GATE_CROSS_ENCODER is set) and judge_llm's verdict,
+then picks the thresholds that agree with the judge at --precision on both sides. They replace the
+conservative defaults of config.py, so the judge is skipped on more queries.
+Needs the real API keys and an indexed knowledge base, unlike the other benchmarks.
+
+Usage (from backend/):
+    python -m benchmarks.calibrate_rag_gate queries.txt --precision 0.95
+'''
+import argparse
+
+import agent
+from sufficiency import sufficiency_gate, calibrate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("queries_file")
+    parser.add_argument("--precision", type=float, default=0.95)
+    args = parser.parse_args()
+
+    with open(args.queries_file, encoding="utf-8") as f:
+        queries = [line.strip() for line in f if line.strip()]
+
+    samples = []
+    for query in queries:
+        chunks = agent.rag_search_tool.invoke(query)
+        if isinstance(chunks, str):
+            print(f"skipped '{query}' : {chunks}")
+            continue
+        scores, scorer = sufficiency_gate.rescore(query, chunks)
+        verdict = agent.judge_llm.invoke(agent._build_judge_messages(query, agent._join_chunks(chunks)))
+        samples.append((max(scores) if scores else 0.0, verdict.sufficient))
+        print(f"{samples[-1][0]:.4f} ({scorer}) sufficient={verdict.sufficient}  {query}")
+
+    sufficient, insufficient = calibrate(samples, precision=args.precision)
+    skipped = sum(1 for score, _ in samples if score >= sufficient or score < insufficient)
+    print(f"\nRAG_GATE_SUFFICIENT={sufficient:.4f}")
+    print(f"RAG_GATE_INSUFFICIENT={insufficient:.4f}")
+    print(f"judge calls skipped on this set : {skipped}/{len(samples)}")
+
+
+if __name__ == "__main__":
+    main()
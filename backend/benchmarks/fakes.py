@@ -0,0 +1,361 @@
+'''
+Stubbed backends for benchmarks : stand-ins for the Groq LLMs, the Pinecone search and Tavily.
+Each stub sleeps for a fixed latency so we can measure how the agent schedules I/O,
+without spending API credits or needing network access.
+
+Two levels :
+- install_stubs            : fixed answers (one route for every query), for scheduling benchmarks
+- install_offline_backends : deterministic stand-ins that behave like the real services
+                             (FakeChatModel with structured output, HashEmbeddings, an in-memory
+                             vector store over a generated corpus, FakeTavily), so the router
+                             takes every route and the end-to-end benchmark (bench_e2e.py)
+                             exercises the real graph, caches and API
+'''
+import os
+import re
+import json
+import time
+import atexit
+import shutil
+import asyncio
+import hashlib
+import tempfile
+from typing import Any, Dict, Iterator, AsyncIterator, List, Optional
+
+# agent.py / vectorstore.py read the API keys at import time, give them placeholders
+for _key in ("GROQ_API_KEY", "PINECONE_API_KEY", "TAVILY_API_KEY", "OPENAI_API_KEY"):
+    os.environ.setdefault(_key, "benchmark-placeholder")
+
+# the checkpointer, manifest, embedding cache and indexes open their files on first use : point them
+# at a throwaway directory, so a benchmark never writes into (or reads from) the app's .cache/.
+# Import this module before config.py for it to take effect (every benchmark does).
+BENCHMARK_STATE_DIR = tempfile.mkdtemp(prefix="rag-bench-")
+atexit.register(shutil.rmtree, BENCHMARK_STATE_DIR, ignore_errors=True)
+os.environ.update(CHECKPOINT_PATH=os.path.join(BENCHMARK_STATE_DIR, "checkpoints.sqlite3"),
+                  MANIFEST_PATH=os.path.join(BENCHMARK_STATE_DIR, "manifest.sqlite3"),
+                  EMBED_CACHE_PATH=os.path.join(BENCHMARK_STATE_DIR, "embeddings.sqlite3"),
+                  SPARSE_INDEX_DIR=os.path.join(BENCHMARK_STATE_DIR, "sparse_index"),
+                  LOCAL_INDEX_DIR=os.path.join(BENCHMARK_STATE_DIR, "local_index"))
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+from langchain_core.vectorstores import InMemoryVectorStore
+
+
+class StubLLM:
+    '''
+    Mimics a (structured output) chat model : invoke blocks, ainvoke awaits.
+    `respond` builds the return value from the input messages.
+    '''
+    def __init__(self, respond, latency: float):
+        self.respond = respond
+        self.latency = latency
+
+    def invoke(self, messages, config=None, **kwargs):
+        time.sleep(self.latency)
+        return self.respond(messages)
+
+    async def ainvoke(self, messages, config=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self.respond(messages)
+
+
+class StubRetriever:
+    '''Mimics the Pinecone scored search, returns the same k (document, score) pairs for every query.'''
+    def __init__(self, latency: float, k: int = 5, score: float = 0.5):
+        self.latency = latency
+        self.results = [(Document(page_content=f"Benchmark chunk {i} about the query topic."), score) for i in range(k)]
+
+    def similarity_search_with_score(self, query, k=4, filter=None):
+        time.sleep(self.latency)
+        return self.results[:k]
+
+    async def asimilarity_search_with_score(self, query, k=4, filter=None):
+        await asyncio.sleep(self.latency)
+        return self.results[:k]
+
+
+class StubTavily:
+    '''Mimics TavilySearch, returns a fixed result set.'''
+    max_results = 3
+    topic = "general"
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.result = {"results": [{"title": "Stub", "content": "Stub web content.", "url": "https://example.com"}]}
+
+    def invoke(self, payload, config=None, **kwargs):
+        time.sleep(self.latency)
+        return self.result
+
+    async def ainvoke(self, payload, config=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self.result
+
+
+def install_stubs(llm_latency: float = 0.2, retrieval_latency: float = 0.05, web_latency: float = 0.3, route: str = "rag",
+                  retrieval_score: float = 0.5):
+    '''
+    Replaces the module level clients in agent.py with stubs.
+    Returns the agent module so callers can use agent.rag_agent.
+    The default `retrieval_score` falls in the sufficiency gate's uncertain band, so judge_llm still runs.
+    '''
+    import agent
+
+    agent.router_llm = StubLLM(lambda _: agent.RouteDecision(route=route), llm_latency)
+    agent.judge_llm = StubLLM(lambda _: agent.RagJudge(sufficient=True), llm_latency)
+    agent.answer_llm = StubLLM(lambda _: AIMessage(content="Stubbed answer."), llm_latency)
+    agent.rewrite_llm = StubLLM(lambda messages: agent.StandaloneQuery(query=messages[-1][1].rsplit("Latest question: ", 1)[-1]),
+                                llm_latency)
+    agent.summary_llm = StubLLM(lambda _: AIMessage(content="Stubbed summary."), llm_latency)
+    retriever = StubRetriever(retrieval_latency, score=retrieval_score)
+    import vectorstore
+    vectorstore.get_vector_store = agent.get_vector_store = lambda: retriever
+    vectorstore.HYBRID_SEARCH_ENABLED = False # dense only, the local BM25 index would be empty here
+    agent.tavily = StubTavily(web_latency)
+    # repeated benchmark queries would all be web cache hits
+    import web_cache
+    web_cache.WEB_CACHE_ENABLED = False
+    # the semantic cache would answer every repeated benchmark query, measure the full graph instead
+    agent.SEMANTIC_CACHE_ENABLED = False
+    # the benchmarks measure the full router_llm path, and the centroid tier would need OpenAI embeddings
+    import fast_router
+    fast_router.FAST_ROUTER_ENABLED = False
+    return agent
+
+
+# --- deterministic offline backends ---
+_WORDS = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {"the", "a", "an", "is", "are", "what", "how", "do", "does", "of", "to", "in", "on", "for", "and",
+              "about", "me", "tell", "i", "my", "can", "you", "with", "by", "it", "this", "that"}
+_GREETING = re.compile(r"^(hi|hello|hey|thanks|thank you|good (morning|evening))\b", re.I)
+_FRESH = re.compile(r"\b(latest|today|news|current|this week|price|score)\b", re.I)
+_CREATIVE = re.compile(r"^(write|compose|translate|rephrase)\b", re.I)
+
+
+def _content_words(text: str) -> List[str]:
+    return [w for w in _WORDS.findall(text.lower()) if w not in _STOPWORDS]
+
+
+def _text_of(message) -> str:
+    return message[1] if isinstance(message, tuple) else message.content
+
+
+def offline_policy(schema: Optional[type], messages: List[Any]) -> Dict[str, Any] | str:
+    '''
+    What FakeChatModel answers : the structured output fields for `schema`, or the answer text.
+    - RouteDecision   : greetings -> end, "latest / news / today ..." -> web, "write / translate ..." -> answer, else rag
+    - RagJudge        : sufficient when half of the question's content words appear in the retrieved info
+    - StandaloneQuery : the latest question, as is
+    '''
+    last = _text_of(messages[-1])
+    name = getattr(schema, "__name__", "")
+    if name == "RouteDecision":
+        if _GREETING.match(last.strip()):
+            return {"route": "end", "reply": "Hello! How can I help you today?"}
+        if _FRESH.search(last):
+            return {"route": "web", "reply": None}
+        if _CREATIVE.match(last.strip()):
+            return {"route": "answer", "reply": None}
+        return {"route": "rag", "reply": None}
+    if name == "RagJudge":
+        question, _, info = last.partition("Retrieved info:")
+        words = set(_content_words(question.replace("Question:", "").replace("Is this sufficient to answer the question?", "")))
+        found = set(_content_words(info))
+        return {"sufficient": bool(words) and len(words & found) >= len(words) / 2}
+    if name == "StandaloneQuery":
+        return {"query": last.rsplit("Latest question: ", 1)[-1].strip()}
+    question = re.search(r"Question: (.*)", last)
+    subject = question.group(1) if question else last[:80]
+    return f"Offline answer about {subject}. It is generated locally for benchmarking and has no real content."
+
+
+class FakeChatModel(BaseChatModel):
+    '''
+    Deterministic chat model (offline_policy) with a fixed latency. Goes through the real
+    BaseChatModel machinery, so callbacks (token usage), streaming and with_structured_output work.
+    '''
+    latency: float = 0.2
+    structured_schema: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-offline"
+
+    def _reply(self, messages: List[BaseMessage]) -> AIMessage:
+        out = offline_policy(self.structured_schema, messages)
+        content = out if isinstance(out, str) else json.dumps(out)
+        prompt = sum(len(_text_of(m)) for m in messages)
+        usage = {"input_tokens": prompt // 4, "output_tokens": len(content) // 4,
+                 "total_tokens": prompt // 4 + len(content) // 4}
+        return AIMessage(content=content, usage_metadata=usage)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency)
+        for word in re.split(r"(?<= )", self._reply(messages).content):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        for word in re.split(r"(?<= )", self._reply(messages).content):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word))
+
+    def with_structured_output(self, schema, **kwargs):
+        model = self.model_copy(update={"structured_schema": schema})
+        parse = lambda message: schema(**json.loads(message.content))
+        return RunnableLambda(lambda messages: parse(model.invoke(messages)),
+                              afunc=lambda messages: _aparse(model, messages, parse))
+
+
+async def _aparse(model, messages, parse):
+    return parse(await model.ainvoke(messages))
+
+
+class HashEmbeddings(Embeddings):
+    '''Feature-hashed bag of words (signed, L2-normalized) : texts sharing words get similar vectors.'''
+
+    def __init__(self, dim: int = 256, latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+
+    def _vector(self, text: str) -> List[float]:
+        v = np.zeros(self.dim, dtype=np.float32)
+        for word in _content_words(text):
+            h = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+            v[h % self.dim] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = np.linalg.norm(v)
+        return (v / norm if norm else v).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency)
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency)
+        return self._vector(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self.latency)
+        return [self._vector(t) for t in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await asyncio.sleep(self.latency)
+        return self._vector(text)
+
+
+class LatencyVectorStore(InMemoryVectorStore):
+    '''InMemoryVectorStore whose scored search waits `latency` seconds first, like a network round trip.'''
+
+    def __init__(self, embedding: Embeddings, latency: float = 0.05):
+        super().__init__(embedding=embedding)
+        self.latency = latency
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        time.sleep(self.latency)
+        return super().similarity_search_with_score(query, k=k, filter=_as_callable(filter))
+
+    async def asimilarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return super().similarity_search_with_score(query, k=k, filter=_as_callable(filter))
+
+
+def _as_callable(filter):
+    """Pinecone-style dict filter -> the predicate InMemoryVectorStore expects."""
+    if not filter or callable(filter):
+        return filter
+    from local_index import _matches
+    return lambda document: _matches(document.metadata, filter)
+
+
+CORPUS_TOPICS = ["expense report", "vacation policy", "vpn setup", "password reset", "laptop refresh",
+                 "travel booking", "security training", "parental leave", "office access", "payroll calendar",
+                 "diabetes treatment", "quantum computing", "solar panels", "river ecology", "bread baking"]
+
+
+def offline_corpus(chunks_per_topic: int = 20) -> List[Document]:
+    """Deterministic knowledge base : a few chunks per topic, each naming its topic."""
+    documents = []
+    for t, topic in enumerate(CORPUS_TOPICS):
+        for i in range(chunks_per_topic):
+            text = (f"{topic.capitalize()} guide, section {i}. This section explains the {topic} procedure, "
+                    f"who is eligible, the steps to follow and common questions about {topic}.")
+            documents.append(Document(page_content=text, metadata={"document_id": f"doc-{t}", "start_index": i * 200}))
+    return documents
+
+
+class FakeTavily:
+    '''Deterministic TavilySearch : results echo the query, after `latency` seconds.'''
+    max_results = 3
+    topic = "general"
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def _results(self, payload) -> dict:
+        query = payload["query"] if isinstance(payload, dict) else str(payload)
+        return {"results": [{"title": f"Result {i} for {query}", "content": f"Fresh web information {i} about {query}.",
+                             "url": f"https://example.com/{i}"} for i in range(self.max_results)]}
+
+    def invoke(self, payload, config=None, **kwargs):
+        time.sleep(self.latency)
+        return self._results(payload)
+
+    async def ainvoke(self, payload, config=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._results(payload)
+
+
+def install_offline_backends(llm_latency: float = 0.2, retrieval_latency: float = 0.05, web_latency: float = 0.3,
+                             embed_latency: float = 0.0, caches: bool = False):
+    '''
+    Replaces every external client with a deterministic offline stand-in : Groq -> FakeChatModel,
+    OpenAI embeddings -> HashEmbeddings (behind a CachedEmbeddings), Pinecone -> LatencyVectorStore over offline_corpus(),
+    Tavily -> FakeTavily. With `caches` the semantic / web caches and the fast router stay on
+    (fed by the hash embedder), otherwise every query runs the full graph.
+    Returns the agent module.
+    '''
+    import agent
+    import vectorstore
+    import fast_router
+    import semantic_cache
+    import web_cache
+    from telemetry import token_usage
+    from embedding_cache import CachedEmbeddings
+
+    def model(latency):
+        return FakeChatModel(latency=latency, callbacks=[token_usage])
+
+    agent.router_llm = model(llm_latency).with_structured_output(agent.RouteDecision)
+    agent.judge_llm = model(llm_latency).with_structured_output(agent.RagJudge)
+    agent.answer_llm = model(llm_latency)
+    agent.rewrite_llm = model(llm_latency).with_structured_output(agent.StandaloneQuery)
+    agent.summary_llm = model(llm_latency)
+
+    # memory-only embedding cache as in production, so repeated texts skip the (simulated) model
+    embedder = CachedEmbeddings(HashEmbeddings(latency=embed_latency), model_name="offline-hash")
+    store = LatencyVectorStore(embedder, latency=retrieval_latency)
+    store.add_documents(offline_corpus())
+    vectorstore.get_vector_store = agent.get_vector_store = lambda: store
+    vectorstore.HYBRID_SEARCH_ENABLED = False # dense only, the local BM25 index holds the real corpus
+    agent.tavily = FakeTavily(web_latency)
+
+    semantic_cache.semantic_cache.embedder = embedder
+    fast_router.fast_router.embedder = embedder
+    agent.SEMANTIC_CACHE_ENABLED = caches
+    web_cache.WEB_CACHE_ENABLED = caches
+    fast_router.FAST_ROUTER_ENABLED = caches
+    fast_router.FAST_ROUTER_CENTROID_ENABLED = caches
+    return agent
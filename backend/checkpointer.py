@@ -0,0 +1,292 @@
+'''
+Disk-backed LangGraph checkpointer : SQLite (WAL), shared by every worker pointing at the same file.
+
+Replaces MemorySaver, which kept every session and every intermediate state in RAM forever.
+What is bounded :
+- history    : only the latest checkpoint of a thread is kept (older ones and their writes are deleted)
+- messages   : stored history is trimmed to the last `max_messages` messages, but never inside the
+               HISTORY_MAX_TOKENS window contextualize_node keeps (older turns are folded into
+               `summary` there first), and always starting on a user message
+- context    : large retrieved-context fields (rag / web) are cut to `max_context_chars`,
+               they are only needed inside the turn that produced them
+- sessions   : threads idle for longer than `ttl_seconds` expire, and the least recently used ones
+               are evicted beyond `max_sessions` (swept at most every `sweep_interval` seconds)
+'''
+import os
+import time
+import random
+import sqlite3
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import BaseMessage
+from langchain_core.messages.utils import trim_messages, count_tokens_approximately
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (BaseCheckpointSaver, ChannelVersions, Checkpoint, CheckpointMetadata,
+                                       CheckpointTuple, WRITES_IDX_MAP, get_checkpoint_id, get_checkpoint_metadata)
+
+from config import (CHECKPOINT_PATH, CHECKPOINT_TTL_SECONDS, CHECKPOINT_MAX_SESSIONS,
+                    CHECKPOINT_MAX_MESSAGES, CHECKPOINT_MAX_CONTEXT_CHARS, HISTORY_MAX_TOKENS)
+from clients import LazyClient, register
+from telemetry import log
+
+# state fields holding retrieved context, compacted before they are written
+_CONTEXT_FIELDS = ("rag", "web")
+
+
+class SQLiteCheckpointer(BaseCheckpointSaver):
+
+    def __init__(self, path: str = CHECKPOINT_PATH, ttl_seconds: float = CHECKPOINT_TTL_SECONDS,
+                 max_sessions: int = CHECKPOINT_MAX_SESSIONS, max_messages: int = CHECKPOINT_MAX_MESSAGES,
+                 max_context_chars: int = CHECKPOINT_MAX_CONTEXT_CHARS, history_max_tokens: int = HISTORY_MAX_TOKENS,
+                 sweep_interval: float = 60.0):
+        super().__init__()
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self.max_context_chars = max_context_chars
+        self.history_max_tokens = history_max_tokens
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0.0
+        self._lock = threading.Lock()
+        # LangGraph type-checks the checkpointer, so only its connection is lazy
+        self.connection = LazyClient("checkpointer", self._connect)
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """The SQLite connection, opened on first use (or by the lifespan warm-up) rather than at import."""
+        return self.connection.get()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL,
+                checkpoint_id TEXT NOT NULL,
+                parent_id TEXT,
+                type TEXT,
+                checkpoint BLOB,
+                metadata_type TEXT,
+                metadata BLOB,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id));
+            CREATE TABLE IF NOT EXISTS writes (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL,
+                checkpoint_id TEXT NOT NULL,
+                task_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                channel TEXT,
+                type TEXT,
+                value BLOB,
+                task_path TEXT,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx));
+            CREATE TABLE IF NOT EXISTS sessions (
+                thread_id TEXT PRIMARY KEY,
+                last_access REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access);
+        """)
+        conn.commit()
+        return conn
+
+    # --- compaction ---
+    def _trim_messages(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        '''
+        The last `max_messages` messages, extended back to the start of the token window contextualize_node
+        keeps (those turns are not in `summary` yet), both cut on a user message so the history doesn't
+        open on an assistant reply.
+        '''
+        by_count = trim_messages(messages, max_tokens=self.max_messages, token_counter=len,
+                                 strategy="last", start_on="human")
+        by_tokens = trim_messages(messages, max_tokens=self.history_max_tokens, token_counter=count_tokens_approximately,
+                                  strategy="last", start_on="human", allow_partial=False)
+        kept = by_count if len(by_count) >= len(by_tokens) else by_tokens
+        return kept or messages # no user message to start on : keep everything rather than an empty history
+
+    def _compact(self, checkpoint: Checkpoint) -> Checkpoint:
+        values = dict(checkpoint.get("channel_values") or {})
+        messages = values.get("messages")
+        if isinstance(messages, list) and self.max_messages and len(messages) > self.max_messages:
+            values["messages"] = self._trim_messages(messages)
+        for field in _CONTEXT_FIELDS:
+            text = values.get(field)
+            if isinstance(text, str) and len(text) > self.max_context_chars:
+                values[field] = text[:self.max_context_chars] + " ...[truncated]"
+        if values.get("rag_chunks"):
+            values["rag_chunks"] = [] # per-turn, `rag` keeps the (truncated) text
+        return {**checkpoint, "channel_values": values}
+
+    # --- sessions (caller holds the lock) ---
+    def _touch(self, thread_id: str, now: float):
+        self._conn.execute("INSERT INTO sessions (thread_id, last_access) VALUES (?, ?) "
+                           "ON CONFLICT(thread_id) DO UPDATE SET last_access = excluded.last_access", (thread_id, now))
+
+    def _delete_threads(self, thread_ids: Sequence[str]):
+        for table in ("checkpoints", "writes", "sessions"):
+            self._conn.executemany(f"DELETE FROM {table} WHERE thread_id = ?", [(t,) for t in thread_ids])
+
+    def _sweep(self, now: float):
+        # several workers share the file, jitter so they don't all sweep at the same moment
+        if now - self._last_sweep < self.sweep_interval * random.uniform(0.5, 1.0):
+            return
+        self._last_sweep = now
+        expired = [r[0] for r in self._conn.execute("SELECT thread_id FROM sessions WHERE last_access < ?",
+                                                    (now - self.ttl_seconds,))]
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()
+        excess = count - len(expired) - self.max_sessions
+        if excess > 0:
+            expired += [r[0] for r in self._conn.execute(
+                "SELECT thread_id FROM sessions WHERE last_access >= ? ORDER BY last_access LIMIT ?",
+                (now - self.ttl_seconds, excess))]
+        if expired:
+            self._delete_threads(expired)
+            log(f"Checkpointer evicted {len(expired)} sessions (TTL / LRU).")
+
+    # --- reads ---
+    def _row_to_tuple(self, thread_id: str, checkpoint_ns: str, row) -> CheckpointTuple:
+        checkpoint_id, parent_id, type_, checkpoint, metadata_type, metadata = row
+        writes = self._conn.execute(
+            "SELECT task_id, channel, type, value FROM writes WHERE thread_id = ? AND checkpoint_ns = ? "
+            "AND checkpoint_id = ? ORDER BY task_id, idx", (thread_id, checkpoint_ns, checkpoint_id)).fetchall()
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint=self.serde.loads_typed((type_, checkpoint)),
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config=({"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id}}
+                           if parent_id else None),
+            pending_writes=[(task_id, channel, self.serde.loads_typed((t, v))) for task_id, channel, t, v in writes],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        query = ("SELECT checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata FROM checkpoints "
+                 "WHERE thread_id = ? AND checkpoint_ns = ?")
+        params: Tuple[Any, ...] = (thread_id, checkpoint_ns)
+        if checkpoint_id := get_checkpoint_id(config):
+            query += " AND checkpoint_id = ?"
+            params += (checkpoint_id,)
+        query += " ORDER BY checkpoint_id DESC LIMIT 1"
+        with self._lock:
+            row = self._conn.execute(query, params).fetchone()
+            if row is None:
+                return None
+            with self._conn:
+                self._touch(thread_id, time.time())
+            return self._row_to_tuple(thread_id, checkpoint_ns, row)
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        query = ("SELECT thread_id, checkpoint_ns, checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata "
+                 "FROM checkpoints WHERE 1 = 1")
+        params: Tuple[Any, ...] = ()
+        if config:
+            query += " AND thread_id = ?"
+            params += (config["configurable"]["thread_id"],)
+            if "checkpoint_ns" in config["configurable"]:
+                query += " AND checkpoint_ns = ?"
+                params += (config["configurable"]["checkpoint_ns"],)
+            if checkpoint_id := get_checkpoint_id(config):
+                query += " AND checkpoint_id = ?"
+                params += (checkpoint_id,)
+        if before and (before_id := get_checkpoint_id(before)):
+            query += " AND checkpoint_id < ?"
+            params += (before_id,)
+        query += " ORDER BY checkpoint_id DESC"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+            tuples = [self._row_to_tuple(r[0], r[1], r[2:]) for r in rows]
+        for t in tuples:
+            if filter and not all(t.metadata.get(k) == v for k, v in filter.items()):
+                continue
+            if limit is not None:
+                if limit <= 0:
+                    break
+                limit -= 1
+            yield t
+
+    # --- writes ---
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        type_, blob = self.serde.dumps_typed(self._compact(checkpoint))
+        metadata_type, metadata_blob = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        now = time.time()
+        with self._lock:
+            with self._conn: # one transaction
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_id, type, "
+                    "checkpoint, metadata_type, metadata) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                     type_, blob, metadata_type, metadata_blob))
+                # keep only the latest checkpoint of the thread
+                self._conn.execute("DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+                                   (thread_id, checkpoint_ns, checkpoint["id"]))
+                self._conn.execute("DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id < ?",
+                                   (thread_id, checkpoint_ns, checkpoint["id"]))
+                self._touch(thread_id, now)
+                self._sweep(now)
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                   task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = {"INSERT OR REPLACE": [], "INSERT OR IGNORE": []}
+        for idx, (channel, value) in enumerate(writes):
+            type_, blob = self.serde.dumps_typed(value)
+            # special writes (errors, interrupts) overwrite, regular ones are written once
+            verb = "INSERT OR REPLACE" if channel in WRITES_IDX_MAP else "INSERT OR IGNORE"
+            rows[verb].append((thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx),
+                               channel, type_, blob, task_path))
+        with self._lock:
+            with self._conn:
+                for verb, verb_rows in rows.items():
+                    self._conn.executemany(
+                        f"{verb} INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, "
+                        "value, task_path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", verb_rows)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            with self._conn:
+                self._delete_threads([thread_id])
+
+    # --- async : SQLite calls are short, run them on a worker thread ---
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        tuples = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for t in tuples:
+            yield t
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            (sessions,) = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()
+            (checkpoints,) = self._conn.execute("SELECT COUNT(*) FROM checkpoints").fetchone()
+        return {"sessions": sessions, "checkpoints": checkpoints}
+
+
+# process-wide checkpointer used by build_agent, its file is opened by the warm-up or on first use
+checkpointer = SQLiteCheckpointer()
+register(checkpointer.connection)
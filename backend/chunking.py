@@ -0,0 +1,276 @@
+'''
+Token sized, structure-aware chunking (vectorstore.text_splitter with CHUNKER=token).
+
+The former RecursiveCharacterTextSplitter(1000, 200) measured characters : depending on the text a
+chunk was 150 to 400 tokens, so the k=5 context size varied widely, and the fixed 200 character
+overlap was embedded twice (about 20% of the embedding spend).
+
+TokenChunker sizes chunks in tokens and cuts them at the strongest boundary available :
+
+    page break (5) > heading (4) > paragraph (3) > line / sentence end (2) > word (1)
+
+A chunk ends at the boundary of the best `strength + 2 * fill` in [CHUNK_MIN_TOKENS, CHUNK_TOKENS]
+(fill = share of the token budget used), so a heading or page break ends a chunk early and a
+sentence end near the budget is preferred to a paragraph break after a few lines.
+
+Overlap strategies (CHUNK_OVERLAP, at most CHUNK_OVERLAP_TOKENS) :
+- none     : chunks don't overlap
+- tokens   : the next chunk starts CHUNK_OVERLAP_TOKENS back, at a word boundary
+- sentence : the next chunk repeats the last whole sentences that fit (none if the last sentence is longer)
+Never across a heading or page break : the next section starts clean.
+
+Everything is vectorized with NumPy over the code points of the text : boundary strengths, and a
+cumulative token count per character, either
+- approx   : a vectorized estimate of cl100k BPE pieces (letter runs of up to 6, digit runs of up to 3,
+             every punctuation mark), within a few % of tiktoken on English prose
+- tiktoken : exact token offsets of the OpenAI embedding model's tokenizer (slower, needs tiktoken)
+The Python loop runs once per chunk, not per character. Long texts are processed in blocks of
+`block_chars`, so memory stays bounded on multi-GB inputs.
+'''
+import re
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from config import CHUNKER, CHUNK_TOKENS, CHUNK_MIN_TOKENS, CHUNK_OVERLAP_TOKENS, CHUNK_OVERLAP, CHUNK_TOKENIZER
+
+# the former character splitter, CHUNKER=recursive
+LEGACY_CHUNK_SIZE = 1000
+LEGACY_CHUNK_OVERLAP = 200
+
+OVERLAP_STRATEGIES = ("none", "tokens", "sentence")
+WORD, SENTENCE, PARAGRAPH, HEADING, PAGE = 1, 2, 3, 4, 5
+_FILL_WEIGHT = 2.0
+
+# markdown headings, short numbered titles ("2.1 Leave policy"), short all caps lines
+_HEADING_PATTERN = re.compile(r"^[ \t]*(?:#{1,6}[ \t]+\S[^\n]*|(?:\d+\.)*\d+\.?[ \t]+[A-Z][^\n.]{0,78}|[A-Z][A-Z0-9 ,:&'()/-]{2,79})[ \t]*$",
+                              re.MULTILINE)
+_SPACE_CODES = np.array([9, 10, 11, 12, 13, 32, 0xA0], dtype=np.uint32)
+_IS_SPACE = np.zeros(257, dtype=bool)
+_IS_SPACE[_SPACE_CODES] = True
+_SENTENCE_END_CODES = np.array([ord(c) for c in ".!?"], dtype=np.uint32)
+_CJK_START = 0x2E80 # CJK and later scripts : about one token per character
+
+
+def _code_points(text: str) -> np.ndarray:
+    return np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+
+
+def _spaces(cp: np.ndarray) -> np.ndarray:
+    return _IS_SPACE[np.minimum(cp, 256)]
+
+
+# character class for the token estimate : 0 space, 1 letter, 2 digit, 3 anything else (one token each)
+_CLASS = np.full(129, 3, dtype=np.int8)
+_CLASS[[*range(65, 91), *range(97, 123), 128]] = 1 # 128 stands for every non ASCII code point
+_CLASS[48:58] = 2
+_CLASS[_SPACE_CODES[_SPACE_CODES < 128]] = 0
+
+
+def _approx_token_starts(cp: np.ndarray, space: np.ndarray) -> np.ndarray:
+    """Boolean per character : an (estimated) cl100k token starts here."""
+    cls = _CLASS[np.minimum(cp, 128)]
+    cls[space] = 0
+    cls[cp >= _CJK_START] = 3
+    prev = np.empty_like(cls)
+    prev[0], prev[1:] = 0, cls[:-1]
+    starts = (cls != 0) & ((cls != prev) | (cls == 3))
+    # BPE splits long words / numbers : one more token every 6 letters, every 3 digits
+    index = np.arange(len(cp), dtype=np.int32)
+    offset = index - np.maximum.accumulate(np.where(starts, index, 0))
+    for kind, every in ((1, 6), (2, 3)):
+        long = np.flatnonzero((offset >= every) & (cls == kind))
+        starts[long[offset[long] % every == 0]] = True
+    return starts
+
+
+class TokenChunker:
+    '''
+    Splits text into chunks of at most `chunk_tokens` tokens, see the module docstring.
+    Same interface as the LangChain splitters used here : split_text / create_documents, with
+    `start_index` metadata (offset of the chunk in the text).
+    '''
+
+    def __init__(self, chunk_tokens: int = CHUNK_TOKENS, min_tokens: int = CHUNK_MIN_TOKENS,
+                 overlap_tokens: int = CHUNK_OVERLAP_TOKENS, overlap: str = CHUNK_OVERLAP,
+                 tokenizer: str = CHUNK_TOKENIZER, block_chars: int = 4_000_000):
+        if overlap not in OVERLAP_STRATEGIES:
+            raise ValueError(f"Unknown overlap strategy '{overlap}', choose one of {list(OVERLAP_STRATEGIES)}.")
+        self.chunk_tokens = chunk_tokens
+        self.min_tokens = min(min_tokens, chunk_tokens)
+        self.overlap_tokens = overlap_tokens if overlap != "none" else 0
+        self.overlap = overlap
+        self.tokenizer = tokenizer
+        self.block_chars = block_chars
+        self._encoding = None
+        if tokenizer == "tiktoken":
+            import tiktoken
+            self._encoding = tiktoken.get_encoding("cl100k_base") # text-embedding-3-* tokenizer
+        elif tokenizer != "approx":
+            raise ValueError(f"Unknown tokenizer '{tokenizer}', choose 'approx' or 'tiktoken'.")
+
+    @property
+    def max_chars(self) -> int:
+        """Upper estimate of the characters one chunk spans (the streaming ingestion buffers two)."""
+        return self.chunk_tokens * 8
+
+    # --- analysis of one block ---
+    def _cumulative_tokens(self, text: str, cp: np.ndarray, space: np.ndarray) -> np.ndarray:
+        '''cum[i] = tokens in text[:i], length len(text) + 1.'''
+        weights = np.zeros(len(cp) + 1, dtype=np.int32)
+        if self._encoding is not None:
+            _, offsets = self._encoding.decode_with_offsets(self._encoding.encode_ordinary(text))
+            np.add.at(weights, np.asarray(offsets, dtype=np.int64) + 1, 1)
+        else:
+            weights[1:] = _approx_token_starts(cp, space)
+        return np.cumsum(weights)
+
+    def _boundary_strengths(self, text: str, cp: np.ndarray, space: np.ndarray,
+                            page_breaks: Sequence[int]) -> np.ndarray:
+        '''strength[i] > 0 when a chunk may start / end at i, see the module docstring.'''
+        n = len(cp)
+        strength = np.zeros(n + 1, dtype=np.int8)
+        if n == 0:
+            return strength
+        prev_space = np.empty(n, dtype=bool)
+        prev_space[0], prev_space[1:] = True, space[:-1]
+        word_starts = np.flatnonzero(~space & prev_space)
+        # the whitespace run before every word : newlines and form feeds in it, and the character before it
+        run_starts = np.flatnonzero(space & ~prev_space)
+        if not space[0]:
+            run_starts = np.concatenate([[0], run_starts])
+        gap_begin = run_starts[np.maximum(run_starts.searchsorted(word_starts, side="right") - 1, 0)]
+        gap_begin = np.minimum(gap_begin, word_starts)
+        def in_gap(code):
+            at = np.flatnonzero(cp == code)
+            return at.searchsorted(word_starts) - at.searchsorted(gap_begin)
+        gap_newlines = in_gap(10)
+        before = cp[np.maximum(gap_begin - 1, 0)]
+        level = np.full(len(word_starts), WORD, dtype=np.int8)
+        level[np.isin(before, _SENTENCE_END_CODES) | (gap_newlines >= 1)] = SENTENCE
+        level[gap_newlines >= 2] = PARAGRAPH
+        level[in_gap(12) > 0] = PAGE
+        strength[word_starts] = level
+        for match in _HEADING_PATTERN.finditer(text):
+            start = match.start() + len(match.group()) - len(match.group().lstrip())
+            strength[start] = max(strength[start], HEADING)
+        for offset in page_breaks:
+            if 0 <= offset < n:
+                strength[offset] = PAGE
+        strength[n] = PAGE
+        return strength
+
+    # --- chunking ---
+    def _next_start(self, start: int, end: int, cum: np.ndarray, positions: np.ndarray,
+                    levels: np.ndarray, tokens_at: np.ndarray) -> int:
+        """Start of the chunk after [start, end) : end, or earlier by the overlap."""
+        if not self.overlap_tokens:
+            return end
+        first = int(positions.searchsorted(start, side="right"))
+        last = int(positions.searchsorted(end, side="left"))
+        if last < len(positions) and positions[last] == end and levels[last] >= HEADING:
+            return end
+        lo = max(first, int(tokens_at.searchsorted(cum[end] - self.overlap_tokens, side="left")))
+        if lo >= last:
+            return end
+        window = levels[lo:last]
+        hard = np.flatnonzero(window >= HEADING)
+        if len(hard): # never overlap across a heading or page break
+            lo += int(hard[-1])
+            window = levels[lo:last]
+        needed = SENTENCE if self.overlap == "sentence" else WORD
+        candidates = np.flatnonzero(window >= needed)
+        return int(positions[lo + candidates[0]]) if len(candidates) else end
+
+    def _block_spans(self, cum: np.ndarray, strength: np.ndarray, final: bool) -> Iterator[Tuple[int, Optional[int]]]:
+        '''
+        (start, end) of every chunk of a block. Without `final`, the chunk that would reach the end
+        of the block is yielded as (start, None) and the block stops there : it needs the next block.
+        '''
+        n = len(strength) - 1
+        positions = np.flatnonzero(strength)
+        levels = strength[positions]
+        tokens_at = cum[positions]
+        start = 0
+        while start < n:
+            budget_end = int(cum.searchsorted(cum[start] + self.chunk_tokens, side="right")) - 1
+            if budget_end >= n:
+                if not final:
+                    yield start, None
+                    return
+                end = n
+            else:
+                lo = positions.searchsorted(max(start + 1, int(cum.searchsorted(cum[start] + self.min_tokens))))
+                hi = positions.searchsorted(budget_end, side="right")
+                if lo < hi:
+                    fill = (tokens_at[lo:hi] - cum[start]) / self.chunk_tokens
+                    end = int(positions[lo + np.argmax(levels[lo:hi] + _FILL_WEIGHT * fill)])
+                else: # no boundary within the budget (one very long word) : hard cut
+                    end = max(budget_end, start + 1)
+            yield start, end
+            if end >= n:
+                return
+            start = max(self._next_start(start, end, cum, positions, levels, tokens_at), start + 1)
+
+    def split_spans(self, text: str, page_breaks: Iterable[int] = ()) -> Iterator[Tuple[int, int]]:
+        '''(start, end) character offsets of the chunks, before whitespace trimming.'''
+        page_breaks = sorted(page_breaks)
+        base, n = 0, len(text)
+        while base < n:
+            block_end = min(n, base + self.block_chars)
+            block = text[base:block_end]
+            cp = _code_points(block)
+            space = _spaces(cp)
+            cum = self._cumulative_tokens(block, cp, space)
+            strength = self._boundary_strengths(block, cp, space, [p - base for p in page_breaks if base <= p < block_end])
+            pending = None
+            for start, end in self._block_spans(cum, strength, final=block_end == n):
+                if end is None:
+                    pending = start
+                else:
+                    yield base + start, base + end
+            if pending is None:
+                return
+            # the next block starts with the chunk that didn't fit in this one
+            base += pending if pending > 0 else self.block_chars // 2
+
+    def _chunks(self, text: str, page_breaks: Iterable[int] = ()) -> Iterator[Tuple[int, str]]:
+        for start, end in self.split_spans(text, page_breaks):
+            piece = text[start:end]
+            stripped = piece.strip()
+            if stripped:
+                yield start + len(piece) - len(piece.lstrip()), stripped
+
+    def split_text(self, text: str) -> List[str]:
+        return [chunk for _, chunk in self._chunks(text)]
+
+    def create_documents(self, texts: List[str], metadatas: Optional[List[dict]] = None,
+                         page_breaks: Optional[Iterable[int]] = None) -> List[Document]:
+        '''
+        One Document per chunk, metadata + {"start_index"}. `page_breaks` (offsets in the text,
+        only with a single text) are the strongest boundaries, used by the streaming ingestion.
+        '''
+        documents = []
+        for i, text in enumerate(texts):
+            metadata = metadatas[i] if metadatas else {}
+            for start, chunk in self._chunks(text, page_breaks or ()):
+                documents.append(Document(page_content=chunk, metadata={**metadata, "start_index": start}))
+        return documents
+
+    def count_tokens(self, text: str) -> int:
+        if self._encoding is not None:
+            return len(self._encoding.encode_ordinary(text))
+        cp = _code_points(text)
+        return int(_approx_token_starts(cp, _spaces(cp)).sum())
+
+
+def build_splitter(kind: str = CHUNKER):
+    '''The configured splitter : "token" (TokenChunker) or "recursive" (the former 1000 / 200 character splitter).'''
+    if kind == "token":
+        return TokenChunker()
+    if kind == "recursive":
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+        return RecursiveCharacterTextSplitter(chunk_size=LEGACY_CHUNK_SIZE, chunk_overlap=LEGACY_CHUNK_OVERLAP,
+                                              add_start_index=True)
+    raise ValueError(f"Unknown CHUNKER '{kind}', choose 'token' or 'recursive'.")
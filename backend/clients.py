@@ -0,0 +1,110 @@
+'''
+Lazily built external clients (Groq models, Tavily, OpenAI embeddings) and local stores
+(document manifest, embedding cache, checkpointer : SQLite files opened on first use, not at import).
+
+Importing the app used to construct every client, and import their SDKs, at module import :
+slow cold starts for every uvicorn worker, and a missing API key crashed the import.
+A LazyClient stands in for the client under the same module-level name and builds it on first
+use (attribute access, e.g. router_llm.ainvoke), so the heavy SDK imports happen there too.
+Construction errors are not cached : the next use tries again.
+
+main.py's lifespan calls warm_up() in the background, so the first request doesn't pay for it,
+and GET /ready reports readiness() (separate from the /health liveness check).
+'''
+import time
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+
+class LazyClient:
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self._name = name
+        self._factory = factory
+        self._client = None
+        self._error: Optional[str] = None
+        self._build_seconds: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Any:
+        if self._client is None:
+            with self._lock:
+                if self._client is None: # another thread may have built it while we waited
+                    start = time.perf_counter()
+                    try:
+                        self._client = self._factory()
+                    except Exception as e:
+                        self._error = f"{type(e).__name__}: {e}"
+                        raise
+                    self._error = None
+                    self._build_seconds = time.perf_counter() - start
+        return self._client
+
+    # the Runnable entry points are defined on the proxy : LangGraph inspects the node functions
+    # (getattr on the names they use) when the graph is compiled, that must not build the clients
+    def invoke(self, *args, **kwargs):
+        return self.get().invoke(*args, **kwargs)
+
+    async def ainvoke(self, *args, **kwargs):
+        return await self.get().ainvoke(*args, **kwargs)
+
+    def batch(self, *args, **kwargs):
+        return self.get().batch(*args, **kwargs)
+
+    async def abatch(self, *args, **kwargs):
+        return await self.get().abatch(*args, **kwargs)
+
+    def stream(self, *args, **kwargs):
+        return self.get().stream(*args, **kwargs)
+
+    def astream(self, *args, **kwargs):
+        return self.get().astream(*args, **kwargs)
+
+    def __getattr__(self, attribute: str):
+        # only called for attributes the proxy doesn't have : everything else of the real client
+        return getattr(self.get(), attribute)
+
+    def status(self) -> Dict[str, Any]:
+        if self._client is not None:
+            return {"ready": True, "build_ms": round(self._build_seconds * 1000, 1)}
+        return {"ready": False, "error": self._error}
+
+    def __repr__(self):
+        return f"LazyClient({self._name!r}, built={self._client is not None})"
+
+
+_registry: List[LazyClient] = []
+
+
+def register(client: LazyClient) -> LazyClient:
+    """Adds an existing LazyClient to warm_up() / readiness()."""
+    _registry.append(client)
+    return client
+
+
+def lazy_client(name: str, factory: Callable[[], Any]) -> LazyClient:
+    """A LazyClient registered for warm_up() / readiness()."""
+    return register(LazyClient(name, factory))
+
+
+def require_key(name: str, value: Optional[str]) -> str:
+    """The API key, or a clear error when it is missing (raised on first use, not at import)."""
+    if not value:
+        raise RuntimeError(f"{name} is not set")
+    return value
+
+
+def warm_up() -> Dict[str, Optional[str]]:
+    '''Builds every registered client. Blocking. Returns {name: error or None}, never raises.'''
+    errors = {}
+    for client in _registry:
+        try:
+            client.get()
+            errors[client._name] = None
+        except Exception as e:
+            errors[client._name] = f"{type(e).__name__}: {e}"
+    return errors
+
+
+def readiness() -> Dict[str, Dict[str, Any]]:
+    return {client._name: client.status() for client in _registry}
@@ -8,6 +8,109 @@ PINECONE_ENVIRONMENT = os.getenv("PINECONE_ENVIRONMENT", "us-east-1")
 PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "rag-index")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
+# vector store backend : "pinecone" (managed) or "local" (memory-mapped NumPy index, see local_index.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", ".cache/local_index")
+LOCAL_INDEX_MODE = os.getenv("LOCAL_INDEX_MODE", "exact") # "exact" or "ivf" (approximate, for large corpora)
+LOCAL_INDEX_IVF_LISTS = int(os.getenv("LOCAL_INDEX_IVF_LISTS", "0")) # 0 = sqrt(number of vectors)
+LOCAL_INDEX_IVF_NPROBE = int(os.getenv("LOCAL_INDEX_IVF_NPROBE", "8"))
+# size of the HTTP connection pool used for Pinecone data-plane calls (query / upsert)
+PINECONE_POOL_THREADS = int(os.getenv("PINECONE_POOL_THREADS", "8"))
+# embedding cache : number of vectors kept in memory, and SQLite file for the disk tier (empty string disables it)
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "10000"))
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", ".cache/embeddings.sqlite3")
+# streaming ingestion : chunks per embed/upsert batch, and how many batches may be in flight at once
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+INGEST_MAX_INFLIGHT_UPSERTS = int(os.getenv("INGEST_MAX_INFLIGHT_UPSERTS", "4"))
+# chunking (see chunking.py) : "recursive" (the 1000 / 200 character splitter) or "token" (token sized,
+# structure-aware), chunk size bounds in tokens, overlap in tokens and its strategy ("none", "tokens",
+# "sentence"), and the token counter ("approx" vectorized estimate or "tiktoken" exact).
+# Switching CHUNKER changes every chunk ID : existing documents are re-embedded on their next upload and
+# their old chunks deleted, until then they keep the old chunking. Re-upload the corpus (or start from an
+# empty index) when switching.
+CHUNKER = os.getenv("CHUNKER", "recursive").lower()
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "256"))
+CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", "64"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+CHUNK_OVERLAP = os.getenv("CHUNK_OVERLAP", "sentence").lower()
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", "approx").lower()
+# PDF text extraction (see pdf_extract.py) : worker processes (0 = one per core), pages per shard handed to
+# a worker, and the page count below which the PDF is parsed in the calling process
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", "0"))
+PDF_PAGES_PER_SHARD = int(os.getenv("PDF_PAGES_PER_SHARD", "16"))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "32"))
+# background ingestion jobs : PDFs processed at the same time, and how many more may wait in the queue
+INGEST_MAX_CONCURRENT_JOBS = int(os.getenv("INGEST_MAX_CONCURRENT_JOBS", "2"))
+INGEST_MAX_QUEUED_JOBS = int(os.getenv("INGEST_MAX_QUEUED_JOBS", "16"))
+# SQLite file recording which chunk IDs every document owns (deduplicating re-uploads)
+MANIFEST_PATH = os.getenv("MANIFEST_PATH", ".cache/manifest.sqlite3")
+# semantic response cache in front of the agent : cosine similarity needed for a hit, entry lifetime, size
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "3600"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2000"))
+# speculative execution : start retrieval (and optionally web search) concurrently with the router LLM
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "false").lower() == "true"
+SPECULATIVE_WEB_SEARCH = os.getenv("SPECULATIVE_WEB_SEARCH", "false").lower() == "true"
+# fast-path router : rules decide small talk without router_llm. The embedding centroid tier (rag / web only)
+# is off until calibrated : its confidence is the similarity margin between the best and second best route
+# centroid, pick it with benchmarks/calibrate_fast_router.py, then set FAST_ROUTER_CENTROID_ENABLED=true
+FAST_ROUTER_ENABLED = os.getenv("FAST_ROUTER_ENABLED", "true").lower() == "true"
+FAST_ROUTER_CENTROID_ENABLED = os.getenv("FAST_ROUTER_CENTROID_ENABLED", "false").lower() == "true"
+FAST_ROUTER_CONFIDENCE = float(os.getenv("FAST_ROUTER_CONFIDENCE", "0.1"))
+# retrieval sufficiency gate : top similarity >= SUFFICIENT -> answer, < INSUFFICIENT -> not enough,
+# in between judge_llm decides. Optional local cross-encoder (sentence-transformers model name) rescoring the chunks,
+# the thresholds then apply to its sigmoid scores. The defaults are deliberately conservative (cosine scores
+# depend on the embedding model and the corpus) : only near-verbatim matches skip the judge as sufficient and
+# only unrelated chunks as insufficient, the wide band between goes to judge_llm. Tighten them on your own
+# queries with benchmarks/calibrate_rag_gate.py
+RAG_GATE_ENABLED = os.getenv("RAG_GATE_ENABLED", "true").lower() == "true"
+RAG_GATE_SUFFICIENT = float(os.getenv("RAG_GATE_SUFFICIENT", "0.85"))
+RAG_GATE_INSUFFICIENT = float(os.getenv("RAG_GATE_INSUFFICIENT", "0.15"))
+RAG_GATE_CROSS_ENCODER = os.getenv("RAG_GATE_CROSS_ENCODER", "")
+# conversation checkpoints (SQLite, shared by all workers) : session idle TTL, max sessions (LRU),
+# messages kept per session, and max characters kept of the retrieved rag / web context
+CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", ".cache/checkpoints.sqlite3")
+CHECKPOINT_TTL_SECONDS = float(os.getenv("CHECKPOINT_TTL_SECONDS", "86400"))
+CHECKPOINT_MAX_SESSIONS = int(os.getenv("CHECKPOINT_MAX_SESSIONS", "10000"))
+CHECKPOINT_MAX_MESSAGES = int(os.getenv("CHECKPOINT_MAX_MESSAGES", "20"))
+CHECKPOINT_MAX_CONTEXT_CHARS = int(os.getenv("CHECKPOINT_MAX_CONTEXT_CHARS", "2000"))
+# conversation window kept in state (approximate tokens, older turns are summarized),
+# and rewriting follow-up questions into standalone queries before retrieval
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "1000"))
+QUERY_REWRITE_ENABLED = os.getenv("QUERY_REWRITE_ENABLED", "true").lower() == "true"
+# hybrid retrieval : local BM25 index (see sparse_index.py) fused with the dense results by reciprocal rank fusion
+# HYBRID_CANDIDATES = results taken from each retriever before fusing, RRF_K = rank damping constant
+HYBRID_SEARCH_ENABLED = os.getenv("HYBRID_SEARCH_ENABLED", "true").lower() == "true"
+SPARSE_INDEX_DIR = os.getenv("SPARSE_INDEX_DIR", ".cache/sparse_index")
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+# answer prompt context : token budget for the packed knowledge base + web passages (see context_packing.py),
+# and the share of a passage's word 3-grams already in a kept passage above which it counts as a duplicate
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.8"))
+# web search result cache in front of Tavily (see web_cache.py) : seconds a result is fresh, seconds it may
+# still be served while a background search refreshes it, and how many distinct searches are kept
+WEB_CACHE_ENABLED = os.getenv("WEB_CACHE_ENABLED", "true").lower() == "true"
+WEB_CACHE_TTL_SECONDS = float(os.getenv("WEB_CACHE_TTL_SECONDS", "300"))
+WEB_CACHE_STALE_SECONDS = float(os.getenv("WEB_CACHE_STALE_SECONDS", "600"))
+WEB_CACHE_MAX_ENTRIES = int(os.getenv("WEB_CACHE_MAX_ENTRIES", "1000"))
+# request path logging (see telemetry.py) : "queue" writes from a background thread, "sync" from the caller, "off"
+LOG_MODE = os.getenv("LOG_MODE", "queue").lower()
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# build the API clients and the vector store in the background at startup (GET /ready reports when done),
+# instead of on the first request
+WARM_UP_ON_STARTUP = os.getenv("WARM_UP_ON_STARTUP", "true").lower() == "true"
+# POST /chat/batch (see batch.py) : max graph runs in flight at once for one request (also the default), and max questions per request
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "1000"))
+# POST /chat/, /chat/stream and /chat/batch concurrency control per worker (see admission.py) : requests admitted
+# at once (running or waiting for their session, a batch counts max_concurrency), requests that may wait for a
+# slot and for how many seconds before a 429, and requests one session may queue behind its running turn
+CHAT_MAX_INFLIGHT = int(os.getenv("CHAT_MAX_INFLIGHT", "64"))
+CHAT_MAX_QUEUED = int(os.getenv("CHAT_MAX_QUEUED", "32"))
+CHAT_QUEUE_TIMEOUT_SECONDS = float(os.getenv("CHAT_QUEUE_TIMEOUT_SECONDS", "1.0"))
+CHAT_MAX_SESSION_QUEUE = int(os.getenv("CHAT_MAX_SESSION_QUEUE", "4"))
 EMBED_MODEL = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
 
 # Path , adjust as needed
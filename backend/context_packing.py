@@ -0,0 +1,163 @@
+'''
+Context packing : turns the retrieved chunks and web results into the smallest prompt context
+that still carries everything relevant.
+
+1. merge  : chunks of the same document (namespace + document ID) whose ranges overlap or touch
+            (`start_index` metadata, the splitter's chunk overlap) are stitched into one passage, the
+            overlap kept once
+2. dedupe : passages whose word 3-grams are mostly (>= `duplicate_threshold`) already in a more
+            relevant passage are dropped, across knowledge base and web results (a web page quoting a
+            knowledge base chunk, the same chunk indexed twice, a chunk already inside a merged passage)
+3. pack   : passages are added by relevance until the token budget is used, the last one that
+            doesn't fit is cut at a word boundary
+
+Token counts are estimated (~4 characters per token), like count_tokens_approximately.
+'''
+import re
+import math
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from config import CONTEXT_TOKEN_BUDGET, CONTEXT_DUPLICATE_THRESHOLD
+
+_WORD_PATTERN = re.compile(r"\w+")
+# _format_web_results joins one "Title: ...\nContent: ...\nURL: ..." block per result
+_WEB_RESULT_SPLIT = re.compile(r"\n\n(?=Title: )")
+# an overlap whose offsets don't line up (text normalized differently) is searched for up to this length
+_MAX_OVERLAP_SEARCH = 400
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / 4)
+
+
+@dataclass
+class Passage:
+    text: str
+    source: str # "rag" or "web"
+    relevance: float
+    document_id: Optional[str] = None
+    start: Optional[int] = None
+    parts: int = 1 # chunks merged into this passage
+    shingles: set = field(default_factory=set, repr=False)
+
+
+def _stitch(left: str, right: str, offset_overlap: int) -> str:
+    """Appends `right` to `left` without repeating their overlap."""
+    if 0 < offset_overlap <= len(right) and left.endswith(right[:offset_overlap]):
+        return left + right[offset_overlap:]
+    for size in range(min(len(left), len(right), _MAX_OVERLAP_SEARCH), 20, -1):
+        if left.endswith(right[:size]):
+            return left + right[size:]
+    return left + "\n" + right
+
+
+def merge_neighbors(chunks: List[dict]) -> List[Passage]:
+    '''
+    Chunks ({"content", "metadata", "rrf" / "score"}, most relevant first) -> passages.
+    Chunks are merged per (namespace, document_id) : two tenants may upload the same document ID.
+    Chunks without document_id / start_index are kept as they are.
+    '''
+    by_document: Dict[Tuple[Optional[str], str], List[Tuple[int, float, str]]] = {}
+    passages = []
+    for rank, chunk in enumerate(chunks):
+        metadata = chunk.get("metadata") or {}
+        relevance = chunk.get("rrf") or chunk.get("score") or 1.0 / (rank + 1)
+        if metadata.get("document_id") is None or metadata.get("start_index") is None:
+            passages.append(Passage(chunk["content"], "rag", relevance))
+            continue
+        by_document.setdefault((metadata.get("namespace"), metadata["document_id"]), []).append(
+            (int(metadata["start_index"]), relevance, chunk["content"]))
+    for (_, document_id), parts in by_document.items():
+        parts.sort()
+        current = None
+        for start, relevance, text in parts:
+            if current is not None and start <= current.start + len(current.text):
+                current.text = _stitch(current.text, text, current.start + len(current.text) - start)
+                current.relevance = max(current.relevance, relevance)
+                current.parts += 1
+                continue
+            current = Passage(text, "rag", relevance, document_id=document_id, start=start)
+            passages.append(current)
+    passages.sort(key=lambda p: -p.relevance)
+    return passages
+
+
+def web_passages(web: str) -> List[Passage]:
+    """Splits the formatted web results back into one passage per result, in Tavily's order."""
+    if not web or web.startswith("Web search was disabled"):
+        return []
+    blocks = [b for b in _WEB_RESULT_SPLIT.split(web) if b.strip()]
+    return [Passage(b, "web", 1.0 / (rank + 1)) for rank, b in enumerate(blocks)]
+
+
+def _shingles(text: str) -> set:
+    words = _WORD_PATTERN.findall(text.lower())
+    return {" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2))}
+
+
+def drop_near_duplicates(passages: List[Passage], threshold: float) -> Tuple[List[Passage], int]:
+    """Drops passages whose 3-grams are mostly contained in an earlier (more relevant) kept passage."""
+    kept, dropped = [], 0
+    for passage in passages:
+        passage.shingles = _shingles(passage.text)
+        size = len(passage.shingles) or 1
+        if any(len(passage.shingles & k.shingles) / size >= threshold for k in kept):
+            dropped += 1
+            continue
+        kept.append(passage)
+    return kept, dropped
+
+
+def pack(passages: List[Passage], budget: int) -> Tuple[List[Passage], int]:
+    """Greedy fill of the token budget in the given order. Returns (packed, passages left out)."""
+    packed, used = [], 0
+    for i, passage in enumerate(passages):
+        tokens = estimate_tokens(passage.text)
+        if used + tokens <= budget:
+            packed.append(passage)
+            used += tokens
+            continue
+        remaining = budget - used
+        if remaining >= 50: # worth a partial passage
+            cut = passage.text[:remaining * 4].rsplit(" ", 1)[0]
+            packed.append(Passage(cut + " ...", passage.source, passage.relevance, passage.document_id, passage.start))
+        return packed, len(passages) - i - (1 if remaining >= 50 else 0)
+    return packed, 0
+
+
+def pack_context(rag_chunks: Optional[List[dict]], rag: str, web: str, budget: int = CONTEXT_TOKEN_BUDGET,
+                 duplicate_threshold: float = CONTEXT_DUPLICATE_THRESHOLD) -> Tuple[str, Dict[str, int]]:
+    '''
+    Builds the answer prompt context. Web results come first when present (web search only runs when
+    the knowledge base was not enough, or the question needs fresh information).
+    `rag` (joined text) is used as a single passage when the scored chunks are not available.
+    Returns (context, stats).
+    '''
+    if rag_chunks:
+        rag_parts = merge_neighbors(rag_chunks)
+    else:
+        rag_parts = [Passage(rag, "rag", 1.0)] if rag else []
+    web_parts = web_passages(web)
+    tokens_before = sum(estimate_tokens(c["content"]) for c in rag_chunks) if rag_chunks else estimate_tokens(rag or "")
+    tokens_before += sum(estimate_tokens(p.text) for p in web_parts)
+
+    passages, duplicates = drop_near_duplicates(web_parts + rag_parts, duplicate_threshold)
+    packed, left_out = pack(passages, budget)
+
+    sections = []
+    web_text = [p.text for p in packed if p.source == "web"]
+    rag_text = [p.text for p in packed if p.source == "rag"]
+    if rag_text:
+        sections.append("Knowledge Base Information:\n" + "\n\n".join(rag_text))
+    if web_text:
+        sections.append("Web Search Results:\n" + "\n\n".join(web_text))
+    context = "\n\n".join(sections)
+    stats = {
+        "tokens_before": tokens_before,
+        "tokens_after": sum(estimate_tokens(t) for t in web_text + rag_text),
+        "chunks_merged": sum(p.parts - 1 for p in rag_parts),
+        "duplicates_dropped": duplicates,
+        "passages_left_out": left_out,
+    }
+    return context, stats
@@ -0,0 +1,234 @@
+'''
+Content-addressed embedding cache.
+
+Sits in front of any LangChain `Embeddings` object (OpenAIEmbeddings in vectorstore.py).
+Keys are sha256(model name + normalized text), so the same chunk or the same question
+is embedded only once, no matter which document or session it came from.
+
+Two tiers :
+- memory : LRU dictionary, bounded by number of vectors
+- disk   : SQLite table (WAL mode), vectors stored as float32 blobs, survives restarts
+           (read and written from a worker thread by the async methods, never on the event loop)
+'''
+import os
+import re
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import List, Dict, Optional
+
+from langchain_core.embeddings import Embeddings
+
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_text(text: str) -> str:
+    """Unicode NFC + collapsed whitespace, so trivially different copies share a key."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+def cache_key(model_name: str, text: str) -> str:
+    return hashlib.sha256(f"{model_name}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class LRUEmbeddingStore:
+    '''In-memory tier : least recently used vectors are dropped once max_size is reached.'''
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._data: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._data.get(key)
+                if vector is not None:
+                    self._data.move_to_end(key)
+                    found[key] = vector
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        with self._lock:
+            for key, vector in items.items():
+                self._data[key] = vector
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteEmbeddingStore:
+    '''On-disk tier : one row per vector, float32 blob. Safe to share between threads and workers.'''
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._conn.commit()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            # stay well below SQLite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, array("f", vector).tobytes()) for key, vector in items.items()],
+            )
+            self._conn.commit()
+
+
+class CachedEmbeddings(Embeddings):
+    '''
+    Embeddings wrapper that checks the memory tier, then the disk tier,
+    and only sends the remaining (deduplicated) texts to the underlying model.
+    `disk` : a SQLiteEmbeddingStore, or a LazyClient building one on first use (see vectorstore.py).
+    '''
+
+    def __init__(self, underlying: Embeddings, model_name: str, memory_size: int = 10000, disk=None):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.memory = LRUEmbeddingStore(memory_size)
+        self.disk = disk
+        self._stats_lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "embed_calls": 0, "embed_seconds": 0.0}
+
+    # --- cache lookup ---
+    def _lookup_memory(self, keys: List[str]):
+        """(distinct keys, vectors found in memory, keys to look for on disk)."""
+        unique_keys = list(dict.fromkeys(keys))
+        found = self.memory.get_many(unique_keys)
+        disk_keys = [k for k in unique_keys if k not in found] if self.disk is not None else []
+        return unique_keys, found, disk_keys
+
+    def _merge_disk_hits(self, unique_keys: List[str], found: Dict[str, List[float]],
+                         from_disk: Dict[str, List[float]]) -> Dict[str, List[float]]:
+        memory_hits = len(found)
+        if from_disk:
+            self.memory.put_many(from_disk) # promote to the memory tier
+            found.update(from_disk)
+        with self._stats_lock:
+            self._stats["memory_hits"] += memory_hits
+            self._stats["disk_hits"] += len(from_disk)
+            self._stats["misses"] += len(unique_keys) - len(found)
+        return found
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        unique_keys, found, disk_keys = self._lookup_memory(keys)
+        from_disk = self.disk.get_many(disk_keys) if disk_keys else {}
+        return self._merge_disk_hits(unique_keys, found, from_disk)
+
+    async def _alookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        """_lookup for the async methods : memory hits inline, the SQLite read off the event loop."""
+        unique_keys, found, disk_keys = self._lookup_memory(keys)
+        from_disk = await asyncio.to_thread(self.disk.get_many, disk_keys) if disk_keys else {}
+        return self._merge_disk_hits(unique_keys, found, from_disk)
+
+    def _count_embed(self, elapsed: float):
+        with self._stats_lock:
+            self._stats["embed_calls"] += 1
+            self._stats["embed_seconds"] += elapsed
+
+    def _store(self, items: Dict[str, List[float]], elapsed: float):
+        self.memory.put_many(items)
+        if self.disk is not None:
+            self.disk.put_many(items)
+        self._count_embed(elapsed)
+
+    async def _astore(self, items: Dict[str, List[float]], elapsed: float):
+        self.memory.put_many(items)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.put_many, items)
+        self._count_embed(elapsed)
+
+    def _missing(self, texts: List[str], keys: List[str], found: Dict[str, List[float]]):
+        """Returns (keys, texts) still to embed, one entry per distinct key."""
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        return list(missing.keys()), list(missing.values())
+
+    # --- Embeddings interface ---
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [cache_key(self.model_name, t) for t in texts]
+        found = self._lookup(keys)
+        missing_keys, missing_texts = self._missing(texts, keys, found)
+        if missing_texts:
+            start = time.perf_counter()
+            vectors = self.underlying.embed_documents(missing_texts)
+            new_items = dict(zip(missing_keys, vectors))
+            self._store(new_items, time.perf_counter() - start)
+            found.update(new_items)
+        return [found[k] for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = cache_key(self.model_name, text)
+        found = self._lookup([key])
+        if key not in found:
+            start = time.perf_counter()
+            vector = self.underlying.embed_query(text)
+            self._store({key: vector}, time.perf_counter() - start)
+            return vector
+        return found[key]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [cache_key(self.model_name, t) for t in texts]
+        found = await self._alookup(keys)
+        missing_keys, missing_texts = self._missing(texts, keys, found)
+        if missing_texts:
+            start = time.perf_counter()
+            vectors = await self.underlying.aembed_documents(missing_texts)
+            new_items = dict(zip(missing_keys, vectors))
+            await self._astore(new_items, time.perf_counter() - start)
+            found.update(new_items)
+        return [found[k] for k in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = cache_key(self.model_name, text)
+        found = await self._alookup([key])
+        if key not in found:
+            start = time.perf_counter()
+            vector = await self.underlying.aembed_query(text)
+            await self._astore({key: vector}, time.perf_counter() - start)
+            return vector
+        return found[key]
+
+    # --- metrics ---
+    def stats(self) -> Dict[str, float]:
+        '''
+        Hit / miss counters. `estimated_seconds_saved` assumes every hit would have cost
+        the average latency per embedded text observed so far.
+        '''
+        with self._stats_lock:
+            stats = dict(self._stats)
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        seconds_per_text = stats["embed_seconds"] / stats["misses"] if stats["misses"] else 0.0
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        stats["estimated_seconds_saved"] = hits * seconds_per_text
+        stats["memory_entries"] = len(self.memory)
+        return stats
@@ -0,0 +1,179 @@
+'''
+Tiered router : cheap local classification before the router LLM.
+
+Tier 1 - rules    : regex for greetings / small talk / thanks / goodbyes -> 'end' with a canned reply.
+Tier 2 - centroid : embeds the query and compares it with one centroid per route, built from a few
+                    example queries per route. Decides 'rag' or 'web' when the margin between the best
+                    and second best route is at least `confidence_threshold`. Never 'answer' : that
+                    route skips retrieval, a wrong guess would answer without the knowledge base.
+                    Off by default (FAST_ROUTER_CENTROID_ENABLED) : the margin depends on the embedding
+                    model and the traffic, calibrate it with benchmarks/calibrate_fast_router.py first.
+Tier 3 - LLM      : everything else goes to router_llm as before (returns None here).
+
+The node only swaps how the decision is made, the graph edges stay the same.
+'''
+import re
+import asyncio
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import FAST_ROUTER_ENABLED, FAST_ROUTER_CENTROID_ENABLED, FAST_ROUTER_CONFIDENCE
+from vectorstore import embeddings
+from telemetry import log
+
+
+@dataclass
+class FastDecision:
+    route: str
+    reply: Optional[str]
+    tier: str # "rules" or "centroid"
+    confidence: float
+
+
+# (pattern, reply) : the whole message must match, so "hi, what is X?" still goes to the other tiers
+_SMALL_TALK_RULES = [
+    (re.compile(r"^(hi|hello|hey|hiya|howdy|greetings|good (morning|afternoon|evening))( there)?[\s!.,]*$", re.I),
+     "Hello! How can I assist you today?"),
+    (re.compile(r"^(how are you|how's it going|how are you doing|what's up|sup)[\s!?.,]*$", re.I),
+     "I'm doing well, thank you! How can I help you today?"),
+    (re.compile(r"^(thanks|thank you|thx|ty|much appreciated)( (so|very) much)?[\s!.,]*$", re.I),
+     "You're welcome! Let me know if there's anything else I can help with."),
+    (re.compile(r"^(bye|goodbye|see you|see ya|good night)[\s!.,]*$", re.I),
+     "Goodbye! Feel free to come back anytime."),
+]
+
+# the routes the centroid tier may decide, the others only compete for the margin
+CENTROID_ROUTES = ("rag", "web")
+
+# training examples per route, knowledge base questions for 'rag' (general knowledge ones are left to the LLM)
+ROUTE_EXAMPLES: Dict[str, List[str]] = {
+    "rag": [
+        "What are the treatment of diabetes?",
+        "How do I submit an expense report?",
+        "Explain the refund policy.",
+        "How does the onboarding procedure work?",
+        "What are the product specifications of model X?",
+        "Summarize the section about security requirements.",
+    ],
+    "web": [
+        "Who won the NBA finals last night?",
+        "What is the weather in London?",
+        "Latest news on technology",
+        "Who won the election yesterday?",
+        "What is the stock price of Apple today?",
+        "What happened in the news this morning?",
+    ],
+    "answer": [
+        "What is your name?",
+        "What can you do?",
+        "Who are you?",
+        "What is 2 + 2?",
+    ],
+    "end": [
+        "Hello there!",
+        "Hi",
+        "How are you?",
+        "Good morning!",
+    ],
+}
+
+
+class FastRouter:
+
+    def __init__(self, embedder=embeddings, confidence_threshold: float = FAST_ROUTER_CONFIDENCE,
+                 examples: Dict[str, List[str]] = ROUTE_EXAMPLES):
+        self.embedder = embedder
+        self.confidence_threshold = confidence_threshold
+        self.examples = examples
+        self._routes: List[str] = list(examples)
+        self._centroids: Optional[np.ndarray] = None
+        self._centroid_error = False # embedding failed once, stop trying the centroid tier
+        self._lock = threading.Lock()
+        self._stats = {"rules": 0, "centroid": 0, "llm": 0}
+
+    def _get_centroids(self) -> Optional[np.ndarray]:
+        if self._centroids is None and not self._centroid_error:
+            with self._lock:
+                if self._centroids is None and not self._centroid_error:
+                    try:
+                        rows = []
+                        for route in self._routes:
+                            vectors = np.asarray(self.embedder.embed_documents(self.examples[route]), dtype=np.float32)
+                            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+                            centroid = vectors.mean(axis=0)
+                            rows.append(centroid / np.linalg.norm(centroid))
+                        self._centroids = np.vstack(rows)
+                    except Exception as e:
+                        log(f"Fast router centroid tier disabled, could not embed examples: {e}")
+                        self._centroid_error = True
+        return self._centroids
+
+    @staticmethod
+    def match_rules(query: str) -> Optional[FastDecision]:
+        text = query.strip()
+        for pattern, reply in _SMALL_TALK_RULES:
+            if pattern.match(text):
+                return FastDecision(route="end", reply=reply, tier="rules", confidence=1.0)
+        return None
+
+    def nearest(self, vector, centroids: np.ndarray) -> Tuple[str, float]:
+        """(closest route, similarity margin over the second closest) : what the threshold is calibrated on."""
+        v = np.asarray(vector, dtype=np.float32)
+        v /= np.linalg.norm(v) or 1.0
+        scores = centroids @ v
+        order = np.argsort(-scores)
+        return self._routes[order[0]], float(scores[order[0]] - scores[order[1]])
+
+    def _from_vector(self, vector, centroids: np.ndarray) -> Optional[FastDecision]:
+        route, margin = self.nearest(vector, centroids)
+        # 'end' needs a reply the centroid tier can't write, 'answer' would skip retrieval : LLM
+        if margin < self.confidence_threshold or route not in CENTROID_ROUTES:
+            return None
+        return FastDecision(route=route, reply=None, tier="centroid", confidence=margin)
+
+    def _count(self, decision: Optional[FastDecision]) -> Optional[FastDecision]:
+        with self._lock:
+            self._stats[decision.tier if decision else "llm"] += 1
+        return decision
+
+    def classify(self, query: str) -> Optional[FastDecision]:
+        """Returns a decision for confident cases, None when router_llm should decide."""
+        if not FAST_ROUTER_ENABLED:
+            return None
+        decision = self.match_rules(query)
+        if decision is None and FAST_ROUTER_CENTROID_ENABLED:
+            centroids = self._get_centroids()
+            if centroids is not None:
+                try:
+                    decision = self._from_vector(self.embedder.embed_query(query), centroids)
+                except Exception as e:
+                    log(f"Fast router centroid lookup failed: {e}")
+        return self._count(decision)
+
+    async def aclassify(self, query: str) -> Optional[FastDecision]:
+        if not FAST_ROUTER_ENABLED:
+            return None
+        decision = self.match_rules(query)
+        if decision is None and FAST_ROUTER_CENTROID_ENABLED:
+            centroids = self._centroids
+            if centroids is None and not self._centroid_error:
+                centroids = await asyncio.to_thread(self._get_centroids)
+            if centroids is not None:
+                try:
+                    decision = self._from_vector(await self.embedder.aembed_query(query), centroids)
+                except Exception as e:
+                    log(f"Fast router centroid lookup failed: {e}")
+        return self._count(decision)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["llm_calls_avoided"] = stats["rules"] + stats["centroid"]
+        return stats
+
+
+# process-wide router used by router_node
+fast_router = FastRouter()
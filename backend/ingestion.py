@@ -0,0 +1,264 @@
+'''
+Streaming ingestion pipeline for PDF uploads.
+
+    pdf_extract.iter_pages()  ->  IncrementalSplitter  ->  fixed size batches  ->  embed + upsert (bounded pool)
+    (pages in order, parsed by     (carries the tail          (batch_size chunks)     (max_inflight batches,
+     a process pool)                over page breaks)                                  parser blocks when full)
+
+Only the pages of the shards being parsed, the splitter's tail and at most (max_inflight + 1)
+batches are held in memory at any time, so peak memory does not depend on the size of the PDF.
+
+Every chunk carries its page and the upload's metadata (vectorstore.chunk_metadata : document ID,
+source file name, upload time, optional namespace). Chunks get deterministic IDs (manifest.chunk_id). Chunks the document already owns are not
+embedded or upserted again, chunks that are gone from the new version are deleted, and an
+unchanged file is skipped before parsing, unless the sparse index lacks some of its chunks (hybrid
+search enabled after the upload, or a fresh SPARSE_INDEX_DIR) : then it is parsed again and only
+those chunks are added to the sparse index, nothing is re-embedded.
+'''
+import bisect
+import threading
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, List, Optional, Set
+
+from langchain_core.documents import Document
+
+from config import INGEST_BATCH_SIZE, INGEST_MAX_INFLIGHT_UPSERTS, HYBRID_SEARCH_ENABLED
+from vectorstore import get_vector_store, embeddings, text_splitter, CHUNK_SIZE, chunk_metadata, document_key
+from manifest import document_manifest, chunk_id, file_sha256
+from sparse_index import get_sparse_index
+from pdf_extract import iter_pages
+from chunking import TokenChunker
+from telemetry import log
+
+
+@dataclass
+class IngestionResult:
+    pages: int = 0
+    chunks: int = 0 # chunks the document has after this ingest
+    new_chunks: int = 0 # embedded and upserted by this ingest
+    deleted_chunks: int = 0 # stale chunks removed from the index
+    unchanged: bool = False # same file as last time, nothing was parsed
+
+
+# one ingest per document at a time, so two uploads of the same document can't race on the manifest
+_document_locks: dict = {}
+_document_locks_guard = threading.Lock()
+
+def _document_lock(document_id: str) -> threading.Lock:
+    with _document_locks_guard:
+        return _document_locks.setdefault(document_id, threading.Lock())
+
+
+class IncrementalSplitter:
+    '''
+    Splits a document that arrives page by page.
+    Pages are joined with `separator` (same as the old "\\n\\n".join), the last chunk of every split
+    is held back because it may continue on the next page. `start_index` is the offset in the
+    full joined text, `page` is the page the chunk starts on.
+    '''
+
+    def __init__(self, splitter=text_splitter, separator: str = "\n\n", min_buffer: int = 2 * CHUNK_SIZE):
+        self.splitter = splitter
+        self.separator = separator
+        self.min_buffer = min_buffer
+        self._buffer = ""
+        self._buffer_offset = 0 # offset of the buffer start in the full text
+        self._text_length = 0 # length of the full text fed so far
+        self._page_offsets: List[int] = [] # start offset of every page still referenced by the buffer
+        self._page_numbers: List[int] = []
+
+    def _page_at(self, offset: int) -> int:
+        i = bisect.bisect_right(self._page_offsets, offset) - 1
+        return self._page_numbers[max(i, 0)]
+
+    def _split(self, hold_back_last: bool) -> List[Document]:
+        if isinstance(self.splitter, TokenChunker): # page starts are the strongest chunk boundaries
+            page_breaks = [o - self._buffer_offset for o in self._page_offsets if o > self._buffer_offset]
+            pieces = self.splitter.create_documents([self._buffer], page_breaks=page_breaks)
+        else:
+            pieces = self.splitter.create_documents([self._buffer])
+        if hold_back_last:
+            if len(pieces) < 2:
+                return []
+            tail = pieces.pop()
+            cut = tail.metadata["start_index"]
+        else:
+            cut = len(self._buffer)
+
+        chunks = []
+        for piece in pieces:
+            start = self._buffer_offset + piece.metadata["start_index"]
+            chunks.append(Document(page_content=piece.page_content,
+                                   metadata={"start_index": start, "page": self._page_at(start)}))
+
+        self._buffer = self._buffer[cut:]
+        self._buffer_offset += cut
+        # forget pages that end before the buffer
+        keep = max(bisect.bisect_right(self._page_offsets, self._buffer_offset) - 1, 0)
+        del self._page_offsets[:keep]
+        del self._page_numbers[:keep]
+        return chunks
+
+    def feed(self, text: str, page: int) -> List[Document]:
+        """Adds one page, returns the chunks that are now complete."""
+        if self._text_length:
+            self._buffer += self.separator
+            self._text_length += len(self.separator)
+        self._page_offsets.append(self._text_length)
+        self._page_numbers.append(page)
+        self._buffer += text
+        self._text_length += len(text)
+        if len(self._buffer) < self.min_buffer:
+            return []
+        return self._split(hold_back_last=True)
+
+    def flush(self) -> List[Document]:
+        """Returns the remaining chunks at the end of the document."""
+        if not self._buffer.strip():
+            return []
+        return self._split(hold_back_last=False)
+
+
+class BatchUpserter:
+    '''
+    Collects chunks into fixed size batches and embeds + upserts them on a thread pool.
+    At most `max_inflight` batches run at once, `add` blocks when the pool is full (backpressure).
+    `document_id` is the key chunk IDs are derived from (vectorstore.document_key), `metadata`
+    is added to every chunk (default : {"document_id": document_id}). Chunks of `existing_ids` that are
+    also in `sparse_missing` are only added to the sparse index (backfill).
+    '''
+
+    def __init__(self, document_id: str, existing_ids: Set[str] = frozenset(), metadata: Optional[dict] = None,
+                 sparse_missing: Set[str] = frozenset(),
+                 batch_size: int = INGEST_BATCH_SIZE, max_inflight: int = INGEST_MAX_INFLIGHT_UPSERTS,
+                 on_embedded: Optional[Callable[[int], None]] = None,
+                 on_upserted: Optional[Callable[[int], None]] = None):
+        self.document_id = document_id
+        self.metadata = metadata or {"document_id": document_id}
+        self.existing_ids = existing_ids # chunk IDs already in the index for this document
+        self.sparse_missing = sparse_missing # of those, the ones the sparse index lacks
+        self.backfilled = 0
+        self.seen_ids: Set[str] = set() # chunk IDs of the version being ingested
+        self.batch_size = batch_size
+        self.max_inflight = max_inflight
+        self.on_embedded = on_embedded
+        self.on_upserted = on_upserted
+        self.vector_store = get_vector_store()
+        self._pool = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="ingest-upsert")
+        self._inflight = set()
+        self._batch: List[Document] = []
+        self.total = 0
+
+    def _upsert(self, batch: List[Document]):
+        texts = [d.page_content for d in batch]
+        # embed first so progress can be reported per stage; the vectors land in the embedding
+        # cache, so add_texts below gets them back without another call to the embedding model
+        embeddings.embed_documents(texts)
+        if self.on_embedded:
+            self.on_embedded(len(batch))
+        self.vector_store.add_texts(texts, metadatas=[d.metadata for d in batch],
+                                    ids=[d.metadata["chunk_id"] for d in batch])
+        if HYBRID_SEARCH_ENABLED: # BM25 postings for the same chunks, flushed to disk at the end of the ingest
+            get_sparse_index().add([d.metadata["chunk_id"] for d in batch], texts, [d.metadata for d in batch])
+        if self.on_upserted:
+            self.on_upserted(len(batch))
+
+    def _submit(self):
+        batch, self._batch = self._batch, []
+        while len(self._inflight) >= self.max_inflight:
+            done, self._inflight = wait(self._inflight, return_when=FIRST_COMPLETED)
+            for future in done:
+                future.result() # re-raise worker errors in the caller
+        self._inflight.add(self._pool.submit(self._upsert, batch))
+        self.total += len(batch)
+
+    def add(self, chunk: Document):
+        cid = chunk_id(self.document_id, chunk.page_content)
+        if cid in self.seen_ids:
+            return # repeated text inside the document, one vector is enough
+        self.seen_ids.add(cid)
+        if cid in self.existing_ids:
+            if cid in self.sparse_missing: # already embedded, only the BM25 postings are missing
+                chunk.metadata.update(self.metadata, chunk_id=cid)
+                get_sparse_index().add([cid], [chunk.page_content], [chunk.metadata])
+                self.backfilled += 1
+            return # unchanged since the last upload, already embedded and indexed
+        chunk.metadata.update(self.metadata, chunk_id=cid)
+        self._batch.append(chunk)
+        if len(self._batch) >= self.batch_size:
+            self._submit()
+
+    def close(self, flush: bool = True):
+        """Flushes the last partial batch and waits for every upsert to finish."""
+        try:
+            if flush and self._batch:
+                self._submit()
+            for future in self._inflight:
+                future.result()
+        finally:
+            self._pool.shutdown(wait=True)
+
+
+def ingest_pdf(file_path: str, document_id: str, batch_size: int = INGEST_BATCH_SIZE,
+               max_inflight: int = INGEST_MAX_INFLIGHT_UPSERTS,
+               on_page: Optional[Callable[[], None]] = None,
+               on_embedded: Optional[Callable[[int], None]] = None,
+               on_upserted: Optional[Callable[[int], None]] = None,
+               source: Optional[str] = None, namespace: Optional[str] = None,
+               uploaded_at: Optional[float] = None) -> IngestionResult:
+    '''
+    Streams a PDF into the vector store page by page, as the new version of `document_id`
+    in `namespace` (None = no tenant). `source` (the uploaded file name) and `uploaded_at`
+    go into every chunk's metadata.
+    Returns page / chunk counts (see IngestionResult).
+    The optional callbacks report progress (used by the background job queue in jobs.py).
+    '''
+    key = document_key(document_id, namespace)
+    with _document_lock(key):
+        result = IngestionResult()
+        file_hash = file_sha256(file_path)
+        existing_ids = document_manifest.chunk_ids(key)
+        sparse_missing = get_sparse_index().missing(existing_ids) if HYBRID_SEARCH_ENABLED else set()
+        if existing_ids and document_manifest.content_hash(key) == file_hash:
+            if not sparse_missing:
+                result.chunks = len(existing_ids)
+                result.unchanged = True
+                log(f"Document '{key}' is unchanged since the last upload, skipping ingestion.")
+                return result
+            log(f"Document '{key}' is unchanged but {len(sparse_missing)} of its chunks are missing from "
+                  f"the sparse index, parsing it again to add them.")
+
+        splitter = IncrementalSplitter()
+        upserter = BatchUpserter(key, existing_ids, chunk_metadata(document_id, source, namespace, uploaded_at),
+                                 sparse_missing=sparse_missing, batch_size=batch_size, max_inflight=max_inflight,
+                                 on_embedded=on_embedded, on_upserted=on_upserted)
+        try:
+            for page, text in iter_pages(file_path):
+                result.pages += 1
+                if on_page:
+                    on_page()
+                for chunk in splitter.feed(text, page):
+                    upserter.add(chunk)
+            for chunk in splitter.flush():
+                upserter.add(chunk)
+        except BaseException:
+            upserter.close(flush=False)
+            raise
+        upserter.close()
+
+        stale_ids = existing_ids - upserter.seen_ids
+        if stale_ids:
+            get_vector_store().delete(ids=list(stale_ids))
+        if HYBRID_SEARCH_ENABLED:
+            get_sparse_index().delete(stale_ids)
+            get_sparse_index().flush()
+        document_manifest.replace(key, file_hash, upserter.seen_ids)
+
+        result.chunks = len(upserter.seen_ids)
+        result.new_chunks = upserter.total
+        result.deleted_chunks = len(stale_ids)
+        log(f"Streamed {result.pages} pages of '{key}' into {result.chunks} chunks: "
+              f"{result.new_chunks} new, {result.chunks - result.new_chunks} unchanged, {result.deleted_chunks} deleted"
+              f"{f', {upserter.backfilled} added to the sparse index' if upserter.backfilled else ''}.")
+        return result
@@ -0,0 +1,125 @@
+'''
+Background ingestion jobs.
+
+/upload-document/ saves the PDF and submits it here, then returns a job ID right away.
+A bounded thread pool runs the ingestion pipeline (ingestion.ingest_pdf) and every job
+keeps progress counters that GET /jobs/{id} reports.
+
+Concurrency is capped twice :
+- max_workers : PDFs ingested at the same time (so a burst of uploads can't starve /chat/)
+- max_queued  : jobs waiting for a worker, beyond that submit() raises JobQueueFullError
+'''
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict
+from typing import Optional, Dict, Any
+
+from config import INGEST_MAX_CONCURRENT_JOBS, INGEST_MAX_QUEUED_JOBS
+from ingestion import ingest_pdf
+from telemetry import log
+
+
+class JobQueueFullError(Exception):
+    """Raised when the ingestion queue has no room for another job."""
+
+
+@dataclass
+class IngestionJob:
+    job_id: str
+    filename: str
+    document_id: str
+    namespace: Optional[str] = None # tenant the document belongs to, None = shared
+    status: str = "queued" # queued -> running -> completed | failed
+    pages_parsed: int = 0
+    chunks_embedded: int = 0
+    vectors_upserted: int = 0
+    chunks_unchanged: int = 0 # already indexed from a previous upload, not embedded again
+    chunks_deleted: int = 0 # stale chunks of the previous version
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class IngestionJobQueue:
+
+    def __init__(self, max_workers: int = INGEST_MAX_CONCURRENT_JOBS,
+                 max_queued: int = INGEST_MAX_QUEUED_JOBS, max_retained: int = 1000):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.max_retained = max_retained # finished jobs kept for status lookups
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest-job")
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending = 0 # queued + running
+
+    def submit(self, file_path: str, filename: str, document_id: Optional[str] = None,
+               namespace: Optional[str] = None) -> IngestionJob:
+        '''
+        Queues a saved PDF for ingestion as the latest version of `document_id` (defaults to the filename)
+        in `namespace`.
+        The job owns `file_path` and deletes it when done.
+        '''
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queued:
+                raise JobQueueFullError(f"Ingestion queue is full ({self._pending} jobs pending).")
+            self._pending += 1
+            job = IngestionJob(job_id=uuid.uuid4().hex, filename=filename, document_id=document_id or filename,
+                               namespace=namespace or None)
+            self._jobs[job.job_id] = job
+            self._evict_finished()
+        self._pool.submit(self._run, job, file_path)
+        log(f"Queued ingestion job {job.job_id} for {filename}")
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _evict_finished(self):
+        # caller holds the lock
+        excess = len(self._jobs) - self.max_retained
+        for job_id in [j.job_id for j in self._jobs.values() if j.finished_at is not None][:max(excess, 0)]:
+            del self._jobs[job_id]
+
+    def _add(self, job: IngestionJob, counter: str, n: int):
+        with self._lock:
+            setattr(job, counter, getattr(job, counter) + n)
+
+    def _run(self, job: IngestionJob, file_path: str):
+        job.status = "running"
+        job.started_at = time.time()
+        log(f"Starting ingestion job {job.job_id} ({job.filename})")
+        try:
+            result = ingest_pdf(file_path, job.document_id,
+                                on_page=lambda: self._add(job, "pages_parsed", 1),
+                                on_embedded=lambda n: self._add(job, "chunks_embedded", n),
+                                on_upserted=lambda n: self._add(job, "vectors_upserted", n),
+                                source=job.filename, namespace=job.namespace, uploaded_at=job.created_at)
+            job.chunks_unchanged = result.chunks - result.new_chunks
+            job.chunks_deleted = result.deleted_chunks
+            job.status = "completed"
+        except Exception as e:
+            log(f"Ingestion job {job.job_id} failed: {e}")
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._pending -= 1
+            if os.path.exists(file_path):
+                os.remove(file_path)
+                log(f"Cleaned up temporary file: {file_path}")
+            log(f"Ingestion job {job.job_id} {job.status}: {job.pages_parsed} pages, "
+                  f"{job.vectors_upserted} vectors upserted")
+
+
+# process-wide queue used by the API
+ingestion_jobs = IngestionJobQueue()
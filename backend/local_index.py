@@ -0,0 +1,492 @@
+'''
+Local, dependency-free (NumPy only) vector index : an alternative to Pinecone.
+Select it with VECTOR_BACKEND=local (see config.py / vectorstore.get_vector_store).
+
+On-disk layout (LOCAL_INDEX_DIR) :
+- vectors.f32  : memory-mapped float32 matrix (capacity x dim), rows are L2-normalized
+- meta.jsonl   : append-only sidecar, one line per upsert {"row", "id", "text", "metadata"}
+                 or per delete {"delete": id}
+- header.json  : {"dim", "count", "capacity"}
+
+Deleted rows stay in the matrix until they pass `compact_ratio` of it, then compact() rewrites
+the three files with the live rows only.
+
+Loading maps the matrix without reading it and replays the sidecar, so startup is instant
+even for large indexes.
+
+Search modes :
+- exact : one vectorized dot product over all live rows, top-k with argpartition
+- ivf   : k-means coarse quantizer (inverted file). Only rows in the `nprobe` closest lists
+          are scored. Trained on a background thread once the index has `ivf_min_rows` live
+          rows, and retrained when it grows 4x. Searches scan exactly until the first
+          quantizer is swapped in.
+
+Metadata filters on INDEXED_FIELDS (namespace, document_id, source) are answered from an
+in-memory {(field, value): rows} index before any vector is scored, so a tenant's query
+only touches that tenant's rows. Other filters are checked row by row. In ivf mode the filter
+is applied before probing : a partition under `ivf_min_rows` rows is scanned exactly, a larger
+one probes more lists until it has k candidates.
+
+The candidate rows are chosen under the lock, the vectors are scored outside it, so a long scan
+doesn't hold back upserts or other searches.
+'''
+import os
+import json
+import uuid
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from telemetry import log
+
+
+def _matches(metadata: Dict[str, Any], filter: Optional[Dict[str, Any]]) -> bool:
+    """Pinecone-style metadata filter : {"key": value}, {"key": {"$eq": v}}, {"key": {"$in": [...]}}."""
+    if not filter:
+        return True
+    for key, condition in filter.items():
+        value = metadata.get(key)
+        if isinstance(condition, dict):
+            if "$eq" in condition and value != condition["$eq"]:
+                return False
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+            if "$ne" in condition and value == condition["$ne"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+# metadata fields with an inverted index (here and in sparse_index.py) : filters on them are
+# applied before scoring instead of row by row
+INDEXED_FIELDS = ("namespace", "document_id", "source")
+
+
+def _indexed_values(filter: Optional[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """{field: accepted values} for the equality / $eq / $in conditions of `filter` on INDEXED_FIELDS."""
+    values = {}
+    for key, condition in (filter or {}).items():
+        if key not in INDEXED_FIELDS:
+            continue
+        if not isinstance(condition, dict):
+            values[key] = [condition]
+        elif "$eq" in condition:
+            values[key] = [condition["$eq"]]
+        elif "$in" in condition:
+            values[key] = list(condition["$in"])
+    return values
+
+
+class LocalVectorStore(VectorStore):
+
+    def __init__(self, directory: str, embedding: Embeddings, mode: str = "exact",
+                 ivf_lists: int = 0, ivf_nprobe: int = 8, ivf_min_rows: int = 20000,
+                 compact_ratio: float = 0.3, compact_min_rows: int = 1024):
+        self.directory = directory
+        self.embedding = embedding
+        self.mode = mode
+        self.ivf_lists = ivf_lists # 0 = sqrt(number of rows)
+        self.ivf_nprobe = ivf_nprobe
+        self.ivf_min_rows = ivf_min_rows
+        self.compact_ratio = compact_ratio # share of dead rows that triggers a compaction
+        self.compact_min_rows = compact_min_rows # ... once there are at least this many
+        self._lock = threading.RLock()
+
+        self.dim: Optional[int] = None
+        self.count = 0 # rows used in the matrix (including deleted ones)
+        self.capacity = 0
+        self._vectors: Optional[np.memmap] = None
+        self._alive = np.zeros(0, dtype=bool)
+        self._ids: List[Optional[str]] = []
+        self._texts: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._row_of: Dict[str, int] = {}
+        self._field_rows: Dict[Tuple[str, Any], Set[int]] = {} # (indexed field, value) -> live rows
+        self._generation = 0 # bumped by every compaction (rows are renumbered)
+
+        self._centroids: Optional[np.ndarray] = None
+        self._assignments = np.zeros(0, dtype=np.int32)
+        self._trained_rows = 0
+        self._training = False # a background training is running
+        self._dirty_rows: Set[int] = set() # rows written while it runs, reassigned when it is swapped in
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    # --- paths / persistence ---
+    @property
+    def _vectors_path(self):
+        return os.path.join(self.directory, "vectors.f32")
+
+    @property
+    def _meta_path(self):
+        return os.path.join(self.directory, "meta.jsonl")
+
+    @property
+    def _header_path(self):
+        return os.path.join(self.directory, "header.json")
+
+    @property
+    def _compact_marker_path(self):
+        return os.path.join(self.directory, "compact.ready")
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def _finish_compaction(self):
+        '''
+        Completes (or discards) a compaction interrupted by a crash : once the marker is written the
+        ".tmp" files are complete and are moved into place, without it they are partial and removed.
+        '''
+        paths = (self._vectors_path, self._meta_path, self._header_path)
+        ready = os.path.exists(self._compact_marker_path)
+        for path in paths:
+            if os.path.exists(path + ".tmp"):
+                if ready:
+                    os.replace(path + ".tmp", path)
+                else:
+                    os.remove(path + ".tmp")
+        if ready:
+            os.remove(self._compact_marker_path)
+
+    def _load(self):
+        self._finish_compaction()
+        if not os.path.exists(self._header_path):
+            return
+        with open(self._header_path) as f:
+            header = json.load(f)
+        self.dim, self.capacity = header["dim"], header["capacity"]
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim))
+        self._alive = np.zeros(self.capacity, dtype=bool)
+        with open(self._meta_path, encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if "delete" in record:
+                    row = self._row_of.pop(record["delete"], None)
+                    if row is not None:
+                        self._alive[row] = False
+                        self._unindex_fields(row)
+                    continue
+                row = record["row"]
+                while len(self._ids) <= row:
+                    self._ids.append(None)
+                    self._texts.append("")
+                    self._metadatas.append({})
+                self._set_row(row, record["id"], record["text"], record["metadata"])
+        self.count = len(self._ids)
+        log(f"Loaded local vector index from '{self.directory}' ({len(self._row_of)} vectors).")
+
+    def _write_header(self, path: Optional[str] = None):
+        with open(path or self._header_path, "w") as f:
+            json.dump({"dim": self.dim, "count": self.count, "capacity": self.capacity}, f)
+
+    def _grow(self, needed_rows: int):
+        """Makes room for `needed_rows` rows, doubling the memory-mapped file."""
+        if self.count + needed_rows <= self.capacity:
+            return
+        new_capacity = max(1024, self.capacity * 2, self.count + needed_rows)
+        if self._vectors is not None:
+            self._vectors.flush()
+            del self._vectors
+        with open(self._vectors_path, "ab") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(new_capacity, self.dim))
+        alive = np.zeros(new_capacity, dtype=bool)
+        alive[:self.capacity] = self._alive[:self.capacity]
+        self._alive = alive
+        self.capacity = new_capacity
+        self._write_header()
+
+    def compact(self, block: int = 65536):
+        '''
+        Rewrites the matrix and the sidecar with the live rows only (deleted and re-added IDs leave
+        dead rows behind). Written as ".tmp" files, then moved into place : see _finish_compaction.
+        Searches scoring an older mapping meanwhile notice the new generation and run again.
+        '''
+        with self._lock:
+            if self._vectors is None:
+                return
+            live = np.flatnonzero(self._alive[:self.count])
+            capacity = max(1024, len(live))
+            vectors = np.memmap(self._vectors_path + ".tmp", dtype=np.float32, mode="w+", shape=(capacity, self.dim))
+            for i in range(0, len(live), block):
+                rows = live[i:i + block]
+                vectors[i:i + len(rows)] = self._vectors[rows]
+            vectors.flush()
+            with open(self._meta_path + ".tmp", "w", encoding="utf-8") as f:
+                f.writelines(json.dumps({"row": new, "id": self._ids[old], "text": self._texts[old],
+                                         "metadata": self._metadatas[old]}) + "\n" for new, old in enumerate(live))
+            dead = self.count - len(live)
+            assignments = self._assignments[live] if len(self._assignments) == self.count else None
+            self.count, self.capacity = len(live), capacity
+            self._write_header(self._header_path + ".tmp")
+            open(self._compact_marker_path, "w").close()
+            self._finish_compaction()
+
+            self._vectors = vectors
+            self._alive = np.zeros(capacity, dtype=bool)
+            self._alive[:len(live)] = True
+            self._ids = [self._ids[r] for r in live]
+            self._texts = [self._texts[r] for r in live]
+            self._metadatas = [self._metadatas[r] for r in live]
+            self._row_of = {vid: row for row, vid in enumerate(self._ids)}
+            self._field_rows = {}
+            for row, metadata in enumerate(self._metadatas):
+                self._index_fields(row, metadata)
+            if self._centroids is not None:
+                if assignments is None: # rows not assigned yet : assign them all again
+                    self._assignments = np.zeros(0, dtype=np.int32)
+                    self._assign_rows()
+                else:
+                    self._assignments = assignments
+            self._generation += 1
+        log(f"Compacted local vector index '{self.directory}' : {dead} dead rows dropped, {len(live)} kept.")
+
+    def _maybe_compact(self):
+        dead = self.count - len(self._row_of)
+        if dead >= self.compact_min_rows and dead > self.compact_ratio * self.count:
+            self.compact()
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    # --- writes ---
+    def _set_row(self, row: int, vid: str, text: str, metadata: Dict[str, Any]):
+        if self._alive[row]: # overwritten in place : its old field values no longer apply
+            self._unindex_fields(row)
+        self._ids[row], self._texts[row], self._metadatas[row] = vid, text, dict(metadata)
+        self._row_of[vid] = row
+        self._alive[row] = True
+        self._index_fields(row, metadata)
+
+    def add_embeddings(self, texts: List[str], vectors: List[List[float]],
+                       metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None) -> List[str]:
+        '''Upserts pre-computed vectors. Existing IDs are overwritten in place.'''
+        if not texts:
+            return []
+        matrix = self._normalize(np.asarray(vectors, dtype=np.float32))
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [uuid.uuid4().hex for _ in texts]
+        with self._lock:
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+            self._grow(len(texts))
+            records, overwritten = [], []
+            for text, vector, metadata, vid in zip(texts, matrix, metadatas, ids):
+                row = self._row_of.get(vid)
+                if row is not None and row < len(self._assignments):
+                    overwritten.append(row)
+                if row is None:
+                    row = self.count
+                    self.count += 1
+                    self._ids.append(None)
+                    self._texts.append("")
+                    self._metadatas.append({})
+                self._vectors[row] = vector
+                self._set_row(row, vid, text, metadata)
+                records.append({"row": row, "id": vid, "text": text, "metadata": metadata})
+            self._vectors.flush()
+            with open(self._meta_path, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(r) + "\n" for r in records)
+            self._write_header()
+            if self._training: # reassigned with the new centroids once they are swapped in
+                self._dirty_rows.update(r["row"] for r in records)
+            if self._centroids is not None:
+                self._assign_rows(overwritten)
+            if self._needs_training():
+                self._start_training()
+        return list(ids)
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        return self.add_embeddings(texts, self.embedding.embed_documents(texts), metadatas, ids)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return False
+        with self._lock:
+            removed = [vid for vid in ids if vid in self._row_of]
+            for vid in removed:
+                row = self._row_of.pop(vid)
+                self._alive[row] = False
+                self._unindex_fields(row)
+            with open(self._meta_path, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps({"delete": vid}) + "\n" for vid in removed)
+            self._maybe_compact()
+        return True
+
+    def _index_fields(self, row: int, metadata: Dict[str, Any]):
+        for field in INDEXED_FIELDS:
+            if isinstance(metadata.get(field), (str, int, float, bool)):
+                self._field_rows.setdefault((field, metadata[field]), set()).add(row)
+
+    def _unindex_fields(self, row: int):
+        metadata = self._metadatas[row]
+        for field in INDEXED_FIELDS:
+            if isinstance(metadata.get(field), (str, int, float, bool)):
+                rows = self._field_rows.get((field, metadata[field]))
+                if rows is not None:
+                    rows.discard(row)
+                    if not rows:
+                        del self._field_rows[(field, metadata[field])]
+
+    def _filter_rows(self, filter: Dict[str, Any]) -> Optional[np.ndarray]:
+        """Rows that can match `filter` from the field index, None when no indexed field is filtered on."""
+        allowed = None
+        for field, values in _indexed_values(filter).items():
+            rows = set().union(*(self._field_rows.get((field, v), ()) for v in values))
+            rows = np.sort(np.fromiter(rows, dtype=np.int64, count=len(rows)))
+            allowed = rows if allowed is None else np.intersect1d(allowed, rows, assume_unique=True)
+        return allowed
+
+    # --- IVF ---
+    def _needs_training(self) -> bool:
+        """Caller holds the lock."""
+        if self.mode != "ivf" or self._training:
+            return False
+        live = len(self._row_of)
+        return live >= self.ivf_min_rows and (self._centroids is None or live > 4 * self._trained_rows)
+
+    def _start_training(self):
+        """Trains the quantizer on a background thread. Caller holds the lock."""
+        self._training = True
+        self._dirty_rows = set()
+        threading.Thread(target=self._train_ivf, name="local-index-ivf", daemon=True).start()
+
+    @staticmethod
+    def _nearest_lists(vectors: np.ndarray, start: int, end: int, centroids: np.ndarray, block: int = 65536) -> np.ndarray:
+        parts = [np.zeros(0, dtype=np.int32)]
+        for i in range(start, end, block):
+            parts.append(np.argmax(vectors[i:min(i + block, end)] @ centroids.T, axis=1).astype(np.int32))
+        return np.concatenate(parts)
+
+    def _train_ivf(self):
+        '''
+        Spherical k-means on a sample of the live rows, then every row assigned to its list. Runs
+        without the lock (searches keep using the previous centroids, or an exact scan), the result
+        is swapped in at the end. Discarded if a compaction renumbered the rows meanwhile.
+        '''
+        try:
+            with self._lock:
+                self._training = True
+                generation, count, vectors = self._generation, self.count, self._vectors
+                rows = np.flatnonzero(self._alive[:count])
+                n_lists = self.ivf_lists or max(1, int(np.sqrt(len(rows))))
+                rng = np.random.default_rng(0)
+                sample = np.asarray(vectors[np.sort(rng.choice(rows, size=min(len(rows), 50 * n_lists), replace=False))])
+            centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+            for _ in range(10):
+                nearest = np.argmax(sample @ centroids.T, axis=1)
+                for c in range(n_lists):
+                    members = sample[nearest == c]
+                    if len(members):
+                        centroids[c] = members.mean(axis=0)
+                centroids = self._normalize(centroids)
+            assignments = self._nearest_lists(vectors, 0, count, centroids)
+            with self._lock:
+                if self._generation != generation:
+                    return
+                self._centroids, self._assignments, self._trained_rows = centroids, assignments, len(rows)
+                self._assign_rows(r for r in self._dirty_rows if r < count) # rows past `count` : assigned as new
+            log(f"Trained IVF quantizer with {n_lists} lists on {len(sample)} vectors.")
+        except Exception as e:
+            log(f"IVF training failed, searches stay exact : {e}")
+        finally:
+            with self._lock:
+                self._training = False
+                self._dirty_rows = set()
+
+    def _assign_rows(self, overwritten: Iterable[int] = ()):
+        """Assigns every row without a list yet, and the `overwritten` rows, to their nearest centroid."""
+        overwritten = np.asarray(list(overwritten), dtype=np.int64)
+        if len(overwritten): # new vector in place : its list may have changed
+            self._assignments[overwritten] = np.argmax(self._vectors[overwritten] @ self._centroids.T, axis=1)
+        tail = self._nearest_lists(self._vectors, len(self._assignments), self.count, self._centroids)
+        self._assignments = np.concatenate([self._assignments, tail])
+
+    def _candidate_rows(self, query: np.ndarray, k: int, filter: Optional[Dict[str, Any]]) -> np.ndarray:
+        '''
+        Live rows to score for `query`, matching `filter`. The indexed fields of the filter narrow
+        the rows first, so the IVF probes only count rows that can match : the closest `nprobe`
+        lists, doubled until they hold k candidates (or every list is probed). Until the quantizer
+        is trained (in the background) every row is scored. Caller holds the lock.
+        '''
+        live = self._alive[:self.count]
+        total = len(self._row_of)
+        allowed = self._filter_rows(filter) if filter else None
+        if allowed is not None:
+            live = np.zeros(self.count, dtype=bool)
+            live[allowed] = True
+        if self._needs_training():
+            self._start_training()
+        if (self.mode != "ivf" or self._centroids is None or total < self.ivf_min_rows
+                or int(live.sum()) < self.ivf_min_rows):
+            return self._matching(np.flatnonzero(live), filter)
+        order = np.argsort(-(self._centroids @ query))
+        nprobe = self.ivf_nprobe
+        while True:
+            rows = self._matching(np.flatnonzero(live & np.isin(self._assignments[:self.count], order[:nprobe])), filter)
+            if len(rows) >= k or nprobe >= len(order):
+                return rows
+            nprobe *= 2
+
+    def _matching(self, rows: np.ndarray, filter: Optional[Dict[str, Any]]) -> np.ndarray:
+        """`rows` whose metadata matches every condition of `filter`."""
+        if not filter:
+            return rows
+        return np.array([r for r in rows if _matches(self._metadatas[r], filter)], dtype=np.int64)
+
+    # --- search ---
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4,
+                                               filter: Optional[Dict[str, Any]] = None,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        query = self._normalize(np.asarray(embedding, dtype=np.float32))
+        while True:
+            with self._lock:
+                if self._vectors is None or self.count == 0:
+                    return []
+                rows = self._candidate_rows(query, k, filter)
+                vectors, generation = self._vectors, self._generation # _grow only extends the file : the mapping stays valid
+            if len(rows) == 0:
+                return []
+            scores = vectors[rows] @ query
+            top = np.argpartition(-scores, min(k, len(rows)) - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            with self._lock:
+                if generation != self._generation:
+                    continue # compacted while scoring : the rows were renumbered, search again
+                # rows deleted while scoring are left out
+                return [(Document(id=self._ids[rows[i]], page_content=self._texts[rows[i]],
+                                  metadata=dict(self._metadatas[rows[i]])), float(scores[i]))
+                        for i in top if self._alive[rows[i]]]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None,
+                                     **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k=k, filter=filter)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k=k, **kwargs)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        # cosine similarity in [-1, 1] -> relevance in [0, 1]
+        return lambda score: (score + 1.0) / 2.0
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   ids: Optional[List[str]] = None, directory: str = ".cache/local_index", **kwargs: Any) -> "LocalVectorStore":
+        store = cls(directory, embedding, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
@@ -1,29 +1,67 @@
 
 import os
+import json
 import time
-from typing import List, Dict, Any
+import asyncio
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, Callable, Optional
 import tempfile
 
-from fastapi import FastAPI, HTTPException, status, UploadFile, File
+from fastapi import FastAPI, HTTPException, status, UploadFile, File, Form
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from pydantic import BaseModel, Field
-from langchain_core.messages import HumanMessage, AIMessage
-from langgraph.checkpoint.memory import MemorySaver
-from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.messages import HumanMessage, AIMessage, AIMessageChunk
 
 
 from agent import rag_agent
-from vectorstore import add_document
+from jobs import ingestion_jobs, JobQueueFullError
+from vectorstore import get_vector_store, embeddings, retrieval_filter
+from telemetry import log, metrics
+from clients import warm_up, readiness
+from batch import abatch_chat
+from admission import chat_gate, chat_key, ChatOverloaded
+from config import WARM_UP_ON_STARTUP, BATCH_MAX_CONCURRENCY, BATCH_MAX_QUERIES
+
+# startup warm-up state, reported by /ready
+_warm_up = {"done": False, "vector_store": None, "seconds": None}
+
+def _warm_up_clients():
+    """Builds the API clients (clients.py), checks the Pinecone index and opens the pooled data-plane client."""
+    start = time.perf_counter()
+    errors = warm_up()
+    try:
+        get_vector_store()
+        _warm_up["vector_store"] = None
+    except Exception as e:
+        _warm_up["vector_store"] = f"{type(e).__name__}: {e}"
+        log(f"Vector store warm-up failed, will retry on first use: {e}")
+    failed = {name: error for name, error in errors.items() if error}
+    if failed:
+        log(f"Client warm-up failed, will retry on first use: {failed}")
+    _warm_up.update(done=True, seconds=round(time.perf_counter() - start, 3))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # warm up in the background : the worker serves /health right away, /ready turns 200 once clients are built
+    task = asyncio.create_task(asyncio.to_thread(_warm_up_clients)) if WARM_UP_ON_STARTUP else None
+    if task is None: # clients are built on first use, nothing to wait for
+        _warm_up.update(done=True, seconds=0.0)
+    yield
+    if task is not None and not task.done():
+        task.cancel()
 
 # Initialize FastAPI app
 app = FastAPI(
     title="LangGraph RAG Agent API",
     description="API for the LangGraph-powered RAG agent with Pinecone and Groq.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
-# In-memory session manager for LangGraph checkpoints (for demonstration)
-# We were storing all the conversations in memory saver
-memory = MemorySaver()
+# uploads are copied to the temp file in pieces of this size
+UPLOAD_READ_CHUNK_BYTES = 1024 * 1024
+
+# Conversation checkpoints live in SQLite (checkpointer.py), shared by every worker
 
 # --- Pydantic Models for API ---
 class TraceEvent(BaseModel):
@@ -37,21 +75,70 @@ class QueryRequest(BaseModel):
     session_id: str
     query: str
     enable_web_search: bool = True # NEW: Add web search toggle state
+    namespace: Optional[str] = None # only search this tenant's documents (as given at upload)
+    filters: Optional[Dict[str, Any]] = None # chunk metadata filter, e.g. {"source": "handbook.pdf", "page": {"$in": [3, 4]}}
 
 class AgentResponse(BaseModel):
     response: str
     trace_events: List[TraceEvent] = Field(default_factory=list)
 
+class BatchQueryRequest(BaseModel):
+    queries: List[str] = Field(min_length=1)
+    enable_web_search: bool = True
+    max_concurrency: int = Field(default=BATCH_MAX_CONCURRENCY, ge=1, le=BATCH_MAX_CONCURRENCY) # graph runs in flight at once
+    namespace: Optional[str] = None
+    filters: Optional[Dict[str, Any]] = None
+    stream: bool = False # NDJSON lines as answers finish instead of one response at the end
+
+class BatchItem(BaseModel):
+    index: int # position of the query in the request
+    query: str
+    response: Optional[str] = None
+    route: Optional[str] = None
+    error: Optional[str] = None
+    latency_ms: float
+
+class BatchResponse(BaseModel):
+    results: List[BatchItem] # in query order
+    total_ms: float
+    throughput_qps: float
+    errors: int
+
 class DocumentUploadResponse(BaseModel):
     message: str
     filename: str
-    processed_chunks: int
+    document_id: str
+    namespace: Optional[str] = None
+    job_id: str
+    status: str
+
+class IngestionJobStatus(BaseModel):
+    job_id: str
+    filename: str
+    document_id: str
+    namespace: Optional[str] = None
+    status: str
+    pages_parsed: int
+    chunks_embedded: int
+    vectors_upserted: int
+    chunks_unchanged: int
+    chunks_deleted: int
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
 
 # --- Document Upload Endpoint ---
-@app.post("/upload-document/", response_model=DocumentUploadResponse, status_code=status.HTTP_200_OK)
-async def upload_document(file: UploadFile = File(...)):
+@app.post("/upload-document/", response_model=DocumentUploadResponse, status_code=status.HTTP_202_ACCEPTED)
+async def upload_document(file: UploadFile = File(...), document_id: Optional[str] = Form(None),
+                          namespace: Optional[str] = Form(None)):
     """
-    Uploads a PDF document, extracts text, and adds it to the RAG knowledge base.
+    Uploads a PDF document and queues it for indexing into the RAG knowledge base.
+    Returns a job ID right away, poll GET /jobs/{job_id} for progress.
+    Re-uploading the same `document_id` (defaults to the filename) replaces the previous version,
+    only changed chunks are embedded.
+    Chunks are tagged with the source file name, page, upload time and the optional `namespace`
+    (tenant), which /chat/ requests can then search alone.
     """
     if not file.filename.endswith(".pdf"):
         raise HTTPException(
@@ -59,143 +146,203 @@ async def upload_document(file: UploadFile = File(...)):
             detail="Only PDF files are supported."
         )
 
+    # stream the upload to disk in fixed size pieces instead of reading it all into memory
     with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-        file_content = await file.read()
-        tmp_file.write(file_content)
+        while piece := await file.read(UPLOAD_READ_CHUNK_BYTES):
+            tmp_file.write(piece)
         temp_file_path = tmp_file.name
     
-    print(f"Received PDF for upload: {file.filename}. Saved temporarily to {temp_file_path}")
+    log(f"Received PDF for upload: {file.filename}. Saved temporarily to {temp_file_path}")
 
     try:
-        loader = PyPDFLoader(temp_file_path)
-        documents = loader.load()
-
-        total_chunks_added = 0
-        if documents:
-            full_text_content = "\n\n".join([doc.page_content for doc in documents])
-            add_document(full_text_content)
-            total_chunks_added = len(documents)
-        
-        return DocumentUploadResponse(
-            message=f"PDF '{file.filename}' successfully uploaded and indexed.",
-            filename=file.filename,
-            processed_chunks=total_chunks_added
-        )
-    except Exception as e:
-        print(f"Error processing PDF document: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to process PDF: {e}"
-        )
-    finally:
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
-            print(f"Cleaned up temporary file: {temp_file_path}")
+        # the job parses, splits, embeds and upserts in the background (see jobs.py / ingestion.py)
+        # and deletes the temporary file when it is done
+        job = ingestion_jobs.submit(temp_file_path, file.filename, document_id, namespace)
+    except JobQueueFullError as e:
+        os.remove(temp_file_path)
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+
+    return DocumentUploadResponse(
+        message=f"PDF '{file.filename}' received and queued for indexing.",
+        filename=file.filename,
+        document_id=job.document_id,
+        namespace=job.namespace,
+        job_id=job.job_id,
+        status=job.status
+    )
+
+@app.get("/jobs/{job_id}", response_model=IngestionJobStatus)
+async def get_ingestion_job(job_id: str):
+    """Progress of a background ingestion job : pages parsed, chunks embedded, vectors upserted."""
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Job '{job_id}' not found.")
+    return IngestionJobStatus(**job.to_dict())
 
 # --- Chat Endpoint ---
-@app.post("/chat/", response_model=AgentResponse)
-async def chat_with_agent(request: QueryRequest):
+def _retrieval_filter(namespace: Optional[str], filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """The request's metadata filter (vectorstore.retrieval_filter), 422 when a condition isn't supported."""
+    try:
+        return retrieval_filter(namespace, filters)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+
+def _build_trace_event(step: int, current_node_name: str, node_output_state: Dict[str, Any]) -> TraceEvent:
+    """Turns one streamed graph update into a TraceEvent for the frontend."""
+    event_description = f"Executing node: {current_node_name}"
+    event_details = {}
+    event_type = "generic_node_execution"
+
+    if current_node_name == "contextualize":
+        query_rewrite = node_output_state.get("query_rewrite", {})
+        if query_rewrite.get("rewritten") != query_rewrite.get("original"):
+            event_description = f"Follow-up rewritten as a standalone query: '{query_rewrite.get('rewritten')}'."
+        else:
+            event_description = "Query is standalone, no rewrite needed."
+        event_details = dict(query_rewrite)
+        event_type = "query_rewrite"
+
+    elif current_node_name == "semantic_cache":
+        cache_info = node_output_state.get("cache_info", {})
+        if cache_info.get("hit"):
+            event_description = f"Semantic cache hit (similarity {cache_info.get('similarity')}). Returning the cached answer."
+            event_type = "cache_hit"
+        else:
+            event_description = "Semantic cache miss. Proceeding to router."
+            event_type = "cache_miss"
+        event_details = cache_info
+    elif current_node_name == "router":
+        route_decision = node_output_state.get('route')
+        # Check for overridden route if web search was disabled
+        initial_decision = node_output_state.get('initial_router_decision', route_decision)
+        override_reason = node_output_state.get('router_override_reason', None)
+
+        if override_reason:
+            event_description = f"Router initially decided: '{initial_decision}'. Overridden to: '{route_decision}' because {override_reason}."
+            event_details = {"initial_decision": initial_decision, "final_decision": route_decision, "override_reason": override_reason}
+        else:
+            event_description = f"Router decided: '{route_decision}'"
+            event_details = {"decision": route_decision, "reason": "Based on initial query analysis."}
+        event_details["router_tier"] = node_output_state.get("router_tier", "llm")
+        if node_output_state.get("router_confidence") is not None:
+            event_details["router_confidence"] = node_output_state["router_confidence"]
+        if node_output_state.get("router_stats"):
+            event_details["llm_calls_avoided"] = node_output_state["router_stats"].get("llm_calls_avoided", 0)
+        if node_output_state.get("speculation"):
+            event_details["speculation"] = node_output_state["speculation"]
+        event_type = "router_decision"
+    elif current_node_name == "rag_lookup":
+        rag_content_summary = node_output_state.get("rag", "")[:200] + "..."
+        
+        rag_sufficient = node_output_state.get("route") == "answer" 
+        
+        if rag_sufficient:
+            event_description = f"RAG Lookup performed. Content found and deemed sufficient. Proceeding to answer."
+            event_details = {"retrieved_content_summary": rag_content_summary, "sufficiency_verdict": "Sufficient"}
+        else:
+            event_description = f"RAG Lookup performed. Content NOT sufficient. Diverting to web search."
+            event_details = {"retrieved_content_summary": rag_content_summary, "sufficiency_verdict": "Not Sufficient"}
+        
+        if node_output_state.get("rag_gate"):
+            rag_gate = node_output_state["rag_gate"]
+            event_details["sufficiency_decided_by"] = rag_gate["decided_by"]
+            event_details["top_score"] = rag_gate["top_score"]
+            event_details["judge_calls_skipped"] = rag_gate["stats"]["judge_calls_skipped"]
+        event_type = "rag_action"
+    elif current_node_name == "web_search":
+        web_content_summary = node_output_state.get("web", "")[:200] + "..."
+        event_description = f"Web Search performed. Results retrieved. Proceeding to answer."
+        event_details = {"retrieved_content_summary": web_content_summary}
+        cache_stats = node_output_state.get("web_cache")
+        if cache_stats:
+            event_details["web_cache_hits"] = cache_stats["hits"] + cache_stats["stale_hits"]
+            event_details["web_searches_coalesced"] = cache_stats["coalesced"]
+            event_details["web_searches_avoided"] = cache_stats["searches_avoided"]
+        event_type = "web_action"
+    elif current_node_name == "answer":
+        event_description = "Generating final answer using gathered context."
+        event_type = "answer_generation"
+        packing = node_output_state.get("context_packing") or {}
+        if packing:
+            event_details = {"context_tokens_before": packing.get("tokens_before"),
+                             "context_tokens_after": packing.get("tokens_after"),
+                             "chunks_merged": packing.get("chunks_merged"),
+                             "duplicates_dropped": packing.get("duplicates_dropped")}
+    elif current_node_name == "__end__":
+        event_description = "Agent process completed."
+        event_type = "process_end"
+
+    if node_output_state.get("telemetry"):
+        event_details = {**event_details, "span": node_output_state["telemetry"]}
+
+    return TraceEvent(
+        step=step,
+        node_name=current_node_name,
+        description=event_description,
+        details=event_details,
+        event_type=event_type
+    )
+
+def _split_stream_item(s: Dict[str, Any]):
+    """Returns (node_name, node_output_state) for one item yielded by the graph stream."""
+    if '__end__' in s:
+        return '__end__', s['__end__']
+    current_node_name = list(s.keys())[0]
+    return current_node_name, s[current_node_name]
+
+def _final_ai_message(final_actual_state_dict: Dict[str, Any] | None) -> str:
+    """Extracts the last AIMessage content from the final node output."""
+    if final_actual_state_dict and "messages" in final_actual_state_dict:
+        for msg in reversed(final_actual_state_dict["messages"]):
+            if isinstance(msg, AIMessage):
+                return msg.content
+    return ""
+
+async def _run_chat(request: QueryRequest, search_filter: Optional[Dict[str, Any]]) -> AgentResponse:
+    """One graph run for /chat/, the response with its trace events."""
     trace_events_for_frontend: List[TraceEvent] = []
+    start = time.perf_counter()
     
     try:
-        # Pass enable_web_search into the config for the agent to access
+        # Pass enable_web_search and the retrieval filter into the config for the agent to access
         config = {
             "configurable": {
                 "thread_id": request.session_id,
-                "web_search_enabled": request.enable_web_search
+                "web_search_enabled": request.enable_web_search,
+                "retrieval_filter": search_filter
             }
         }
         inputs = {"messages": [HumanMessage(content=request.query)]}
 
         final_message = ""
         
-        print(f"--- Starting Agent Stream for session {request.session_id} ---")
-        print(f"Web Search Enabled: {request.enable_web_search}") # For server-side debugging
-
-        for i, s in enumerate(rag_agent.stream(inputs, config=config)):
-            current_node_name = None
-            node_output_state = None
-
-            if '__end__' in s:
-                current_node_name = '__end__'
-                node_output_state = s['__end__']
-            else:
-                current_node_name = list(s.keys())[0] 
-                node_output_state = s[current_node_name]
-
-            event_description = f"Executing node: {current_node_name}"
-            event_details = {}
-            event_type = "generic_node_execution"
-
-            if current_node_name == "router":
-                route_decision = node_output_state.get('route')
-                # Check for overridden route if web search was disabled
-                initial_decision = node_output_state.get('initial_router_decision', route_decision)
-                override_reason = node_output_state.get('router_override_reason', None)
-
-                if override_reason:
-                    event_description = f"Router initially decided: '{initial_decision}'. Overridden to: '{route_decision}' because {override_reason}."
-                    event_details = {"initial_decision": initial_decision, "final_decision": route_decision, "override_reason": override_reason}
-                else:
-                    event_description = f"Router decided: '{route_decision}'"
-                    event_details = {"decision": route_decision, "reason": "Based on initial query analysis."}
-                event_type = "router_decision"
-            elif current_node_name == "rag_lookup":
-                rag_content_summary = node_output_state.get("rag", "")[:200] + "..."
-                
-                rag_sufficient = node_output_state.get("route") == "answer" 
-                
-                if rag_sufficient:
-                    event_description = f"RAG Lookup performed. Content found and deemed sufficient. Proceeding to answer."
-                    event_details = {"retrieved_content_summary": rag_content_summary, "sufficiency_verdict": "Sufficient"}
-                else:
-                    event_description = f"RAG Lookup performed. Content NOT sufficient. Diverting to web search."
-                    event_details = {"retrieved_content_summary": rag_content_summary, "sufficiency_verdict": "Not Sufficient"}
-                
-                event_type = "rag_action"
-            elif current_node_name == "web_search":
-                web_content_summary = node_output_state.get("web", "")[:200] + "..."
-                event_description = f"Web Search performed. Results retrieved. Proceeding to answer."
-                event_details = {"retrieved_content_summary": web_content_summary}
-                event_type = "web_action"
-            elif current_node_name == "answer":
-                event_description = "Generating final answer using gathered context."
-                event_type = "answer_generation"
-            elif current_node_name == "__end__":
-                event_description = "Agent process completed."
-                event_type = "process_end"
-
-            trace_events_for_frontend.append(
-                TraceEvent(
-                    step=i + 1,
-                    node_name=current_node_name,
-                    description=event_description,
-                    details=event_details,
-                    event_type=event_type
-                )
-            )
-            print(f"Streamed Event: Step {i+1} - Node: {current_node_name} - Desc: {event_description}")
+        log(f"--- Starting Agent Stream for session {request.session_id} ---")
+        log(f"Web Search Enabled: {request.enable_web_search}") # For server-side debugging
+
+        # astream runs the async node variants, so LLM / Pinecone / Tavily calls
+        # yield to the event loop and one worker can serve many chats concurrently
+        s = None
+        i = 0
+        async for s in rag_agent.astream(inputs, config=config):
+            current_node_name, node_output_state = _split_stream_item(s)
+            trace_event = _build_trace_event(i + 1, current_node_name, node_output_state)
+            trace_events_for_frontend.append(trace_event)
+            log(f"Streamed Event: Step {i+1} - Node: {current_node_name} - Desc: {trace_event.description}")
+            i += 1
 
         # Get the final state from the last yielded item in the stream
         final_actual_state_dict = None
         if s:
-            if '__end__' in s:
-                final_actual_state_dict = s['__end__']
-            else:
-                if list(s.keys()):
-                    final_actual_state_dict = s[list(s.keys())[0]]
-
-        if final_actual_state_dict and "messages" in final_actual_state_dict:
-            for msg in reversed(final_actual_state_dict["messages"]):
-                if isinstance(msg, AIMessage):
-                    final_message = msg.content
-                    break
+            _, final_actual_state_dict = _split_stream_item(s)
+
+        final_message = _final_ai_message(final_actual_state_dict)
         
         if not final_message:
-             print("Agent finished, but no final AIMessage found in the final state after stream completion.")
+             log("Agent finished, but no final AIMessage found in the final state after stream completion.")
              raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Agent did not return a valid response (final AI message not found).")
 
-        print(f"--- Agent Stream Ended. Final Response: {final_message[:200]}... ---")
+        log(f"--- Agent Stream Ended. Final Response: {final_message[:200]}... ---")
+        metrics.observe_request(time.perf_counter() - start, endpoint="/chat/")
 
         return AgentResponse(response=final_message, trace_events=trace_events_for_frontend)
 
@@ -203,10 +350,195 @@ async def chat_with_agent(request: QueryRequest):
         import traceback
         traceback.print_exc()
         error_details = f"Error during agent invocation: {e}"
-        print(error_details)
+        log(error_details)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Internal Server Error: {e}")
+
+@app.post("/chat/", response_model=AgentResponse)
+async def chat_with_agent(request: QueryRequest):
+    """
+    Answers one chat turn. Requests of one session run one at a time, an identical request already
+    in flight (double-submit, client retry) shares its response, and past CHAT_MAX_INFLIGHT requests
+    (+ CHAT_MAX_QUEUED waiting CHAT_QUEUE_TIMEOUT_SECONDS) the answer is 429 with Retry-After (see admission.py).
+    """
+    search_filter = _retrieval_filter(request.namespace, request.filters)
+    key = chat_key(request.session_id, request.query, request.enable_web_search, search_filter)
+    try:
+        response, outcome = await chat_gate.run(key, lambda: _run_chat(request, search_filter))
+    except ChatOverloaded as e:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e),
+                            headers={"Retry-After": str(e.retry_after)})
+    if outcome == "coalesced":
+        log(f"Request joined an identical one in flight for session {request.session_id}")
+    return response
     
 
+# --- Streaming Chat Endpoint (Server-Sent Events) ---
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """Formats one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+class _AdmittedStreamingResponse(StreamingResponse):
+    '''
+    StreamingResponse holding a chat_gate admission (`release`) until it ends : finished, failed,
+    client gone, or never started. The body generator is closed first, so the graph run stops.
+    '''
+
+    def __init__(self, content, release: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self._release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                await self.body_iterator.aclose()
+            finally:
+                self._release()
+
+
+async def _admit(session_id: Optional[str], slots: int = 1) -> Callable[[], None]:
+    """chat_gate.admit, ChatOverloaded answered with 429 + Retry-After."""
+    try:
+        return await chat_gate.admit(session_id, slots)
+    except ChatOverloaded as e:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e),
+                            headers={"Retry-After": str(e.retry_after)})
+
+@app.post("/chat/stream")
+async def chat_with_agent_stream(request: QueryRequest):
+    """
+    Same agent as /chat/, streamed as Server-Sent Events :
+    - `trace` : one TraceEvent as soon as each node finishes
+    - `token` : answer tokens as answer_llm produces them
+    - `done`  : final response, with time-to-first-byte and time-to-first-token in ms
+    - `error` : if the agent fails mid-stream
+    Admitted like /chat/ (429 past the limits, one turn per session at a time, see admission.py),
+    the slot is held until the stream ends. Identical requests are not coalesced.
+    """
+    config = {
+        "configurable": {
+            "thread_id": request.session_id,
+            "web_search_enabled": request.enable_web_search,
+            "retrieval_filter": _retrieval_filter(request.namespace, request.filters)
+        }
+    }
+    inputs = {"messages": [HumanMessage(content=request.query)]}
+
+    async def event_stream():
+        start = time.perf_counter()
+        ttfb_ms = ttft_ms = None
+        step = 0
+        last_node_state = None
+        log(f"--- Starting streamed Agent run for session {request.session_id} ---")
+        try:
+            # "updates" gives one item per finished node, "messages" gives LLM tokens as they arrive
+            async for mode, chunk in rag_agent.astream(inputs, config=config, stream_mode=["updates", "messages"]):
+                if mode == "messages":
+                    message_chunk, metadata = chunk
+                    # only the answer node's tokens are user facing (router / judge emit structured output)
+                    if metadata.get("langgraph_node") != "answer" or not message_chunk.content:
+                        continue
+                    # the finished AIMessage is emitted too : skip it unless the model didn't stream
+                    if not isinstance(message_chunk, AIMessageChunk) and ttft_ms is not None:
+                        continue
+                    if ttft_ms is None:
+                        ttft_ms = (time.perf_counter() - start) * 1000
+                    payload = _sse("token", {"text": message_chunk.content})
+                else:
+                    current_node_name, last_node_state = _split_stream_item(chunk)
+                    step += 1
+                    payload = _sse("trace", _build_trace_event(step, current_node_name, last_node_state).model_dump())
+                if ttfb_ms is None:
+                    ttfb_ms = (time.perf_counter() - start) * 1000
+                yield payload
+
+            final_message = _final_ai_message(last_node_state)
+            total_ms = (time.perf_counter() - start) * 1000
+            log(f"--- Streamed Agent run ended: ttfb={ttfb_ms} ms, ttft={ttft_ms} ms, total={total_ms:.1f} ms ---")
+            metrics.observe_request(total_ms / 1000, endpoint="/chat/stream")
+            yield _sse("done", {"response": final_message, "ttfb_ms": ttfb_ms, "ttft_ms": ttft_ms, "total_ms": total_ms})
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            yield _sse("error", {"detail": f"Internal Server Error: {e}"})
+
+    release = await _admit(request.session_id)
+    return _AdmittedStreamingResponse(event_stream(), release, media_type="text/event-stream",
+                                      headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# --- Batch Chat Endpoint ---
+@app.post("/chat/batch", response_model=BatchResponse)
+async def chat_batch(request: BatchQueryRequest):
+    """
+    Answers many independent questions in one request (see batch.py) : one embedding call for the
+    whole batch, then up to `max_concurrency` graph runs in flight. No conversation history is kept.
+    With `stream`, returns NDJSON : one BatchItem line per answer as soon as it is ready (any order,
+    tagged with `index`), then a final {"done": true, ...} summary line.
+    The batch holds `max_concurrency` of the CHAT_MAX_INFLIGHT admission slots until it is answered
+    (429 when they aren't free within CHAT_QUEUE_TIMEOUT_SECONDS, see admission.py).
+    """
+    if len(request.queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"At most {BATCH_MAX_QUERIES} queries per batch.")
+    search_filter = _retrieval_filter(request.namespace, request.filters)
+    release = await _admit(None, min(request.max_concurrency, len(request.queries)))
+    start = time.perf_counter()
+    results = abatch_chat(request.queries, request.enable_web_search, request.max_concurrency, search_filter)
+
+    def summary(items: List[BatchItem]) -> Dict[str, Any]:
+        total_ms = (time.perf_counter() - start) * 1000
+        metrics.observe_request(total_ms / 1000, endpoint="/chat/batch")
+        return {"total_ms": round(total_ms, 1), "throughput_qps": round(len(items) / (total_ms / 1000), 2),
+                "errors": sum(item.error is not None for item in items)}
+
+    if request.stream:
+        async def lines():
+            items = []
+            async for result in results:
+                item = BatchItem(**result.as_dict())
+                items.append(item)
+                yield item.model_dump_json() + "\n"
+            yield json.dumps({"done": True, **summary(items)}) + "\n"
+        return _AdmittedStreamingResponse(lines(), release, media_type="application/x-ndjson",
+                                          headers={"X-Accel-Buffering": "no"})
+
+    try:
+        items = [BatchItem(**result.as_dict()) async for result in results]
+    finally:
+        release()
+    items.sort(key=lambda item: item.index)
+    return BatchResponse(results=items, **summary(items))
+
+
 @app.get("/health")
 async def health_check():
-    return {"status": "ok"}
\ No newline at end of file
+    """Liveness : the process is up and serving."""
+    return {"status": "ok"}
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness : warm-up finished and every client and the vector store could be built. 503 otherwise."""
+    clients = readiness()
+    # without warm-up a client not built yet is fine (built on first use), only a failed build isn't
+    ready = _warm_up["done"] and _warm_up["vector_store"] is None and all(
+        c["ready"] or (not WARM_UP_ON_STARTUP and not c.get("error")) for c in clients.values())
+    body = {"status": "ready" if ready else "not_ready", "warm_up_done": _warm_up["done"],
+            "warm_up_seconds": _warm_up["seconds"], "vector_store_error": _warm_up["vector_store"], "clients": clients}
+    return JSONResponse(body, status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Per-node latency / token / retrieval histograms and cache counters, Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/chat/admission/stats")
+async def chat_admission_stats():
+    """Admitted / coalesced / rejected counters of /chat/, and the requests in flight and queued now."""
+    return chat_gate.stats()
+
+@app.get("/embedding-cache/stats")
+async def embedding_cache_stats():
+    """Hit / miss counters of the embedding cache in front of the embedding model."""
+    return embeddings.stats()
@@ -0,0 +1,89 @@
+'''
+Document manifest : which chunks (vector IDs) every document owns in the vector store.
+
+Chunk IDs are deterministic, derived from the document ID and a hash of the chunk text,
+so uploading the same content twice writes the same vectors instead of duplicates.
+On re-upload the ingestion pipeline compares the new chunk IDs with the manifest :
+only new chunks are embedded and upserted, chunks that disappeared are deleted.
+'''
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Optional, Set, Iterable
+
+from config import MANIFEST_PATH
+from clients import lazy_client
+from embedding_cache import normalize_text
+
+
+def document_hash_key(document_id: str) -> str:
+    """Short, ASCII-safe key for a document ID (user supplied IDs / filenames may be anything)."""
+    return hashlib.sha256(document_id.encode("utf-8")).hexdigest()[:16]
+
+def chunk_id(document_id: str, text: str) -> str:
+    """Deterministic vector ID : same document + same chunk text -> same ID."""
+    content_hash = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()[:32]
+    return f"{document_hash_key(document_id)}-{content_hash}"
+
+def file_sha256(file_path: str, block_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while block := f.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DocumentManifest:
+    '''SQLite backed (WAL), safe to share between threads and workers.'''
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS documents (
+                                  document_id TEXT PRIMARY KEY,
+                                  content_hash TEXT,
+                                  updated_at REAL)""")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS chunks (
+                                  document_id TEXT NOT NULL,
+                                  chunk_id TEXT NOT NULL,
+                                  PRIMARY KEY (document_id, chunk_id))""")
+        self._conn.commit()
+
+    def content_hash(self, document_id: str) -> Optional[str]:
+        """Hash of the file that was last ingested for this document, None if unknown."""
+        with self._lock:
+            row = self._conn.execute("SELECT content_hash FROM documents WHERE document_id = ?",
+                                     (document_id,)).fetchone()
+        return row[0] if row else None
+
+    def chunk_ids(self, document_id: str) -> Set[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT chunk_id FROM chunks WHERE document_id = ?",
+                                      (document_id,)).fetchall()
+        return {r[0] for r in rows}
+
+    def version(self) -> str:
+        """Changes whenever any document is (re)ingested. Shared by every worker using the same file."""
+        with self._lock:
+            count, updated_at = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(MAX(updated_at), 0) FROM documents").fetchone()
+        return f"{count}:{updated_at}"
+
+    def replace(self, document_id: str, content_hash: Optional[str], chunk_ids: Iterable[str]):
+        """Records the complete chunk set of a document after a successful ingest."""
+        with self._lock:
+            with self._conn: # one transaction
+                self._conn.execute("DELETE FROM chunks WHERE document_id = ?", (document_id,))
+                self._conn.executemany("INSERT OR IGNORE INTO chunks (document_id, chunk_id) VALUES (?, ?)",
+                                       [(document_id, c) for c in chunk_ids])
+                self._conn.execute("INSERT OR REPLACE INTO documents (document_id, content_hash, updated_at) VALUES (?, ?, ?)",
+                                   (document_id, content_hash, time.time()))
+
+
+# process-wide manifest, next to the embedding cache by default : opened by the warm-up or on first use
+document_manifest = lazy_client("document_manifest", lambda: DocumentManifest(MANIFEST_PATH))
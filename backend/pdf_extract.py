@@ -0,0 +1,95 @@
+'''
+Parallel PDF text extraction for the ingestion pipeline.
+
+pypdf is pure Python : extracting a long PDF page after page keeps one core busy for the whole
+parse. Here the pages are cut into ranges of PDF_PAGES_PER_SHARD pages and extracted by a
+process pool :
+
+    temp file of the upload  --mmap-->  worker 1 : pages [0, 16)   \
+                             --mmap-->  worker 2 : pages [16, 32)   >--> (page, text) in page order
+                             --mmap-->  ...                        /
+
+Workers get the file path and a page range, never the PDF bytes : each one maps the file
+read-only and parses its range straight from the mapping (pages share the OS page cache, nothing
+is pickled but the extracted text). At most 2 shards per worker are in flight ahead of the
+consumer, so the streaming pipeline in ingestion.py keeps its bounded memory.
+
+The text of a page is what PyPDFLoader produced (plain extraction, stripped), the page number
+is 0-based like PyPDFLoader's "page" metadata. Small PDFs (< PDF_PARALLEL_MIN_PAGES pages) are
+extracted in the calling process, the hand-off would cost more than it saves.
+'''
+import os
+import mmap
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config import PDF_EXTRACT_WORKERS, PDF_PAGES_PER_SHARD, PDF_PARALLEL_MIN_PAGES
+
+
+def default_workers() -> int:
+    return PDF_EXTRACT_WORKERS or os.cpu_count() or 1
+
+
+def _page_text(page) -> str:
+    return page.extract_text(extraction_mode="plain").strip()
+
+
+def _extract_range(file_path: str, start: int, stop: int) -> List[str]:
+    """Runs in a pool worker : text of pages [start, stop), parsed from a read-only mapping of the file."""
+    from pypdf import PdfReader
+    with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        reader = PdfReader(data)
+        return [_page_text(reader.pages[i]) for i in range(start, stop)]
+
+
+def page_count(file_path: str) -> int:
+    from pypdf import PdfReader
+    with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return len(PdfReader(data).pages)
+
+
+# one pool per worker count, shared by every ingestion job (the pool bounds the CPU used by parsing)
+_pools: Dict[int, ProcessPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+def _pool(workers: int) -> ProcessPoolExecutor:
+    with _pools_lock:
+        if workers not in _pools:
+            # not fork : the API process runs threads (job queue, log listener) that a fork would copy mid-state
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pools[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+        return _pools[workers]
+
+
+def iter_pages(file_path: str, workers: Optional[int] = None,
+               pages_per_shard: int = PDF_PAGES_PER_SHARD) -> Iterator[Tuple[int, str]]:
+    '''
+    Yields (page number, text) for every page of the PDF, in page order.
+    With `workers` > 1 (default : PDF_EXTRACT_WORKERS, 0 = one per core) page ranges are
+    extracted in parallel by a process pool.
+    '''
+    workers = workers or default_workers()
+    total = page_count(file_path)
+    if workers <= 1 or total < PDF_PARALLEL_MIN_PAGES:
+        from pypdf import PdfReader
+        with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for page, page_obj in enumerate(PdfReader(data).pages):
+                yield page, _page_text(page_obj)
+        return
+
+    pool = _pool(workers)
+    shards = deque((start, min(start + pages_per_shard, total)) for start in range(0, total, pages_per_shard))
+    inflight = deque()
+    try:
+        while shards or inflight:
+            while shards and len(inflight) < 2 * workers:
+                start, stop = shards.popleft()
+                inflight.append((start, pool.submit(_extract_range, file_path, start, stop)))
+            start, future = inflight.popleft()
+            yield from enumerate(future.result(), start)
+    finally:
+        for _, future in inflight: # consumer stopped early (error downstream) : drop the shards not started
+            future.cancel()
@@ -0,0 +1,201 @@
+'''
+Semantic response cache, checked before router_node.
+
+The query is embedded (through the embedding cache, so a repeated question costs nothing)
+and compared with the queries answered before, using a flat in-process NumPy index
+(cosine similarity = dot product of normalized vectors). When the best match passes
+`threshold`, its stored answer is returned and the router / retrieval / judge / answer
+calls are all skipped.
+
+Entries are partitioned by (web_search_enabled, retrieval scope, knowledge base version).
+The scope is the request's metadata filter / namespace (vectorstore.filter_scope) : an answer
+built from one tenant's documents is never served to another. The KB version
+comes from the document manifest and changes on every ingest, so answers computed against
+an older knowledge base are never served again and are dropped on the next access.
+Entries also expire after `ttl_seconds` (or the shorter TTL passed to store : agent.py gives answers
+built from web results WEB_CACHE_TTL_SECONDS, so they are never fresher-looking than the web cache
+allows), and the least recently used ones are evicted once `max_entries` is reached.
+'''
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_TTL_SECONDS, SEMANTIC_CACHE_MAX_ENTRIES
+from vectorstore import embeddings
+from manifest import document_manifest
+
+
+@dataclass(eq=False) # hashed by identity, the LRU order is keyed on the entries
+class CacheEntry:
+    query: str
+    answer: str
+    created_at: float
+    last_used: float
+    expires_at: float
+    row: int = -1 # row of the entry in its partition's matrix
+
+
+class _Partition:
+    '''
+    Flat index for one (web_search_enabled, scope, kb_version) key : a preallocated (capacity, dim)
+    matrix grown by doubling (like local_index.py), its first len(entries) rows in use. Removing
+    an entry moves the last row into its place, so neither add nor remove copies the matrix.
+    '''
+
+    def __init__(self):
+        self._vectors: Optional[np.ndarray] = None
+        self._expires = np.zeros(0)
+        self.entries: List[CacheEntry] = []
+
+    def add(self, vector: np.ndarray, entry: CacheEntry):
+        n = len(self.entries)
+        if self._vectors is None or n == len(self._vectors):
+            capacity = max(16, 2 * n)
+            vectors = np.zeros((capacity, len(vector)), dtype=np.float32)
+            expires = np.zeros(capacity)
+            if n:
+                vectors[:n], expires[:n] = self._vectors[:n], self._expires[:n]
+            self._vectors, self._expires = vectors, expires
+        self._vectors[n], self._expires[n] = vector, entry.expires_at
+        entry.row = n
+        self.entries.append(entry)
+
+    def remove(self, entry: CacheEntry):
+        i = entry.row
+        last = self.entries.pop()
+        if last is not entry:
+            n = len(self.entries)
+            self._vectors[i], self._expires[i] = self._vectors[n], self._expires[n]
+            self.entries[i] = last
+            last.row = i
+
+    def expired(self, now: float) -> List[CacheEntry]:
+        rows = np.flatnonzero(self._expires[:len(self.entries)] < now)
+        return [self.entries[i] for i in rows]
+
+    def best_match(self, vector: np.ndarray) -> Tuple[int, float]:
+        if not self.entries:
+            return -1, 0.0
+        scores = self._vectors[:len(self.entries)] @ vector
+        i = int(np.argmax(scores))
+        return i, float(scores[i])
+
+
+class SemanticCache:
+
+    def __init__(self, embedder=embeddings, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 ttl_seconds: float = SEMANTIC_CACHE_TTL_SECONDS, max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._partitions: Dict[Tuple[bool, str, str], _Partition] = {}
+        self._lru: "OrderedDict[CacheEntry, Tuple[bool, str, str]]" = OrderedDict() # entry -> partition key, oldest first
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    @staticmethod
+    def kb_version() -> str:
+        return document_manifest.version()
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    # --- maintenance (caller holds the lock) ---
+    def _remove(self, key: Tuple[bool, str, str], entry: CacheEntry):
+        partition = self._partitions[key]
+        partition.remove(entry)
+        if not partition.entries:
+            del self._partitions[key]
+        del self._lru[entry]
+        self._stats["evictions"] += 1
+
+    def _drop_stale_versions(self, kb_version: str):
+        for key in [k for k in self._partitions if k[2] != kb_version]:
+            for entry in self._partitions.pop(key).entries:
+                del self._lru[entry]
+                self._stats["evictions"] += 1
+
+    def _expire(self, key: Tuple[bool, str, str], now: float):
+        for entry in reversed(self._partitions[key].expired(now)): # last rows first
+            self._remove(key, entry)
+
+    def _evict_lru(self):
+        while len(self._lru) > self.max_entries:
+            entry, key = next(iter(self._lru.items()))
+            self._remove(key, entry)
+
+    # --- lookup / store ---
+    def _lookup_vector(self, vector, web_search_enabled: bool, kb_version: str, scope: str) -> Tuple[Optional[str], float]:
+        now = time.time()
+        with self._lock:
+            self._drop_stale_versions(kb_version)
+            key = (web_search_enabled, scope, kb_version)
+            partition = self._partitions.get(key)
+            if partition is not None:
+                self._expire(key, now)
+                i, similarity = partition.best_match(self._normalize(vector))
+                if i >= 0 and similarity >= self.threshold:
+                    entry = partition.entries[i]
+                    entry.last_used = now
+                    self._lru.move_to_end(entry)
+                    self._stats["hits"] += 1
+                    return entry.answer, similarity
+            else:
+                similarity = 0.0
+            self._stats["misses"] += 1
+            return None, similarity
+
+    def lookup(self, query: str, web_search_enabled: bool, kb_version: str, scope: str = "") -> Tuple[Optional[str], float]:
+        """Returns (cached answer or None, best similarity)."""
+        return self._lookup_vector(self.embedder.embed_query(query), web_search_enabled, kb_version, scope)
+
+    async def alookup(self, query: str, web_search_enabled: bool, kb_version: str, scope: str = "") -> Tuple[Optional[str], float]:
+        return self._lookup_vector(await self.embedder.aembed_query(query), web_search_enabled, kb_version, scope)
+
+    def _store_vector(self, vector, query: str, answer: str, web_search_enabled: bool, kb_version: str, scope: str,
+                      current_version: str, ttl_seconds: Optional[float]):
+        if kb_version != current_version:
+            return # the knowledge base changed while this answer was being generated
+        now = time.time()
+        key = (web_search_enabled, scope, kb_version)
+        ttl = self.ttl_seconds if ttl_seconds is None else min(ttl_seconds, self.ttl_seconds)
+        entry = CacheEntry(query, answer, now, now, now + ttl)
+        with self._lock:
+            self._partitions.setdefault(key, _Partition()).add(self._normalize(vector), entry)
+            self._lru[entry] = key
+            self._stats["stores"] += 1
+            self._evict_lru()
+
+    def store(self, query: str, answer: str, web_search_enabled: bool, kb_version: str, scope: str = "",
+              ttl_seconds: Optional[float] = None):
+        """Caches `answer` for `query`, for min(ttl_seconds, self.ttl_seconds)."""
+        self._store_vector(self.embedder.embed_query(query), query, answer, web_search_enabled, kb_version, scope,
+                           self.kb_version(), ttl_seconds)
+
+    async def astore(self, query: str, answer: str, web_search_enabled: bool, kb_version: str, scope: str = "",
+                     ttl_seconds: Optional[float] = None):
+        # the manifest version is a SQLite read : off the event loop, and before taking the lock
+        vector = await self.embedder.aembed_query(query)
+        current_version = await asyncio.to_thread(self.kb_version)
+        self._store_vector(vector, query, answer, web_search_enabled, kb_version, scope, current_version, ttl_seconds)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._lru)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+# process-wide cache used by the agent graph
+semantic_cache = SemanticCache()
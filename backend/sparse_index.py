@@ -0,0 +1,486 @@
+'''
+Local BM25 (sparse) index, kept next to the dense vectors and fused with them (see vectorstore.hybrid_search).
+
+Dense embeddings blur exact tokens such as product codes or error IDs ("ERR-4021"), BM25 matches
+them exactly. Tokens keep codes whole and also index their parts ("err-4021", "err", "4021").
+
+Layout (SPARSE_INDEX_DIR) : a log-structured set of immutable segments plus a small in-memory delta.
+- segments.json        : the live segment names (replaced atomically, a half written segment is never loaded)
+- deletes.log          : append-only "<segment> <row>" tombstones
+- <segment>/terms.txt           sorted vocabulary, one term per line
+  <segment>/term_offsets.u64    postings of term i = [offsets[i], offsets[i + 1])
+  <segment>/post_docs.u32       row of every posting     } memory-mapped, so a segment costs
+  <segment>/post_tfs.u16        term frequency           } (almost) no RAM until it is queried
+  <segment>/doc_len.u32         tokens per row
+  <segment>/doc_offsets.u64 + docs.jsonl   {"id", "text", "metadata"} per row, read only for the hits
+  <segment>/doc_ids.txt         chunk ID per row (loaded, for dedupe and deletes)
+
+New chunks go to the delta; flush() (called at the end of every ingest, or every `flush_docs`
+chunks) writes it as a new segment. Above `max_segments` the smallest half of the segments are
+merged into one, dropping tombstoned rows.
+Document frequencies count tombstoned rows until they are merged away (standard for segment indexes).
+
+The metadata fields in local_index.INDEXED_FIELDS (namespace, document_id, source) are indexed as
+"@field=value" postings (no text token contains "@"). Filters on them select the allowed rows
+before scoring, so a tenant's search only ranks that tenant's chunks. Segments written before
+these postings existed fall back to scoring more candidates and filtering them afterwards.
+
+Several processes (API workers) can share a directory. Writes (flush, delete, merge) hold an
+exclusive flock on <directory>/lock, reloads a shared one. Before every read or write an index
+compares the stat of segments.json and deletes.log with what it last loaded and reloads the
+segments and tombstones another process wrote (its own unflushed delta is kept). Without fcntl
+(Windows) there is no cross-process lock : use one writer per directory there.
+'''
+import os
+import re
+import json
+import uuid
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from config import SPARSE_INDEX_DIR
+from local_index import _matches, _indexed_values, INDEXED_FIELDS
+from telemetry import log
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+_PART_PATTERN = re.compile(r"[-_./]")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have how i if in into is it its of on or that the their "
+    "then there these they this to was were what when where which who why will with you your".split())
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in _TOKEN_PATTERN.findall(text.lower()):
+        if token not in _STOPWORDS:
+            tokens.append(token)
+        if not token.isalnum(): # compound code : index the parts too
+            tokens.extend(p for p in _PART_PATTERN.split(token) if p and p not in _STOPWORDS)
+    return tokens
+
+
+def _field_term(field: str, value: Any) -> str:
+    return f"@{field}={value}".replace("\n", " ")
+
+
+def _field_terms(metadata: Dict[str, Any]) -> List[str]:
+    """The "@field=value" postings of a chunk."""
+    return [_field_term(f, metadata[f]) for f in INDEXED_FIELDS if isinstance(metadata.get(f), (str, int, float, bool))]
+
+
+def _load_array(path: str, dtype) -> np.ndarray:
+    if os.path.getsize(path) == 0: # np.memmap can't map an empty file
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+class _Segment:
+    '''One immutable, memory-mapped segment.'''
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.name = os.path.basename(directory)
+        with open(os.path.join(directory, "terms.txt"), encoding="utf-8") as f:
+            terms = f.read()
+        self.terms = {t: i for i, t in enumerate(terms.split("\n"))} if terms else {}
+        self.term_offsets = _load_array(os.path.join(directory, "term_offsets.u64"), np.uint64)
+        self.post_docs = _load_array(os.path.join(directory, "post_docs.u32"), np.uint32)
+        self.post_tfs = _load_array(os.path.join(directory, "post_tfs.u16"), np.uint16)
+        self.doc_len = _load_array(os.path.join(directory, "doc_len.u32"), np.uint32)
+        self.doc_offsets = _load_array(os.path.join(directory, "doc_offsets.u64"), np.uint64)
+        with open(os.path.join(directory, "doc_ids.txt"), encoding="utf-8") as f:
+            ids = f.read()
+        self.ids = ids.split("\n") if ids else []
+        self.deleted = np.zeros(len(self.ids), dtype=bool)
+        self.has_fields = any(t.startswith("@") for t in self.terms) # written with metadata field postings
+        self._docs_file = open(os.path.join(directory, "docs.jsonl"), "rb")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def postings(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        i = self.terms.get(term)
+        if i is None:
+            return None
+        start, end = int(self.term_offsets[i]), int(self.term_offsets[i + 1])
+        return self.post_docs[start:end], self.post_tfs[start:end]
+
+    def record(self, row: int) -> Dict[str, Any]:
+        start, end = int(self.doc_offsets[row]), int(self.doc_offsets[row + 1])
+        self._docs_file.seek(start)
+        return json.loads(self._docs_file.read(end - start))
+
+    def close(self):
+        self._docs_file.close()
+
+    @staticmethod
+    def write(directory: str, postings: Dict[str, Tuple[np.ndarray, np.ndarray]],
+              doc_len: np.ndarray, records: Iterable[Dict[str, Any]]):
+        os.makedirs(directory, exist_ok=True)
+        terms = sorted(postings)
+        sizes = np.array([len(postings[t][0]) for t in terms], dtype=np.uint64)
+        offsets = np.zeros(len(terms) + 1, dtype=np.uint64)
+        np.cumsum(sizes, out=offsets[1:])
+        with open(os.path.join(directory, "terms.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(terms))
+        offsets.tofile(os.path.join(directory, "term_offsets.u64"))
+        with open(os.path.join(directory, "post_docs.u32"), "wb") as docs_f, \
+             open(os.path.join(directory, "post_tfs.u16"), "wb") as tfs_f:
+            for t in terms:
+                rows, tfs = postings[t]
+                np.asarray(rows, dtype=np.uint32).tofile(docs_f)
+                np.minimum(np.asarray(tfs), 65535).astype(np.uint16).tofile(tfs_f)
+        np.asarray(doc_len, dtype=np.uint32).tofile(os.path.join(directory, "doc_len.u32"))
+        doc_offsets, ids, position = [0], [], 0
+        with open(os.path.join(directory, "docs.jsonl"), "wb") as f:
+            for record in records:
+                line = (json.dumps(record) + "\n").encode("utf-8")
+                f.write(line)
+                position += len(line)
+                doc_offsets.append(position)
+                ids.append(record["id"])
+        np.array(doc_offsets, dtype=np.uint64).tofile(os.path.join(directory, "doc_offsets.u64"))
+        with open(os.path.join(directory, "doc_ids.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(ids))
+
+
+class SparseIndex:
+
+    def __init__(self, directory: str, k1: float = 1.2, b: float = 0.75,
+                 flush_docs: int = 10000, max_segments: int = 8):
+        self.directory = directory
+        self.k1 = k1
+        self.b = b
+        self.flush_docs = flush_docs
+        self.max_segments = max_segments
+        self._lock = threading.RLock()
+        self.segments: List[_Segment] = []
+        self._live: Dict[str, Tuple[Optional[_Segment], int]] = {} # chunk ID -> (segment, or None for the delta, row)
+        self._total_len = 0 # tokens over live rows, for avgdl
+        self._reset_delta()
+        os.makedirs(directory, exist_ok=True)
+        self._lock_fd = os.open(os.path.join(directory, "lock"), os.O_RDWR | os.O_CREAT) if fcntl else None
+        self._file_locked = False
+        self._seen = None # _stamp() of the files last loaded
+        with self._lock:
+            self._refresh()
+
+    def _reset_delta(self):
+        self._delta_postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        self._delta_len: List[int] = []
+        self._delta_records: List[Dict[str, Any]] = []
+        self._delta_deleted: set = set()
+
+    # --- persistence ---
+    @property
+    def _manifest_path(self):
+        return os.path.join(self.directory, "segments.json")
+
+    @property
+    def _deletes_path(self):
+        return os.path.join(self.directory, "deletes.log")
+
+    def _stamp(self):
+        """Identity of segments.json and deletes.log : changes whenever a process writes either."""
+        stamp = []
+        for path in (self._manifest_path, self._deletes_path):
+            try:
+                st = os.stat(path)
+                stamp.append((st.st_ino, st.st_size, st.st_mtime_ns))
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    @contextmanager
+    def _file_lock(self, shared: bool = False):
+        '''Cross-process lock on the directory, reentrant within the holder of self._lock.'''
+        if self._lock_fd is None or self._file_locked:
+            yield
+            return
+        fcntl.flock(self._lock_fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        self._file_locked = True
+        try:
+            yield
+        finally:
+            self._file_locked = False
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        '''Reloads the segments and tombstones if another process changed them. Caller holds self._lock.'''
+        if self._stamp() == self._seen:
+            return
+        with self._file_lock(shared=True):
+            self._reload()
+
+    def _reload(self):
+        '''
+        Rebuilds the segment list, tombstones and live rows from disk. Segments still listed stay
+        open, dropped ones (merged by another process) are closed. Unflushed delta rows stay live
+        unless a segment now holds the same chunk. Caller holds self._lock and the file lock.
+        '''
+        stamp = self._stamp()
+        names = []
+        if os.path.exists(self._manifest_path):
+            with open(self._manifest_path) as f:
+                names = json.load(f)
+        opened = {s.name: s for s in self.segments}
+        self.segments = [opened.pop(n, None) or _Segment(os.path.join(self.directory, n)) for n in names]
+        for segment in opened.values():
+            segment.close()
+        by_name = {s.name: s for s in self.segments}
+        for segment in self.segments:
+            segment.deleted[:] = False
+        if os.path.exists(self._deletes_path):
+            with open(self._deletes_path) as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) == 2 and parts[0] in by_name: # skips a line still being appended
+                        by_name[parts[0]].deleted[int(parts[1])] = True
+        self._live, self._total_len = {}, 0
+        for segment in self.segments:
+            for row in np.flatnonzero(~segment.deleted):
+                self._live[segment.ids[row]] = (segment, int(row))
+            self._total_len += int(np.asarray(segment.doc_len)[~segment.deleted].sum())
+        for row, record in enumerate(self._delta_records):
+            if row in self._delta_deleted:
+                continue
+            if record["id"] in self._live: # flushed by another process meanwhile
+                self._delta_deleted.add(row)
+            else:
+                self._live[record["id"]] = (None, row)
+                self._total_len += self._delta_len[row]
+        self._seen = stamp
+        log(f"Loaded sparse index from '{self.directory}' ({len(self._live)} chunks, {len(self.segments)} segments).")
+
+    def _write_manifest(self):
+        tmp = self._manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump([s.name for s in self.segments], f)
+        os.replace(tmp, self._manifest_path)
+
+    # --- writes ---
+    def add(self, ids: List[str], texts: List[str], metadatas: Optional[List[dict]] = None):
+        """Indexes chunks, IDs already in the index are skipped (chunk IDs are content hashes)."""
+        metadatas = metadatas or [{} for _ in texts]
+        with self._lock:
+            self._refresh()
+            for cid, text, metadata in zip(ids, texts, metadatas):
+                if cid in self._live:
+                    continue
+                row = len(self._delta_len)
+                counts = Counter(tokenize(text))
+                for term, tf in counts.items():
+                    rows, tfs = self._delta_postings.setdefault(term, ([], []))
+                    rows.append(row)
+                    tfs.append(tf)
+                for term in _field_terms(metadata):
+                    rows, tfs = self._delta_postings.setdefault(term, ([], []))
+                    rows.append(row)
+                    tfs.append(1)
+                length = sum(counts.values())
+                self._delta_len.append(length)
+                self._delta_records.append({"id": cid, "text": text, "metadata": dict(metadata)})
+                self._live[cid] = (None, row)
+                self._total_len += length
+            if len(self._delta_len) >= self.flush_docs:
+                self.flush()
+
+    def delete(self, ids: Iterable[str]):
+        with self._lock, self._file_lock():
+            self._refresh()
+            lines = []
+            for cid in ids:
+                location = self._live.pop(cid, None)
+                if location is None:
+                    continue
+                segment, row = location
+                if segment is None:
+                    self._delta_deleted.add(row)
+                    self._total_len -= self._delta_len[row]
+                else:
+                    segment.deleted[row] = True
+                    self._total_len -= int(segment.doc_len[row])
+                    lines.append(f"{segment.name} {row}\n")
+            if lines:
+                with open(self._deletes_path, "a") as f:
+                    f.writelines(lines)
+                self._seen = self._stamp()
+
+    def flush(self):
+        """Writes the in-memory delta as a new segment."""
+        with self._lock, self._file_lock():
+            if not self._delta_len:
+                return
+            self._refresh()
+            keep = np.ones(len(self._delta_len), dtype=bool)
+            keep[list(self._delta_deleted)] = False
+            new_row = np.cumsum(keep) - 1
+            postings = {}
+            for term, (rows, tfs) in self._delta_postings.items():
+                rows, tfs = np.asarray(rows), np.asarray(tfs)
+                mask = keep[rows]
+                if mask.any():
+                    postings[term] = (new_row[rows[mask]], tfs[mask])
+            records = [r for r, k in zip(self._delta_records, keep) if k]
+            if records:
+                directory = os.path.join(self.directory, f"seg-{uuid.uuid4().hex[:12]}")
+                _Segment.write(directory, postings, np.asarray(self._delta_len)[keep], records)
+                segment = _Segment(directory)
+                self.segments.append(segment)
+                for row, record in enumerate(records):
+                    self._live[record["id"]] = (segment, row)
+                self._write_manifest()
+            self._reset_delta()
+            if len(self.segments) > self.max_segments:
+                self._merge(sorted(self.segments, key=len)[:max(2, len(self.segments) // 2)])
+            self._seen = self._stamp()
+
+    def _merge(self, merging: List[_Segment]):
+        '''Merges `merging` into one segment, tombstoned rows are dropped. Caller holds both locks.'''
+        postings_parts: Dict[str, Tuple[List[np.ndarray], List[np.ndarray]]] = {}
+        doc_len, records, base = [], [], 0
+        for segment in merging:
+            alive = ~segment.deleted
+            new_row = np.cumsum(alive) - 1 + base
+            for term, i in segment.terms.items():
+                if term.startswith("@"): # field postings are rebuilt from the records below
+                    continue
+                start, end = int(segment.term_offsets[i]), int(segment.term_offsets[i + 1])
+                rows = np.asarray(segment.post_docs[start:end], dtype=np.int64)
+                mask = alive[rows]
+                if mask.any():
+                    rows_parts, tfs_parts = postings_parts.setdefault(term, ([], []))
+                    rows_parts.append(new_row[rows[mask]])
+                    tfs_parts.append(np.asarray(segment.post_tfs[start:end])[mask])
+            doc_len.append(np.asarray(segment.doc_len)[alive])
+            records.extend(segment.record(int(r)) for r in np.flatnonzero(alive))
+            base += int(alive.sum())
+        postings = {t: (np.concatenate(r), np.concatenate(f)) for t, (r, f) in postings_parts.items()}
+        field_rows: Dict[str, List[int]] = {}
+        for row, record in enumerate(records): # also covers rows of segments written without them
+            for term in _field_terms(record["metadata"]):
+                field_rows.setdefault(term, []).append(row)
+        postings.update({t: (np.asarray(r), np.ones(len(r), dtype=np.uint16)) for t, r in field_rows.items()})
+        directory = os.path.join(self.directory, f"seg-{uuid.uuid4().hex[:12]}")
+        _Segment.write(directory, postings, np.concatenate(doc_len) if doc_len else np.zeros(0), records)
+        merged = _Segment(directory)
+        names = {s.name for s in merging}
+        self.segments = [s for s in self.segments if s.name not in names] + [merged]
+        for row, record in enumerate(records):
+            self._live[record["id"]] = (merged, row)
+        self._write_manifest()
+        # rewrite the tombstones of the surviving segments, then remove the merged ones
+        with open(self._deletes_path + ".tmp", "w") as f:
+            f.writelines(f"{s.name} {row}\n" for s in self.segments for row in np.flatnonzero(s.deleted))
+        os.replace(self._deletes_path + ".tmp", self._deletes_path)
+        for segment in merging:
+            segment.close()
+            for file_name in os.listdir(segment.directory):
+                os.remove(os.path.join(segment.directory, file_name))
+            os.rmdir(segment.directory)
+        log(f"Merged {len(merging)} sparse index segments into {merged.name} ({len(merged)} chunks).")
+
+    # --- search ---
+    def __len__(self):
+        return len(self._live)
+
+    def missing(self, ids: Iterable[str]) -> Set[str]:
+        """The chunk IDs among `ids` the index doesn't hold (to backfill unchanged documents)."""
+        with self._lock:
+            self._refresh()
+            return {cid for cid in ids if cid not in self._live}
+
+    def _delta_postings_arrays(self, term: str):
+        entry = self._delta_postings.get(term)
+        return None if entry is None else (np.asarray(entry[0]), np.asarray(entry[1]))
+
+    @staticmethod
+    def _field_mask(postings, rows: int, values: Dict[str, List[Any]]) -> np.ndarray:
+        """Rows of one segment (or the delta) whose indexed fields take the accepted `values`."""
+        mask = np.ones(rows, dtype=bool)
+        for field, accepted in values.items():
+            hit = np.zeros(rows, dtype=bool)
+            for value in accepted:
+                entry = postings(_field_term(field, value))
+                if entry is not None:
+                    hit[np.asarray(entry[0], dtype=np.int64)] = True
+            mask &= hit
+        return mask
+
+    def search(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None) -> List[Tuple[Dict[str, Any], float]]:
+        '''
+        Top-k BM25 matches : [({"id", "text", "metadata"}, score)], best first.
+        A metadata `filter` on indexed fields is applied before ranking, other conditions
+        are checked on a larger candidate set afterwards.
+        '''
+        field_values = _indexed_values(filter)
+        fully_indexed = bool(filter) and len(field_values) == len(filter)
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            self._refresh()
+            n = len(self._live)
+            if n == 0 or not terms:
+                return []
+            avgdl = self._total_len / n
+            # (segment or None, doc_len, deleted mask, {term: postings})
+            sources = [(s, s.doc_len, s.deleted, {t: s.postings(t) for t in terms}) for s in self.segments]
+            delta_deleted = np.zeros(len(self._delta_len), dtype=bool)
+            delta_deleted[list(self._delta_deleted)] = True
+            sources.append((None, np.asarray(self._delta_len, dtype=np.uint32), delta_deleted,
+                            {t: self._delta_postings_arrays(t) for t in terms}))
+            df = {t: sum(len(p[t][0]) for _, _, _, p in sources if p[t] is not None) for t in terms}
+            candidates = []
+            for segment, doc_len, deleted, postings in sources:
+                if not len(doc_len):
+                    continue
+                scores = None
+                norm = None
+                for term in terms:
+                    entry = postings[term]
+                    if entry is None:
+                        continue
+                    rows, tfs = np.asarray(entry[0], dtype=np.int64), np.asarray(entry[1], dtype=np.float32)
+                    if scores is None:
+                        scores = np.zeros(len(doc_len), dtype=np.float32)
+                        norm = self.k1 * (1 - self.b + self.b * np.asarray(doc_len, dtype=np.float32) / avgdl)
+                    idf = np.log(1 + (n - df[term] + 0.5) / (df[term] + 0.5))
+                    scores[rows] += idf * tfs * (self.k1 + 1) / (tfs + norm[rows])
+                if scores is None:
+                    continue
+                scores[deleted] = 0
+                pushed_down = bool(field_values) and (segment is None or segment.has_fields)
+                if pushed_down:
+                    postings_of = segment.postings if segment is not None else self._delta_postings_arrays
+                    scores[~self._field_mask(postings_of, len(doc_len), field_values)] = 0
+                want = k if not filter or (pushed_down and fully_indexed) else k * 10
+                hits = np.flatnonzero(scores > 0)
+                if len(hits) > want:
+                    hits = hits[np.argpartition(-scores[hits], want - 1)[:want]]
+                for row in hits:
+                    record = segment.record(int(row)) if segment is not None else self._delta_records[row]
+                    if _matches(record["metadata"], filter):
+                        candidates.append((record, float(scores[row])))
+        candidates.sort(key=lambda c: -c[1])
+        return candidates[:k]
+
+
+_sparse_index: Optional[SparseIndex] = None
+_sparse_index_lock = threading.Lock()
+
+def get_sparse_index() -> SparseIndex:
+    '''Process-wide sparse index, loaded on first use.'''
+    global _sparse_index
+    if _sparse_index is None:
+        with _sparse_index_lock:
+            if _sparse_index is None:
+                _sparse_index = SparseIndex(SPARSE_INDEX_DIR)
+    return _sparse_index
@@ -0,0 +1,127 @@
+'''
+Retrieval sufficiency gate : decides from the retrieval scores whether the chunks can answer
+the query, so judge_llm only runs when the scores are ambiguous.
+
+  top score >= sufficient_threshold   -> sufficient      (decided_by = "score" / "cross_encoder")
+  top score <  insufficient_threshold -> not sufficient  (same), unless BM25 matched (exact terms) : judge
+  in between                          -> None, rag_node asks judge_llm (decided_by = "judge")
+
+Scores are the vector store's cosine similarities. With RAG_GATE_CROSS_ENCODER set, a local
+sentence-transformers cross-encoder rescores every (query, chunk) pair first (sigmoid, 0..1),
+which separates relevant from merely similar chunks much better than bi-encoder cosine.
+
+calibrate() picks both thresholds from labelled examples (top score, judge verdict), so the
+gate agrees with judge_llm at the requested precision on each side.
+'''
+import math
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from config import RAG_GATE_ENABLED, RAG_GATE_SUFFICIENT, RAG_GATE_INSUFFICIENT, RAG_GATE_CROSS_ENCODER
+from telemetry import log
+
+
+@dataclass
+class GateDecision:
+    sufficient: Optional[bool] # None = uncertain, ask the judge
+    top_score: Optional[float]
+    scorer: str # "score" (vector similarity) or "cross_encoder"
+
+
+class SufficiencyGate:
+
+    def __init__(self, sufficient_threshold: float = RAG_GATE_SUFFICIENT,
+                 insufficient_threshold: float = RAG_GATE_INSUFFICIENT,
+                 cross_encoder_model: str = RAG_GATE_CROSS_ENCODER):
+        self.sufficient_threshold = sufficient_threshold
+        self.insufficient_threshold = insufficient_threshold
+        self.cross_encoder_model = cross_encoder_model
+        self._cross_encoder = None
+        self._cross_encoder_error = False # model unavailable, fall back to vector scores
+        self._lock = threading.Lock()
+        self._stats = {"decided_sufficient": 0, "decided_insufficient": 0, "judge_calls": 0}
+
+    def _get_cross_encoder(self):
+        if not self.cross_encoder_model or self._cross_encoder_error:
+            return None
+        if self._cross_encoder is None:
+            with self._lock:
+                if self._cross_encoder is None and not self._cross_encoder_error:
+                    try:
+                        from sentence_transformers import CrossEncoder # optional dependency
+                        self._cross_encoder = CrossEncoder(self.cross_encoder_model)
+                        log(f"Loaded cross-encoder '{self.cross_encoder_model}' for the sufficiency gate.")
+                    except Exception as e:
+                        log(f"Cross-encoder disabled, using vector scores : {e}")
+                        self._cross_encoder_error = True
+        return self._cross_encoder
+
+    def rescore(self, query: str, chunks: List[dict]) -> Tuple[List[float], str]:
+        """Scores for `chunks` ({"content", "score", ...}) and which scorer produced them."""
+        model = self._get_cross_encoder()
+        if model is None or not chunks:
+            # chunks found only by BM25 (hybrid search) have no dense score
+            return [c["score"] for c in chunks if c.get("score") is not None], "score"
+        logits = model.predict([(query, c["content"]) for c in chunks])
+        return [1.0 / (1.0 + math.exp(-float(x))) for x in logits], "cross_encoder"
+
+    def decide(self, query: str, chunks: List[dict]) -> GateDecision:
+        """Gate decision for the retrieved chunks. Blocking when a cross-encoder is configured."""
+        if not RAG_GATE_ENABLED:
+            return self._count(GateDecision(None, None, "score"))
+        scores, scorer = self.rescore(query, chunks)
+        top = max(scores) if scores else None
+        exact_match = any(c.get("bm25") for c in chunks) # BM25 hit : dense similarity may undersell it
+        if (top is None or top < self.insufficient_threshold) and not (exact_match and scorer == "score"):
+            decision = GateDecision(False, top, scorer)
+        elif top is None: # only BM25 matched (dense index not caught up yet) : the judge decides
+            decision = GateDecision(None, None, scorer)
+        elif top >= self.sufficient_threshold:
+            decision = GateDecision(True, top, scorer)
+        else:
+            decision = GateDecision(None, top, scorer)
+        return self._count(decision)
+
+    def _count(self, decision: GateDecision) -> GateDecision:
+        key = {True: "decided_sufficient", False: "decided_insufficient", None: "judge_calls"}[decision.sufficient]
+        with self._lock:
+            self._stats[key] += 1
+        return decision
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["judge_calls_skipped"] = stats["decided_sufficient"] + stats["decided_insufficient"]
+        total = stats["judge_calls_skipped"] + stats["judge_calls"]
+        stats["skip_rate"] = stats["judge_calls_skipped"] / total if total else 0.0
+        return stats
+
+
+def calibrate(samples: Sequence[Tuple[float, bool]], precision: float = 0.95) -> Tuple[float, float]:
+    '''
+    Thresholds from (top score, judge verdict) pairs.
+    sufficient   : lowest score s such that >= `precision` of the samples scoring >= s were judged sufficient
+    insufficient : highest score s such that >= `precision` of the samples scoring < s were judged insufficient
+    Returns (sufficient_threshold, insufficient_threshold), never crossing each other.
+    '''
+    ordered = sorted(samples, key=lambda s: s[0])
+    scores = [s for s, _ in ordered]
+    n = len(ordered)
+    sufficient_threshold = math.inf
+    positives = 0
+    for i in range(n - 1, -1, -1): # walk down from the top score
+        positives += ordered[i][1]
+        if positives / (n - i) >= precision and (i == 0 or scores[i - 1] < scores[i]):
+            sufficient_threshold = scores[i]
+    insufficient_threshold = -math.inf
+    negatives = 0
+    for i in range(n): # walk up from the lowest score, threshold = first score above the prefix
+        negatives += not ordered[i][1]
+        if i + 1 < n and scores[i + 1] > scores[i] and negatives / (i + 1) >= precision:
+            insufficient_threshold = scores[i + 1]
+    return sufficient_threshold, min(insufficient_threshold, sufficient_threshold)
+
+
+# process-wide gate used by rag_node
+sufficiency_gate = SufficiencyGate()
@@ -0,0 +1,288 @@
+'''
+Observability for the agent : per-node spans, Prometheus metrics and non-blocking logging.
+
+Spans
+    traced / atraced wrap every graph node. The span records the node's wall time, the LLM calls
+    made inside it (input / output tokens and estimated cost, through the TokenUsageCallback
+    attached to the Groq models) and attributes the node code adds with record() : retrieved chunks,
+    cache hits, ... The finished span is returned in the node's `telemetry` state field, main.py
+    copies it into TraceEvent.details.
+
+Metrics
+    Every span is aggregated into process-wide histograms / counters, rendered in the Prometheus
+    text format by GET /metrics (no client library needed).
+
+Logging
+    log() replaces print() on the request path, in ingestion and in the indexes. LOG_MODE picks the handler :
+    "queue" (default) : records go through a QueueHandler, a background thread writes them to stdout
+    "sync"            : written to stdout by the calling thread
+    "off"             : dropped
+'''
+import sys
+import time
+import queue
+import atexit
+import bisect
+import logging
+import threading
+import functools
+from contextvars import ContextVar
+from dataclasses import dataclass, field, asdict
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from config import LOG_MODE, LOG_LEVEL
+
+# --- logging ---
+logger = logging.getLogger("rag_agent")
+_listener: Optional[QueueListener] = None
+
+
+def configure_logging(mode: str = LOG_MODE, level: str = LOG_LEVEL):
+    """(Re)configures the agent logger, see the module docstring for the modes."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    logger.handlers.clear()
+    logger.propagate = False
+    logger.setLevel(level.upper())
+    if mode == "off":
+        logger.addHandler(logging.NullHandler())
+        return
+    stdout = logging.StreamHandler(sys.stdout)
+    stdout.setFormatter(logging.Formatter("%(message)s"))
+    if mode == "sync":
+        logger.addHandler(stdout)
+        return
+    records = queue.SimpleQueue()
+    logger.addHandler(QueueHandler(records))
+    _listener = QueueListener(records, stdout)
+    _listener.start()
+
+
+def log(message: str):
+    logger.info(message)
+
+
+configure_logging()
+atexit.register(lambda: _listener and _listener.stop())
+
+
+# --- metrics ---
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (10, 50, 100, 250, 500, 1000, 2000, 4000, 8000)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+
+
+def _labels(key: Tuple[Tuple[str, str], ...], *extra: Tuple[str, str]) -> str:
+    pairs = ",".join(f'{k}="{v}"' for k, v in key + extra)
+    return "{" + pairs + "}" if pairs else ""
+
+
+class _Histogram:
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float]):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[Tuple[str, str], ...], Dict[str, Any]] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            series["counts"][i] += 1
+        series["sum"] += value
+        series["count"] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        for key, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["counts"]):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(key, ('le', str(bound)))} {cumulative}"
+            yield f"{self.name}_bucket{_labels(key, ('le', '+Inf'))} {series['count']}"
+            yield f"{self.name}_sum{_labels(key)} {series['sum']}"
+            yield f"{self.name}_count{_labels(key)} {series['count']}"
+
+
+class _Counter:
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._series: Dict[Tuple[Tuple[str, str], ...], float] = {}
+
+    def inc(self, value: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        self._series[key] = self._series.get(key, 0) + value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} counter"
+        for key, value in sorted(self._series.items()):
+            yield f"{self.name}{_labels(key)} {value}"
+
+
+class MetricsRegistry:
+    '''Process-wide aggregates of the node spans.'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.node_latency = _Histogram("rag_agent_node_latency_seconds", "Wall time of one graph node run.", LATENCY_BUCKETS)
+        self.request_latency = _Histogram("rag_agent_request_latency_seconds", "Wall time of one chat request.", LATENCY_BUCKETS)
+        self.llm_tokens = _Histogram("rag_agent_node_llm_tokens", "LLM tokens used by one graph node run.", TOKEN_BUCKETS)
+        self.retrieved_chunks = _Histogram("rag_agent_retrieved_chunks", "Chunks retrieved by one graph node run.", COUNT_BUCKETS)
+        self.llm_cost = _Counter("rag_agent_llm_cost_usd_total", "Estimated LLM cost in USD.")
+        self.cache_lookups = _Counter("rag_agent_cache_lookups_total", "Cache lookups by cache and outcome.")
+        self.node_errors = _Counter("rag_agent_node_errors_total", "Graph node runs that raised.")
+        self.chat_admission = _Counter("rag_agent_chat_admission_total", "Chat requests by admission outcome.")
+
+    def observe_span(self, span: "Span"):
+        with self._lock:
+            self.node_latency.observe(span.wall_ms / 1000, node=span.node)
+            if span.llm_calls:
+                self.llm_tokens.observe(span.input_tokens, node=span.node, kind="input")
+                self.llm_tokens.observe(span.output_tokens, node=span.node, kind="output")
+                self.llm_cost.inc(span.cost_usd, node=span.node)
+            if "retrieved_chunks" in span.attributes:
+                self.retrieved_chunks.observe(span.attributes["retrieved_chunks"], node=span.node)
+            for cache in ("semantic_cache", "web_cache"):
+                if cache in span.attributes:
+                    self.cache_lookups.inc(cache=cache, outcome=span.attributes[cache])
+            if span.error:
+                self.node_errors.inc(node=span.node)
+
+    def observe_request(self, seconds: float, endpoint: str):
+        with self._lock:
+            self.request_latency.observe(seconds, endpoint=endpoint)
+
+    def observe_admission(self, outcome: str):
+        with self._lock:
+            self.chat_admission.inc(outcome=outcome)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = (self.node_latency, self.request_latency, self.llm_tokens, self.retrieved_chunks,
+                       self.llm_cost, self.cache_lookups, self.node_errors, self.chat_admission)
+            return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+# --- spans ---
+# USD per million tokens (input, output), Groq list prices
+MODEL_PRICES = {
+    "llama3-70b-8192": (0.59, 0.79),
+    "llama3-8b-8192": (0.05, 0.08),
+}
+
+
+@dataclass
+class Span:
+    node: str
+    wall_ms: float = 0.0
+    llm_calls: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cost_usd: float = 0.0
+    error: Optional[str] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    def as_dict(self) -> Dict[str, Any]:
+        out = asdict(self)
+        out["wall_ms"] = round(self.wall_ms, 2)
+        out["cost_usd"] = round(self.cost_usd, 8)
+        out.update(out.pop("attributes"))
+        return out
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def record(**attributes):
+    """Adds attributes (retrieved_chunks=5, web_cache="hit", ...) to the span of the running node, if any."""
+    span = _current_span.get()
+    if span is not None:
+        span.attributes.update(attributes)
+
+
+class TokenUsageCallback(BaseCallbackHandler):
+    '''Adds every LLM call's token usage and cost to the span of the node that made it.'''
+    run_inline = True # same thread / task as the node, so the span context variable is visible
+
+    def on_llm_end(self, response, **kwargs):
+        span = _current_span.get()
+        if span is None:
+            return
+        model = (response.llm_output or {}).get("model_name", "")
+        input_tokens = output_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                input_tokens += usage.get("input_tokens", 0)
+                output_tokens += usage.get("output_tokens", 0)
+        if not (input_tokens or output_tokens): # older integrations only fill llm_output
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            input_tokens, output_tokens = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+        input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+        span.llm_calls += 1
+        span.input_tokens += input_tokens
+        span.output_tokens += output_tokens
+        span.cost_usd += (input_tokens * input_price + output_tokens * output_price) / 1e6
+
+
+token_usage = TokenUsageCallback()
+
+
+def _start(node: str):
+    span = Span(node)
+    return span, _current_span.set(span), time.perf_counter()
+
+
+def _finish(span: Span, token, start: float, output):
+    span.wall_ms = (time.perf_counter() - start) * 1000
+    _current_span.reset(token)
+    metrics.observe_span(span)
+    if isinstance(output, dict):
+        return {**output, "telemetry": span.as_dict()}
+    return output
+
+
+def traced(node: str, func):
+    """Wraps a sync graph node in a span."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        span, token, start = _start(node)
+        try:
+            output = func(*args, **kwargs)
+        except Exception as e:
+            span.error = repr(e)
+            _finish(span, token, start, None)
+            raise
+        return _finish(span, token, start, output)
+    return wrapper
+
+
+def atraced(node: str, afunc):
+    """Wraps an async graph node in a span."""
+    @functools.wraps(afunc)
+    async def wrapper(*args, **kwargs):
+        span, token, start = _start(node)
+        try:
+            output = await afunc(*args, **kwargs)
+        except Exception as e:
+            span.error = repr(e)
+            _finish(span, token, start, None)
+            raise
+        return _finish(span, token, start, output)
+    return wrapper
@@ -0,0 +1,28 @@
+from langchain_core.messages import AIMessage, HumanMessage
+
+from checkpointer import SQLiteCheckpointer
+
+
+def _turns(n, words=1):
+    messages = []
+    for i in range(n):
+        messages += [HumanMessage(f"question {i} " + "x " * words, id=f"h{i}"),
+                     AIMessage(f"answer {i} " + "x " * words, id=f"a{i}")]
+    return messages
+
+
+def _compacted(saver, messages):
+    return saver._compact({"id": "1", "channel_values": {"messages": messages}})["channel_values"]["messages"]
+
+
+def test_trimmed_history_starts_on_a_user_message():
+    saver = SQLiteCheckpointer(":memory:", max_messages=5, history_max_tokens=1)
+    kept = _compacted(saver, _turns(10))
+    assert isinstance(kept[0], HumanMessage)
+    assert [m.id for m in kept] == ["h8", "a8", "h9", "a9"]
+
+
+def test_messages_inside_the_history_window_are_not_trimmed():
+    saver = SQLiteCheckpointer(":memory:", max_messages=4, history_max_tokens=10_000)
+    messages = _turns(10)
+    assert _compacted(saver, messages) == messages
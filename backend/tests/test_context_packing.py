@@ -0,0 +1,16 @@
+from context_packing import merge_neighbors
+
+
+def _chunk(text, start, namespace, rrf):
+    return {"content": text, "rrf": rrf,
+            "metadata": {"document_id": "handbook", "namespace": namespace, "start_index": start}}
+
+
+def test_same_document_id_in_two_namespaces_is_not_merged():
+    passages = merge_neighbors([_chunk("acme leave policy", 0, "acme", 0.9), _chunk("globex leave policy", 0, "globex", 0.8)])
+    assert sorted(p.text for p in passages) == ["acme leave policy", "globex leave policy"]
+
+
+def test_overlapping_chunks_of_one_document_are_merged():
+    passages = merge_neighbors([_chunk("leave is 25 days", 0, "acme", 0.9), _chunk("25 days per year", 9, "acme", 0.5)])
+    assert [(p.text, p.parts, p.relevance) for p in passages] == [("leave is 25 days per year", 2, 0.9)]
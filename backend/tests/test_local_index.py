@@ -0,0 +1,32 @@
+import numpy as np
+
+from local_index import LocalVectorStore
+
+
+def _store(path, n=200, **kwargs):
+    store = LocalVectorStore(str(path), None, compact_min_rows=10, **kwargs)
+    vectors = np.random.default_rng(0).normal(size=(n, 8)).astype(np.float32)
+    ids = [f"r{i}" for i in range(n)]
+    store.add_embeddings(["t"] * n, vectors, [{"namespace": f"ns{i % 2}"} for i in range(n)], ids)
+    return store, vectors, ids
+
+
+def test_overwrite_keeps_one_field_posting_per_row(tmp_path):
+    store, vectors, ids = _store(tmp_path)
+    store.add_embeddings(["t"] * 10, vectors[:10], [{"namespace": "ns1"}] * 10, ids[:10])
+    assert sum(len(rows) for rows in store._field_rows.values()) == 200
+    assert len(store._field_rows[("namespace", "ns1")]) == 105
+
+
+def test_deleted_rows_are_compacted_and_survive_a_reload(tmp_path):
+    store, vectors, ids = _store(tmp_path)
+    for _ in range(3):
+        store.delete(ids[:100])
+        store.add_embeddings(["t"] * 100, vectors[:100], [{"namespace": "ns0"}] * 100, ids[:100])
+    assert store.count < 400
+
+    reloaded = LocalVectorStore(str(tmp_path), None)
+    assert reloaded.count == store.count
+    doc, score = reloaded.similarity_search_by_vector_with_score(vectors[42], k=1, filter={"namespace": "ns0"})[0]
+    assert doc.id == "r42" and score > 0.99
+    assert not list(tmp_path.glob("*.tmp"))
@@ -0,0 +1,37 @@
+import time
+
+import agent
+import semantic_cache
+from semantic_cache import SemanticCache
+
+
+class _Embedder:
+    def embed_query(self, text):
+        return [1.0, float(len(text))]
+
+
+def _store_answer(monkeypatch, web):
+    cache = SemanticCache(embedder=_Embedder(), ttl_seconds=3600)
+    monkeypatch.setattr(SemanticCache, "kb_version", staticmethod(lambda: "v1"))
+    monkeypatch.setattr(agent, "SEMANTIC_CACHE_ENABLED", True)
+    state = {"messages": [], "query": "who won the finals last night?", "web": web, "web_search_enabled": True,
+             "cache_info": {"kb_version": "v1", "scope": ""}}
+    cache.store(*agent._cache_store_args(state, "answer"))
+    return cache
+
+
+def _lookup_later(monkeypatch, cache, seconds):
+    now = time.time() + seconds
+    monkeypatch.setattr(semantic_cache.time, "time", lambda: now)
+    return cache.lookup("who won the finals last night?", True, "v1")[0]
+
+
+def test_web_answer_is_not_served_after_the_web_cache_ttl(monkeypatch):
+    cache = _store_answer(monkeypatch, "Title: Finals\nContent: ...\nURL: https://example.com")
+    assert _lookup_later(monkeypatch, cache, agent.WEB_CACHE_TTL_SECONDS - 1) == "answer"
+    assert _lookup_later(monkeypatch, cache, agent.WEB_CACHE_TTL_SECONDS + 1) is None
+
+
+def test_knowledge_base_answer_keeps_the_cache_ttl(monkeypatch):
+    cache = _store_answer(monkeypatch, "")
+    assert _lookup_later(monkeypatch, cache, agent.WEB_CACHE_TTL_SECONDS + 1) == "answer"
@@ -0,0 +1,17 @@
+import sufficiency
+from sufficiency import SufficiencyGate
+
+
+def test_chunks_found_only_by_bm25_go_to_the_judge(monkeypatch):
+    monkeypatch.setattr(sufficiency, "RAG_GATE_ENABLED", True)
+    gate = SufficiencyGate(sufficient_threshold=0.75, insufficient_threshold=0.35, cross_encoder_model="")
+    decision = gate.decide("q", [{"content": "x", "score": None, "bm25": 3.0}])
+    assert decision.sufficient is None
+    assert decision.top_score is None
+    assert gate.stats()["judge_calls"] == 1
+
+
+def test_no_chunks_is_insufficient(monkeypatch):
+    monkeypatch.setattr(sufficiency, "RAG_GATE_ENABLED", True)
+    gate = SufficiencyGate(sufficient_threshold=0.75, insufficient_threshold=0.35, cross_encoder_model="")
+    assert gate.decide("q", []).sufficient is False
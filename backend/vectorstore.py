@@ -1,75 +1,284 @@
 import os
-from pinecone import Pinecone,ServerlessSpec
-from langchain_pinecone import PineconeVectorStore
+import json
+import time
+import asyncio
+import hashlib
+import threading
+# the Pinecone / OpenAI SDKs are slow to import : imported where the clients are built (see clients.py)
 # from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_openai import OpenAIEmbeddings
 
 # for text splitter
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from chunking import build_splitter, LEGACY_CHUNK_SIZE
 
 # import PINECONE_API_KEY and other configurations
-from config import PINECONE_API_KEY
-os.environ["PINECONE_API_KEY"] = PINECONE_API_KEY
+from config import (PINECONE_API_KEY, PINECONE_POOL_THREADS, EMBED_CACHE_SIZE, EMBED_CACHE_PATH,
+                    VECTOR_BACKEND, LOCAL_INDEX_DIR, LOCAL_INDEX_MODE, LOCAL_INDEX_IVF_LISTS, LOCAL_INDEX_IVF_NPROBE,
+                    HYBRID_SEARCH_ENABLED, HYBRID_CANDIDATES, RRF_K)
+from embedding_cache import CachedEmbeddings, SQLiteEmbeddingStore
+from manifest import document_manifest, chunk_id
+from sparse_index import get_sparse_index
+from clients import lazy_client, require_key
+from langchain_core.vectorstores import VectorStore
+from telemetry import log
 
 # Pinecone index set up : https://app.pinecone.io/organizations/-NvankU832R3Eg6IXOo3/projects/feff407b-ff5a-472a-a02a-d576882ed484/indexes/rag-test001/browser
-# Initialize Pinecone Client
-pc = Pinecone(api_key=PINECONE_API_KEY)
+# Pinecone Client, created on first use so the local backend works without a Pinecone key
+pc = None
 #index = pc.Index("rag-test-001")
 
+def _pinecone_client():
+    global pc
+    if pc is None:
+        from pinecone import Pinecone
+        os.environ["PINECONE_API_KEY"] = require_key("PINECONE_API_KEY", PINECONE_API_KEY)
+        pc = Pinecone(api_key=PINECONE_API_KEY)
+    return pc
+
 # define embedding model
 #embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
+# wrapped in a content-addressed cache : re-uploaded chunks and repeated questions are not embedded again
+EMBEDDING_MODEL_NAME = "text-embedding-3-large"
+def _openai_embeddings():
+    from langchain_openai import OpenAIEmbeddings
+    return OpenAIEmbeddings(model=EMBEDDING_MODEL_NAME)
+
+embeddings = CachedEmbeddings(lazy_client("openai_embeddings", _openai_embeddings), # built on the first cache miss
+                              model_name=EMBEDDING_MODEL_NAME,
+                              memory_size=EMBED_CACHE_SIZE,
+                              disk=lazy_client("embedding_cache", lambda: SQLiteEmbeddingStore(EMBED_CACHE_PATH))
+                                   if EMBED_CACHE_PATH else None) # opened by the warm-up or on first use
 
 # define Pinecone index
 INDEX_NAME = "rag-test002"
 
-# retriever function 
-def get_retriever():
+# text splitter shared by add_document and the streaming ingestion pipeline (ingestion.py), see chunking.py
+text_splitter = build_splitter()
+# upper estimate of the characters one chunk spans (sizes the streaming ingestion buffer)
+CHUNK_SIZE = getattr(text_splitter, "max_chars", LEGACY_CHUNK_SIZE)
+
+# Process-wide vector store, created lazily on first use (see get_vector_store)
+_vector_store = None
+_vector_store_lock = threading.Lock()
+
+def _ensure_index():
     '''
-    Initialises and returns a Pinecone Vector Store retriever.
     Ensure , the index exists , else create it.
+    This is a control-plane round trip, so it only runs once per process.
     '''
+    from pinecone import ServerlessSpec
+    pc = _pinecone_client()
     if INDEX_NAME not in pc.list_indexes().names():
-        print("Creating Index...")
+        log("Creating Index...")
         pc.create_index(INDEX_NAME, 
                         dimension=1024, 
                         metric="cosine",
                         spec = ServerlessSpec(cloud ="aws", region="us-east-1"))
-        print("Created Pinecone Index...........")
-        
-        # get the pinecone vector store
-    vector_store = PineconeVectorStore(index_name=INDEX_NAME,embedding = embeddings)
-    return vector_store.as_retriever()
+        log("Created Pinecone Index...........")
+
+def _build_pinecone_store() -> VectorStore:
+    '''
+    The first call checks the index and opens a data-plane client with a pooled HTTP connection.
+    '''
+    from langchain_pinecone import PineconeVectorStore
+    _ensure_index()
+    index = _pinecone_client().Index(INDEX_NAME, pool_threads=PINECONE_POOL_THREADS)
+    log(f"Pinecone vector store ready for index '{INDEX_NAME}'.")
+    return PineconeVectorStore(index=index, embedding=embeddings)
+
+def _build_local_store() -> VectorStore:
+    '''
+    Memory-mapped NumPy index on local disk (local_index.py), no network round trips.
+    '''
+    from local_index import LocalVectorStore
+    return LocalVectorStore(LOCAL_INDEX_DIR, embeddings, mode=LOCAL_INDEX_MODE,
+                            ivf_lists=LOCAL_INDEX_IVF_LISTS, ivf_nprobe=LOCAL_INDEX_IVF_NPROBE)
+
+# Vector store backends, selected with VECTOR_BACKEND in config.py.
+# Any LangChain VectorStore works : it needs add_texts / add_documents (with ids), delete(ids)
+# and similarity_search(_with_score) with a metadata `filter`.
+VECTOR_BACKENDS = {
+    "pinecone": _build_pinecone_store,
+    "local": _build_local_store,
+}
+
+def get_vector_store() -> VectorStore:
+    '''
+    Returns the process-wide Vector Store of the configured backend.
+    Built once on first use, every later call reuses it. Thread safe.
+    '''
+    global _vector_store
+    if _vector_store is None:
+        with _vector_store_lock:
+            if _vector_store is None: # another thread may have built it while we waited
+                if VECTOR_BACKEND not in VECTOR_BACKENDS:
+                    raise ValueError(f"Unknown VECTOR_BACKEND '{VECTOR_BACKEND}', choose one of {list(VECTOR_BACKENDS)}.")
+                _vector_store = VECTOR_BACKENDS[VECTOR_BACKEND]()
+    return _vector_store
+
+# --- chunk metadata and retrieval filters ---
+# every chunk carries document_id, source (file name), page (PDFs, 0-based), uploaded_at (epoch seconds of the
+# upload that indexed it) and, for tenant scoped uploads, namespace. Filters are pushed down into the vector
+# query (Pinecone metadata filter, local_index / sparse_index field indexes) so only the partition is searched.
+# operators all backends evaluate the same way (Pinecone, local_index._matches, the sparse index)
+FILTER_OPERATORS = ("$eq", "$in", "$ne")
+
+def chunk_metadata(document_id: str, source: str | None = None, namespace: str | None = None,
+                   uploaded_at: float | None = None) -> dict:
+    """Metadata shared by every chunk of one upload (Pinecone metadata can't hold None, unset fields are left out)."""
+    metadata = {"document_id": document_id, "uploaded_at": uploaded_at or time.time()}
+    if source:
+        metadata["source"] = source
+    if namespace:
+        metadata["namespace"] = namespace
+    return metadata
+
+def document_key(document_id: str, namespace: str | None = None) -> str:
+    """Manifest / chunk ID key of a document : the same document ID in two namespaces is two documents."""
+    return f"{namespace}/{document_id}" if namespace else document_id
+
+def retrieval_filter(namespace: str | None = None, filters: dict | None = None) -> dict | None:
+    '''
+    The metadata filter of one chat request : `filters` ({"field": value} or {"field": {"$eq" | "$in" | "$ne": ...}})
+    restricted to `namespace` when given. None = search the whole index.
+    Raises ValueError on conditions not every backend supports.
+    '''
+    combined = dict(filters or {})
+    for key, condition in combined.items():
+        if key.startswith("$"):
+            raise ValueError(f"Unsupported filter key '{key}': use {{field: value}} or {{field: {{operator: value}}}}.")
+        conditions = condition if isinstance(condition, dict) else {"$eq": condition}
+        unsupported = set(conditions) - set(FILTER_OPERATORS)
+        if not conditions or unsupported:
+            raise ValueError(f"Unsupported filter on '{key}': operators must be among {list(FILTER_OPERATORS)}.")
+        for operator, value in conditions.items():
+            values = value if operator == "$in" else [value]
+            if operator == "$in" and not isinstance(value, list):
+                raise ValueError(f"Filter '{key}': $in takes a list.")
+            if not all(isinstance(v, (str, int, float, bool)) for v in values):
+                raise ValueError(f"Filter '{key}': values must be strings, numbers or booleans.")
+    if namespace:
+        combined["namespace"] = namespace
+    return combined or None
+
+def filter_scope(filter: dict | None) -> str:
+    """Stable key of a retrieval filter, answers are cached per scope (see semantic_cache.py)."""
+    return json.dumps(filter, sort_keys=True) if filter else ""
+
+# retriever function 
+def get_retriever(k: int = 4, filter: dict | None = None):
+    '''
+    Returns a retriever over the shared Vector Store.
+    `k` and `filter` are per call search settings, nothing is rebuilt.
+    '''
+    search_kwargs = {"k": k}
+    if filter:
+        search_kwargs["filter"] = filter
+    return get_vector_store().as_retriever(search_kwargs=search_kwargs)
+
+def search_with_scores(query: str, k: int = 4, filter: dict | None = None):
+    '''
+    Top-k chunks with their similarity scores : [(Document, score)], best first.
+    Cosine similarity for both backends, used by the sufficiency gate (see sufficiency.py).
+    '''
+    return get_vector_store().similarity_search_with_score(query, k=k, filter=filter)
+
+async def asearch_with_scores(query: str, k: int = 4, filter: dict | None = None):
+    return await get_vector_store().asimilarity_search_with_score(query, k=k, filter=filter)
+
+def _fuse(dense, sparse, k: int) -> list:
+    '''
+    Reciprocal rank fusion : every result list adds 1 / (RRF_K + rank) to the chunks it returned.
+    Returns [{"id", "content", "metadata", "score" (dense cosine or None), "bm25" (or None), "rrf"}], best first.
+    '''
+    fused = {}
+    for rank, (doc, score) in enumerate(dense, start=1):
+        key = doc.id or doc.metadata.get("chunk_id") or doc.page_content
+        fused[key] = {"id": key, "content": doc.page_content, "metadata": dict(doc.metadata), "score": float(score),
+                      "bm25": None, "rrf": 1.0 / (RRF_K + rank)}
+    for rank, (record, score) in enumerate(sparse, start=1):
+        entry = fused.setdefault(record["id"], {"id": record["id"], "content": record["text"], "metadata": record["metadata"],
+                                                "score": None, "bm25": None, "rrf": 0.0})
+        entry["bm25"] = score
+        entry["rrf"] += 1.0 / (RRF_K + rank)
+    return sorted(fused.values(), key=lambda c: -c["rrf"])[:k]
+
+def hybrid_search(query: str, k: int = 4, filter: dict | None = None) -> list:
+    '''
+    Dense + BM25 retrieval fused by reciprocal rank fusion (dense only when HYBRID_SEARCH_ENABLED is off).
+    Same result format as _fuse.
+    '''
+    if not HYBRID_SEARCH_ENABLED:
+        return _fuse(search_with_scores(query, k=k, filter=filter), [], k)
+    dense = search_with_scores(query, k=HYBRID_CANDIDATES, filter=filter)
+    sparse = get_sparse_index().search(query, k=HYBRID_CANDIDATES, filter=filter)
+    return _fuse(dense, sparse, k)
+
+async def ahybrid_search(query: str, k: int = 4, filter: dict | None = None) -> list:
+    if not HYBRID_SEARCH_ENABLED:
+        return _fuse(await asearch_with_scores(query, k=k, filter=filter), [], k)
+    # BM25 scoring is CPU work on a worker thread, it overlaps with the dense query round trip
+    dense, sparse = await asyncio.gather(
+        asearch_with_scores(query, k=HYBRID_CANDIDATES, filter=filter),
+        asyncio.to_thread(lambda: get_sparse_index().search(query, k=HYBRID_CANDIDATES, filter=filter)))
+    return _fuse(dense, sparse, k)
 
 # upload documents to vector store
 
-def add_document(text_content: str):
+def add_document(text_content: str, document_id: str | None = None, source: str | None = None,
+                 namespace: str | None = None):
     '''
     Will receive text content in form of string format.
-    Adds a single text document to the Pinecone Vector Store.
+    Adds a single text document to the Vector Store.
     Splits the text into chunks before embedding and upserting.
+    Chunk IDs are deterministic (document ID + content hash), so adding the same text again
+    does not create duplicates. Without a document_id the text's own hash is used.
+    Chunks carry chunk_metadata(document_id, source, namespace).
     '''
     
     if not text_content:
         raise ValueError("Document content cannot be empty.")
     
-    # after uploading, split the document
+    if document_id is None:
+        document_id = "text-" + hashlib.sha256(text_content.encode("utf-8")).hexdigest()
+    key = document_key(document_id, namespace)
+    metadata = chunk_metadata(document_id, source, namespace)
     
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000,
-                                                   chunk_overlap=200,
-                                                   add_start_index=True)
+    # after uploading, split the document
     
     # Create document objects from the text content (to store the raw text)
     documents = text_splitter.create_documents([text_content])
     
-    print("Splitting the document into chunks...")
-    print(f"Splitting document into {len(documents)} chunks for indexing...")
+    log("Splitting the document into chunks...")
+    log(f"Splitting document into {len(documents)} chunks for indexing...")
     
-     # Get the vectorstore instance (not the retriever) to add documents
-    vectorstore = PineconeVectorStore(index_name=INDEX_NAME, embedding=embeddings)
+    # deterministic IDs, drop repeated chunks and the ones this document already owns
+    existing_ids = document_manifest.chunk_ids(key)
+    new_documents, seen_ids = [], set()
+    for doc in documents:
+        cid = chunk_id(key, doc.page_content)
+        if cid in seen_ids:
+            continue
+        seen_ids.add(cid)
+        if cid not in existing_ids:
+            doc.metadata.update(metadata, chunk_id=cid)
+            new_documents.append(doc)
+    
+     # Get the shared vectorstore instance (not the retriever) to add documents
+    vectorstore = get_vector_store()
     
     
     # Add documents to the vector store
-    vectorstore.add_documents(documents)
-    print(f"Successfully added {len(documents)} chunks to Pinecone index '{INDEX_NAME}'.")
-
+    if new_documents:
+        vectorstore.add_documents(new_documents, ids=[d.metadata["chunk_id"] for d in new_documents])
+        if HYBRID_SEARCH_ENABLED:
+            get_sparse_index().add([d.metadata["chunk_id"] for d in new_documents],
+                                   [d.page_content for d in new_documents], [d.metadata for d in new_documents])
+    stale_ids = existing_ids - seen_ids
+    if stale_ids:
+        vectorstore.delete(ids=list(stale_ids))
+    if HYBRID_SEARCH_ENABLED:
+        get_sparse_index().delete(stale_ids)
+        get_sparse_index().flush()
+    document_manifest.replace(key, None, seen_ids)
+    log(f"Successfully added {len(new_documents)} new chunks to the {VECTOR_BACKEND} index "
+          f"({len(seen_ids) - len(new_documents)} unchanged, {len(stale_ids)} deleted).")
@@ -0,0 +1,172 @@
+'''
+Web search result cache in front of Tavily.
+
+Keyed on (normalized query, max_results, topic). A cached result is :
+- fresh for `ttl_seconds`            : returned as is ("hit")
+- stale for `stale_seconds` after it : returned at once ("stale"), and one background search refreshes it
+- expired after that                 : searched again ("miss")
+
+Identical searches in flight at the same moment are coalesced : the first caller searches, the others
+wait for its result ("coalesced"), so a burst of users asking about the same breaking topic costs one
+Tavily call. An async search runs in a task of its own, so a caller cancelled meanwhile doesn't
+cancel it for the others. Sync and async callers share the same in-flight map (concurrent.futures.Future).
+Error results ("WEB_ERROR::...") are handed to the waiting callers but never cached.
+'''
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Tuple
+
+from config import WEB_CACHE_ENABLED, WEB_CACHE_TTL_SECONDS, WEB_CACHE_STALE_SECONDS, WEB_CACHE_MAX_ENTRIES
+from embedding_cache import normalize_text
+
+CacheKey = Tuple[str, int, str]
+
+
+def web_cache_key(query: str, max_results: int, topic: str) -> CacheKey:
+    return normalize_text(query).lower(), max_results, topic
+
+
+@dataclass
+class _Entry:
+    value: str
+    created_at: float
+
+
+class WebSearchCache:
+
+    def __init__(self, ttl_seconds: float = WEB_CACHE_TTL_SECONDS, stale_seconds: float = WEB_CACHE_STALE_SECONDS,
+                 max_entries: int = WEB_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[CacheKey, _Entry]" = OrderedDict()
+        self._inflight: Dict[CacheKey, Future] = {}
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="web-cache-refresh")
+        self._background = set() # strong references to the async refresh tasks
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "coalesced": 0, "searches": 0, "refreshes": 0}
+
+    @staticmethod
+    def _cacheable(value: str) -> bool:
+        return not value.startswith("WEB_ERROR::")
+
+    def _lookup(self, key: CacheKey) -> Tuple[str, object, bool]:
+        '''
+        Returns (outcome, value or in-flight future, start a refresh). Caller holds the lock.
+        outcome "miss" registers a new in-flight future the caller must resolve.
+        '''
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = now - entry.created_at
+            if age < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return "hit", entry.value, False
+            if age < self.ttl_seconds + self.stale_seconds:
+                self._entries.move_to_end(key)
+                self._stats["stale_hits"] += 1
+                refresh = key not in self._inflight
+                if refresh:
+                    self._inflight[key] = Future()
+                    self._stats["refreshes"] += 1
+                return "stale", entry.value, refresh
+            del self._entries[key]
+        future = self._inflight.get(key)
+        if future is not None:
+            self._stats["coalesced"] += 1
+            return "coalesced", future, False
+        self._inflight[key] = Future()
+        self._stats["misses"] += 1
+        return "miss", self._inflight[key], False
+
+    def _resolve(self, key: CacheKey, value: str = None, error: BaseException = None):
+        """Stores a finished search and wakes up the callers waiting for it."""
+        with self._lock:
+            future = self._inflight.pop(key, None)
+            self._stats["searches"] += 1
+            if error is None and self._cacheable(value):
+                self._entries[key] = _Entry(value, time.time())
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        if future is not None:
+            if error is None:
+                future.set_result(value)
+            else:
+                future.set_exception(error)
+
+    def _search(self, key: CacheKey, search: Callable[[], str]) -> str:
+        try:
+            value = search()
+        except BaseException as e:
+            self._resolve(key, error=e)
+            raise
+        self._resolve(key, value)
+        return value
+
+    async def _asearch(self, key: CacheKey, asearch: Callable[[], Awaitable[str]]) -> str:
+        try:
+            value = await asearch()
+        except BaseException as e: # the waiting callers must not hang
+            self._resolve(key, error=e)
+            raise
+        self._resolve(key, value)
+        return value
+
+    def get(self, key: CacheKey, search: Callable[[], str]) -> Tuple[str, str]:
+        """Returns (result, outcome) with outcome in hit / stale / coalesced / miss / disabled."""
+        if not WEB_CACHE_ENABLED:
+            return search(), "disabled"
+        with self._lock:
+            outcome, found, refresh = self._lookup(key)
+        if outcome == "miss":
+            return self._search(key, search), outcome
+        if outcome == "coalesced":
+            return found.result(), outcome
+        if refresh:
+            self._refresher.submit(self._search, key, search)
+        return found, outcome
+
+    async def aget(self, key: CacheKey, asearch: Callable[[], Awaitable[str]]) -> Tuple[str, str]:
+        """Async variant of get, the search and the wait for a coalesced search don't block the event loop."""
+        if not WEB_CACHE_ENABLED:
+            return await asearch(), "disabled"
+        with self._lock:
+            outcome, found, refresh = self._lookup(key)
+        if outcome == "miss":
+            # the search is a task of its own : cancelling this caller (an unused speculative prefetch)
+            # must not cancel it, nor hand a CancelledError to the callers coalesced on it
+            return await asyncio.shield(self._spawn(self._asearch(key, asearch))), outcome
+        if outcome == "coalesced":
+            return await asyncio.shield(asyncio.wrap_future(found)), outcome
+        if refresh:
+            self._spawn(self._asearch(key, asearch))
+        return found, outcome
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["stale_hits"] + stats["misses"] + stats["coalesced"]
+        stats["searches_avoided"] = lookups - stats["misses"]
+        stats["hit_rate"] = stats["searches_avoided"] / lookups if lookups else 0.0
+        return stats
+
+
+# process-wide cache used by web_search_tool
+web_cache = WebSearchCache()